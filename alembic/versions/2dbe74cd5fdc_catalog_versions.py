@@ -0,0 +1,54 @@
+"""catalog versions
+
+Revision ID: 2dbe74cd5fdc
+Revises: 3f6005a6ad64
+Create Date: 2026-10-18 15:03:47.115902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2dbe74cd5fdc'
+down_revision: Union[str, Sequence[str], None] = '3f6005a6ad64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalog_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO catalog_versions (name, version) VALUES ('activities', 0)")
+
+    # любое изменение activities увеличивает версию — кэши процессов сверяются с ней
+    op.execute(
+        """
+        CREATE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = TG_ARGV[0];
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER activities_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON activities
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version('activities')
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER activities_catalog_version ON activities')
+    op.execute('DROP FUNCTION bump_catalog_version()')
+    op.drop_table('catalog_versions')
@@ -0,0 +1,43 @@
+"""buildings latitude longitude
+
+Revision ID: 5c25be5d9e17
+Revises: 18428e5768fa
+Create Date: 2026-10-18 10:12:31.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c25be5d9e17'
+down_revision: Union[str, Sequence[str], None] = '18428e5768fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('buildings', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('buildings', sa.Column('longitude', sa.Float(), nullable=True))
+
+    # строки, которые не разбираются как "lat,lon", остаются с NULL
+    op.execute(
+        r"""
+        UPDATE buildings
+        SET latitude = split_part(latitude_longitude, ',', 1)::double precision,
+            longitude = split_part(latitude_longitude, ',', 2)::double precision
+        WHERE latitude_longitude ~ '^\s*-?[0-9]+(\.[0-9]+)?\s*,\s*-?[0-9]+(\.[0-9]+)?\s*$'
+        """
+    )
+
+    op.create_index('ix_buildings_latitude_longitude', 'buildings', ['latitude', 'longitude'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_latitude_longitude', table_name='buildings')
+    op.drop_column('buildings', 'longitude')
+    op.drop_column('buildings', 'latitude')
@@ -0,0 +1,31 @@
+"""organizations keyset indexes
+
+Revision ID: 7b1e9d4c2a60
+Revises: 2dbe74cd5fdc
+Create Date: 2026-10-18 16:21:09.348512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1e9d4c2a60'
+down_revision: Union[str, Sequence[str], None] = '2dbe74cd5fdc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ORDER BY name, id списков организаций и keyset-условие (name, id) > (:name, :id)
+    op.create_index('ix_organizations_name_id', 'organizations', ['name', 'id'], unique=False)
+    op.create_index('ix_organizations_buildings_id_name_id', 'organizations', ['buildings_id', 'name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_buildings_id_name_id', table_name='organizations')
+    op.drop_index('ix_organizations_name_id', table_name='organizations')
@@ -0,0 +1,42 @@
+"""lookup indexes
+
+Revision ID: 9c4d2e7f1b38
+Revises: 7b1e9d4c2a60
+Create Date: 2026-10-18 17:02:44.610278
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4d2e7f1b38'
+down_revision: Union[str, Sequence[str], None] = '7b1e9d4c2a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # организации -> виды деятельности (документ организации, выгрузка, ingest)
+    # и виды деятельности -> организации (org_by_activiys, org_by_activity_tree)
+    op.create_index('ix_organization_activities_organization_id_activity_id', 'organization_activities',
+                    ['organization_id', 'activity_id'], unique=False)
+    op.create_index('ix_organization_activities_activity_id_organization_id', 'organization_activities',
+                    ['activity_id', 'organization_id'], unique=False)
+    op.create_index('ix_organization_phones_organization_id', 'organization_phones', ['organization_id'], unique=False)
+    op.create_index('ix_activities_parent_id', 'activities', ['parent_id'], unique=False)
+    op.create_index('ix_activities_name', 'activities', ['name'], unique=False)
+    op.create_index('ix_buildings_address', 'buildings', ['address'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_address', table_name='buildings')
+    op.drop_index('ix_activities_name', table_name='activities')
+    op.drop_index('ix_activities_parent_id', table_name='activities')
+    op.drop_index('ix_organization_phones_organization_id', table_name='organization_phones')
+    op.drop_index('ix_organization_activities_activity_id_organization_id', table_name='organization_activities')
+    op.drop_index('ix_organization_activities_organization_id_activity_id', table_name='organization_activities')
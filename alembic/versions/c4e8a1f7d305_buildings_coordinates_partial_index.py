@@ -0,0 +1,36 @@
+"""buildings coordinates partial index
+
+Revision ID: c4e8a1f7d305
+Revises: b83f2d6a9c17
+Create Date: 2026-10-18 21:05:37.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f7d305'
+down_revision: Union[str, Sequence[str], None] = 'b83f2d6a9c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HAS_COORDINATES = sa.text('latitude IS NOT NULL AND longitude IS NOT NULL')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # bbox (geo_search_by_bbox) и сборка spatial index читают только здания с
+    # координатами: условие latitude BETWEEN ... влечёт IS NOT NULL, и
+    # планировщик берёт частичный индекс
+    op.drop_index('ix_buildings_latitude_longitude', table_name='buildings')
+    op.create_index('ix_buildings_latitude_longitude', 'buildings', ['latitude', 'longitude'], unique=False,
+                    postgresql_where=HAS_COORDINATES, sqlite_where=HAS_COORDINATES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_buildings_latitude_longitude', table_name='buildings')
+    op.create_index('ix_buildings_latitude_longitude', 'buildings', ['latitude', 'longitude'], unique=False)
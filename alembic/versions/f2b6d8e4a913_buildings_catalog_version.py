@@ -0,0 +1,37 @@
+"""buildings catalog version
+
+Revision ID: f2b6d8e4a913
+Revises: c4e8a1f7d305
+Create Date: 2026-10-18 21:48:03.551920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8e4a913'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a1f7d305'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # снимок spatial index помнит версию, с которой собран; воркеры сверяют её с БД
+    op.execute("INSERT INTO catalog_versions (name, version) VALUES ('buildings', 0)")
+    op.execute(
+        """
+        CREATE TRIGGER buildings_catalog_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON buildings
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version('buildings')
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER buildings_catalog_version ON buildings')
+    op.execute("DELETE FROM catalog_versions WHERE name = 'buildings'")
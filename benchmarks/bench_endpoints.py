@@ -0,0 +1,350 @@
+'''
+Нагрузочный бенчмарк ручек API на детерминированном наборе данных.
+
+Набор данных заданного масштаба загружается src/scripts/bulk_load.py с
+фиксированным --seed в БД из DATABASE_URL (Postgres; SQLite подходит как
+заглушка, но ручки на функциях Postgres в ней вернут ошибки). Затем каждая
+ручка router прогоняется при фиксированной конкуренции через ASGI-клиент
+внутри процесса и/или через uvicorn в отдельном процессе. Для каждой ручки
+считаются p50/p95/p99, пропускная способность и число SQL-запросов на
+запрос; результат печатается таблицей и пишется в JSON.
+
+С --baseline результат сравнивается с сохранённым JSON того же масштаба:
+рост p95 или падение пропускной способности больше --tolerance, как и
+лишние SQL-запросы, считаются регрессией, и скрипт завершается с кодом 1.
+
+    python benchmarks/bench_endpoints.py --scale 100k --output base.json
+    python benchmarks/bench_endpoints.py --scale 100k --no-seed --baseline base.json
+
+Кэш ответов по умолчанию выключен (RESPONSE_CACHE_TTL=0), иначе
+измеряется в основном он; --cache включает его.
+'''
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import httpx
+import numpy as np
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1M': 1_000_000,
+}
+
+PREFIX = '/v1/secunda'
+
+# сколько значений каждого вида берётся из БД для разнообразия запросов
+SAMPLE_SIZE = 200
+
+Request = Tuple[str, str, Dict]
+
+
+def sample_inputs() -> Dict[str, List]:
+    '''значения для параметров запросов; порядок по id, поэтому при том же --seed выборка та же'''
+    from sqlalchemy import select
+    from database import engine
+    from src.models.models import ActivitiesModels, BuildingsModel, OrganizationsModels
+
+    with engine.connect() as conn:
+        buildings = conn.execute(
+            select(BuildingsModel.id, BuildingsModel.address, BuildingsModel.latitude, BuildingsModel.longitude)
+            .order_by(BuildingsModel.id).limit(SAMPLE_SIZE)
+        ).all()
+        orgs = conn.execute(
+            select(OrganizationsModels.id, OrganizationsModels.name).order_by(OrganizationsModels.id).limit(SAMPLE_SIZE)
+        ).all()
+        roots = conn.execute(
+            select(ActivitiesModels.name).where(ActivitiesModels.parent_id.is_(None)).order_by(ActivitiesModels.id)
+        ).scalars().all()
+        children = conn.execute(
+            select(ActivitiesModels.name).where(ActivitiesModels.parent_id.is_not(None))
+            .order_by(ActivitiesModels.id).limit(SAMPLE_SIZE)
+        ).scalars().all()
+    engine.dispose()
+    if not buildings or not orgs or not roots:
+        raise SystemExit('БД пуста: запустите без --no-seed')
+    return {
+        'buildings': [(str(b.id), b.address, b.latitude, b.longitude) for b in buildings],
+        'org_ids': [str(o.id) for o in orgs],
+        'org_words': [o.name.split()[-1] for o in orgs],
+        'roots': list(roots),
+        'activities': list(children) or list(roots),
+    }
+
+
+def endpoints(inputs: Dict[str, List]) -> Dict[str, Callable[[random.Random], Request]]:
+    '''ручка -> генератор случайного запроса к ней'''
+    def building(rnd):
+        return rnd.choice(inputs['buildings'])
+
+    def bbox(rnd):
+        _, _, lat, lon = building(rnd)
+        return {'min_lat': lat - 0.005, 'max_lat': lat + 0.005, 'min_lon': lon - 0.01, 'max_lon': lon + 0.01}
+
+    return {
+        'GET /org_in_builds': lambda rnd: ('GET', '/org_in_builds', {'params': {'org_address': building(rnd)[1]}}),
+        'GET /org_by_activiys': lambda rnd: (
+            'GET', '/org_by_activiys', {'params': {'org_activities': rnd.choice(inputs['activities'])}}),
+        'GET /geo_search_by_center': lambda rnd: (
+            'GET', '/geo_search_by_center', {'params': {'building_id': building(rnd)[0], 'radius_m': 500}}),
+        'GET /geo_nearest': lambda rnd: ('GET', '/geo_nearest', {'params': {'building_id': building(rnd)[0], 'k': 10}}),
+        'GET /geo_search_by_bbox': lambda rnd: ('GET', '/geo_search_by_bbox', {'params': bbox(rnd)}),
+        'GET /organization/search': lambda rnd: (
+            'GET', '/organization/search', {'params': {'name': rnd.choice(inputs['org_words']), 'limit': 20}}),
+        'GET /organization/{organization_id}': lambda rnd: (
+            'GET', f"/organization/{rnd.choice(inputs['org_ids'])}", {}),
+        'POST /organization/batch': lambda rnd: (
+            'POST', '/organization/batch', {'json': {'ids': rnd.sample(inputs['org_ids'], min(50, len(inputs['org_ids'])))}}),
+        'GET /org_by_activity_tree': lambda rnd: (
+            'GET', '/org_by_activity_tree', {'params': {'activity_name': rnd.choice(inputs['roots']), 'limit': 100}}),
+        'GET /activity_tree': lambda rnd: (
+            'GET', '/activity_tree', {'params': {'parent_name': rnd.choice(inputs['roots'])}}),
+        'GET /export': lambda rnd: ('GET', '/export', {'params': {'building_id': building(rnd)[0]}}),
+    }
+
+
+async def run_load(client: httpx.AsyncClient, requests: List[Request], concurrency: int) -> Dict:
+    '''запросы из очереди выполняются concurrency воркерами; латентность — до последнего байта тела'''
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    queue = iter(requests)
+
+    async def worker():
+        for method, path, kwargs in queue:
+            started = time.perf_counter()
+            response = await client.request(method, PREFIX + path, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+async def bench(client: httpx.AsyncClient, plans: Dict[str, List[Request]], args) -> Dict[str, Dict]:
+    results = {}
+    for name, requests in plans.items():
+        if args.warmup:
+            await run_load(client, requests[:args.warmup], args.concurrency)
+        results[name] = await run_load(client, requests[args.warmup:], args.concurrency)
+    return results
+
+
+async def count_queries(app, plans: Dict[str, List[Request]], probes: int) -> Dict[str, float]:
+    '''SQL-запросов на запрос: первые probes запросов каждой ручки по одному, без конкуренции'''
+    from sqlalchemy import event
+    from database import async_engine
+
+    counter = {'queries': 0}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['queries'] += 1
+
+    counts = {}
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', on_execute)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench') as client:
+            for name, requests in plans.items():
+                counter['queries'] = 0
+                sample = requests[:probes]
+                for method, path, kwargs in sample:
+                    await (await client.request(method, PREFIX + path, **kwargs)).aread()
+                counts[name] = round(counter['queries'] / len(sample), 2)
+    finally:
+        event.remove(async_engine.sync_engine, 'before_cursor_execute', on_execute)
+    return counts
+
+
+async def bench_asgi(plans: Dict[str, List[Request]], args) -> Tuple[Dict[str, Dict], Dict[str, float]]:
+    from src.main import app
+
+    async with app.router.lifespan_context(app):
+        queries = await count_queries(app, plans, args.probes)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench', limits=limits) as client:
+            results = await bench(client, plans, args)
+    return results, queries
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def bench_uvicorn(plans: Dict[str, List[Request]], args) -> Dict[str, Dict]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'src.main:app', '--host', '127.0.0.1', '--port', str(port),
+         # auto: uvloop и httptools, если установлены
+         '--loop', 'auto', '--http', 'auto', '--log-level', 'warning', '--no-access-log'],
+        cwd=project_root,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            for _ in range(300):
+                if server.poll() is not None:
+                    raise SystemExit('uvicorn завершился при старте')
+                try:
+                    await client.get('/docs')
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit('uvicorn не поднялся за 30 с')
+            return await bench(client, plans, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    if baseline['meta']['organizations'] != current['meta']['organizations']:
+        raise SystemExit(
+            f"baseline снят на {baseline['meta']['organizations']} организаций, текущий прогон — на "
+            f"{current['meta']['organizations']}"
+        )
+    regressions = []
+    for mode, endpoints_results in current['results'].items():
+        for name, result in endpoints_results.items():
+            base = baseline['results'].get(mode, {}).get(name)
+            if base is None:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{mode} {name}: p95 {base['p95_ms']} -> {result['p95_ms']} мс")
+            if result['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{mode} {name}: rps {base['rps']} -> {result['rps']}")
+            if result['errors'] > base['errors']:
+                regressions.append(f"{mode} {name}: ошибок {base['errors']} -> {result['errors']}")
+    for name, count in current['queries_per_request'].items():
+        base = baseline.get('queries_per_request', {}).get(name)
+        if base is not None and count > base:
+            regressions.append(f'{name}: SQL-запросов на запрос {base} -> {count}')
+    return regressions
+
+
+def print_table(report: Dict) -> None:
+    queries = report['queries_per_request']
+    for mode, results in report['results'].items():
+        print(f"\n{mode}, конкуренция {report['meta']['concurrency']}")
+        print(f"{'ручка':36} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>8} {'sql':>6} {'err':>5}")
+        for name, r in results.items():
+            print(f"{name:36} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['rps']:>8} "
+                  f"{queries.get(name, '-'):>6} {r['errors']:>5}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='10k', help='число организаций в наборе данных')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-seed', action='store_true', help='не перезагружать набор данных')
+    parser.add_argument('--mode', choices=['asgi', 'uvicorn', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='замеряемых запросов на ручку')
+    parser.add_argument('--warmup', type=int, default=50, help='запросов на ручку до замера')
+    parser.add_argument('--probes', type=int, default=20, help='запросов на ручку для подсчёта SQL')
+    parser.add_argument('--endpoint', action='append', help='только эти ручки (можно несколько раз)')
+    parser.add_argument('--cache', action='store_true', help='не выключать кэш ответов')
+    parser.add_argument('--output', help='куда записать JSON с результатом')
+    parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='допустимое ухудшение p95/rps, доля')
+    args = parser.parse_args(argv)
+    if min(args.concurrency, args.requests, args.probes) < 1 or args.warmup < 0:
+        parser.error('--concurrency, --requests, --probes должны быть >= 1, --warmup >= 0')
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    organizations = SCALES[args.scale]
+
+    # до импорта приложения: config читает переменные окружения при импорте,
+    # а uvicorn наследует их
+    if not args.cache:
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+
+    if not args.no_seed:
+        subprocess.run(
+            [sys.executable, os.path.join(project_root, 'src', 'scripts', 'bulk_load.py'),
+             '--organizations', str(organizations), '--seed', str(args.seed), '--truncate'],
+            check=True,
+        )
+
+    inputs = sample_inputs()
+    rnd = random.Random(args.seed)
+    generators = endpoints(inputs)
+    if args.endpoint:
+        unknown = set(args.endpoint) - generators.keys()
+        if unknown:
+            raise SystemExit(f"неизвестные ручки: {', '.join(sorted(unknown))}")
+        generators = {name: generators[name] for name in args.endpoint}
+    plans = {
+        name: [make(rnd) for _ in range(args.warmup + args.requests)]
+        for name, make in generators.items()
+    }
+
+    from database import engine
+    report = {
+        'meta': {
+            'scale': args.scale,
+            'organizations': organizations,
+            'seed': args.seed,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'cache': args.cache,
+            'dialect': engine.dialect.name,
+            'python': platform.python_version(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+        'queries_per_request': {},
+    }
+    if args.mode in ('asgi', 'both'):
+        report['results']['asgi'], report['queries_per_request'] = asyncio.run(bench_asgi(plans, args))
+    if args.mode in ('uvicorn', 'both'):
+        report['results']['uvicorn'] = asyncio.run(bench_uvicorn(plans, args))
+
+    print_table(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('\nрегрессии относительно', args.baseline)
+            print('\n'.join(f'  {line}' for line in regressions))
+            return 1
+        print('\nрегрессий относительно', args.baseline, 'нет')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+'''
+Микробенчмарк сериализации больших ответов /geo_search_by_center и
+/org_by_activity_tree: прежний путь (str() для UUID в обработчике,
+jsonable_encoder, json из JSONResponse) против текущего (модель ответа,
+pydantic-core, orjson). БД не нужна — данные синтетические.
+
+    python benchmarks/bench_serialization.py --buildings 5000 --orgs 20000
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from src.api.schemas import ActivityTreeSearchResponse, GeoSearchByCenterResponse
+
+
+def geo_rows(n_buildings: int, orgs_per_building: int, rnd: random.Random):
+    return [
+        (
+            uuid.UUID(int=rnd.getrandbits(128)), f'г. Москва, ул. Тестовая, {i}',
+            55.75 + rnd.uniform(-0.1, 0.1), 37.62 + rnd.uniform(-0.1, 0.1), rnd.uniform(0, 10000),
+            [(uuid.UUID(int=rnd.getrandbits(128)), f'ООО Организация {i}-{j}') for j in range(orgs_per_building)],
+        )
+        for i in range(n_buildings)
+    ]
+
+
+def tree_rows(n_orgs: int, rnd: random.Random):
+    return [
+        (uuid.UUID(int=rnd.getrandbits(128)), f'ООО Организация {i}', f'г. Москва, ул. Тестовая, {i}',
+         ['Еда', 'Мясная продукция', 'Молочная продукция'][: rnd.randint(1, 3)])
+        for i in range(n_orgs)
+    ]
+
+
+def geo_payload(rows, as_str: bool):
+    conv = str if as_str else (lambda v: v)
+    center = rows[0]
+    return {
+        'center': {'building_id': conv(center[0]), 'address': center[1], 'latitude': center[2], 'longitude': center[3]},
+        'radius_m': 10000.0,
+        'count': len(rows),
+        'results': [
+            {
+                'building_id': conv(b_id), 'address': address, 'latitude': lat, 'longitude': lon,
+                'distance_m': round(dist, 2),
+                'organizations': [{'org_id': conv(o_id), 'org_name': o_name} for o_id, o_name in orgs],
+            }
+            for b_id, address, lat, lon, dist, orgs in rows
+        ],
+    }
+
+
+def tree_payload(rows, as_str: bool):
+    conv = str if as_str else (lambda v: v)
+    return {
+        'search_activity': 'Еда',
+        'count': len(rows),
+        'next_cursor': None,
+        'organizations': [
+            {'id': conv(o_id), 'name': name, 'address': address, 'activities': activities}
+            for o_id, name, address, activities in rows
+        ],
+    }
+
+
+def before(build, rows):
+    return JSONResponse(content=jsonable_encoder(build(rows, True))).body
+
+
+def after(build, rows, adapter: TypeAdapter):
+    return ORJSONResponse(content=adapter.dump_python(adapter.validate_python(build(rows, False)), mode='json')).body
+
+
+def bench(name: str, build, rows, model, repeat: int) -> None:
+    adapter = TypeAdapter(model)
+    old, new = before(build, rows), after(build, rows, adapter)
+    assert json.loads(old) == json.loads(new), f'{name}: ответы различаются'
+    t_old = min(timeit.repeat(lambda: before(build, rows), number=1, repeat=repeat))
+    t_new = min(timeit.repeat(lambda: after(build, rows, adapter), number=1, repeat=repeat))
+    print(f'{name:<24} {len(new) / 1024:>9.0f} KiB  before {t_old * 1000:>8.1f} ms  '
+          f'after {t_new * 1000:>8.1f} ms  x{t_old / t_new:.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buildings', type=int, default=5000, help='зданий в ответе geo_search_by_center')
+    parser.add_argument('--orgs-per-building', type=int, default=3)
+    parser.add_argument('--orgs', type=int, default=20000, help='организаций в ответе org_by_activity_tree')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    bench('geo_search_by_center', geo_payload, geo_rows(args.buildings, args.orgs_per_building, rnd),
+          GeoSearchByCenterResponse, args.repeat)
+    bench('org_by_activity_tree', tree_payload, tree_rows(args.orgs, rnd),
+          ActivityTreeSearchResponse, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
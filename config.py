@@ -1,5 +1,66 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
 DB_HOST='localhost'
 DB_PORT=5432
 DB_NAME='secunda_db'
 DB_USER='postgres'
-DB_PASS='postgres'
\ No newline at end of file
+DB_PASS='postgres'
+
+def env_bool(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+# пул соединений
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+# statement_timeout для запросов API, мс; 0 — без ограничения
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+
+# токен для /admin/*; пустой — админские ручки закрыты
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# как часто (с) кэш справочника видов деятельности сверяет версию с БД
+ACTIVITY_CATALOG_CHECK_INTERVAL = float(os.environ.get('ACTIVITY_CATALOG_CHECK_INTERVAL', 5))
+
+# кэш ответов GET-ручек
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+
+# размер пачки server-side курсора выгрузки /export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+# журнал медленных запросов: порог, мс (0 — выключен), размер кольцевого буфера,
+# скрывать ли значения параметров и доля записей, для которых снимается EXPLAIN ANALYZE
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 200))
+SLOW_QUERY_REDACT_PARAMS = env_bool('SLOW_QUERY_REDACT_PARAMS', True)
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.environ.get('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000))
+
+# профилирование запросов: токен для заголовка X-Profile-Token (пустой — выключено;
+# отдельный от ADMIN_TOKEN), шаг сэмплера стеков, мс, и сколько профилей хранить
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 1))
+PROFILE_STORE_SIZE = int(os.environ.get('PROFILE_STORE_SIZE', 20))
+
+# каталог снимка spatial index и справочника видов деятельности (run_prod.py);
+# пустой — процесс строит их из БД при старте
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', '')
+# число процессов uvicorn в run_prod.py
+WORKERS = int(os.environ.get('WORKERS', os.cpu_count() or 1))
+# API запущен несколькими процессами (run_prod.py --workers N > 1): админские
+# ручки с состоянием одного процесса выключены, метрики собираются в METRICS_DIR
+MULTI_WORKER = env_bool('MULTI_WORKER', False)
+# рассылка сброса кэша и изменений зданий другим процессам API через
+# LISTEN/NOTIFY Postgres; нужна при нескольких воркерах или экземплярах
+BROADCAST_EVENTS = env_bool('BROADCAST_EVENTS', MULTI_WORKER)
+# каталог, куда процессы API пишут свои метрики для общего /metrics;
+# пустой — /metrics отдаёт метрики только своего процесса
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+# как часто (с) процесс обновляет свой файл метрик в METRICS_DIR
+METRICS_WRITE_INTERVAL = float(os.environ.get('METRICS_WRITE_INTERVAL', 5))
@@ -1,26 +1,97 @@
 from sqlalchemy import MetaData, create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 import os
+import threading
 from dotenv import load_dotenv
 
+from config import (
+    DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS,
+)
+from pool_stats import instrument_engine, pool_stats, timed_pool_class
+from query_stats import instrument_queries
+from slow_query_log import slow_query_log
+
 load_dotenv()
 
+# асинхронные драйверы, подставляемые в DATABASE_URL, если ASYNC_DATABASE_URL не задан
+ASYNC_DRIVERS = {
+    'postgresql': 'asyncpg',
+    'sqlite': 'aiosqlite',
+}
+
+def to_async_url(url: str) -> str:
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Нет асинхронного драйвера для {url.get_backend_name()}")
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+def pool_options(url: str, pool_class: type, stats_name: str, statement_timeout_ms: int = 0) -> dict:
+    '''Параметры create_engine: размер пула, pre-ping, recycle и statement_timeout из config.'''
+    url = make_url(url)
+    options = {
+        'poolclass': timed_pool_class(pool_class, pool_stats[stats_name]),
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if statement_timeout_ms and url.get_backend_name() == 'postgresql':
+        if url.get_driver_name() == 'asyncpg':
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout_ms)}}
+        else:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+# синхронный путь: alembic и скрипты наполнения БД
 DATABASE_URL = os.environ.get("DATABASE_URL")
+# асинхронный путь: обработчики API
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
 metadata = MetaData()
 
 Base: DeclarativeMeta = declarative_base(metadata=metadata)
 
-engine = create_engine(DATABASE_URL)
-session_maker = sessionmaker(engine, expire_on_commit=False)
+_SYNC_NAMES = ('engine', 'session_maker', 'SessionLocal')
+_sync_lock = threading.Lock()
+
+def __getattr__(name: str):
+    '''
+    Синхронный движок (engine, session_maker, SessionLocal) создаётся при
+    первом обращении: его берут alembic, скрипты и сборка снимка, а процессы
+    API работают через async_engine и синхронного пула не открывают.
+    '''
+    if name not in _SYNC_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global engine, session_maker, SessionLocal
+    with _sync_lock:
+        if 'engine' not in globals():
+            sync_engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, QueuePool, 'sync'))
+            instrument_engine(sync_engine, pool_stats['sync'])
+            session_maker = sessionmaker(sync_engine, autoflush=False, expire_on_commit=False)
+            SessionLocal = session_maker
+            engine = sync_engine
+    return globals()[name]
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool, 'async', DB_STATEMENT_TIMEOUT_MS),
+)
+instrument_engine(async_engine.sync_engine, pool_stats['async'])
+# число запросов, строки и время БД — на HTTP-запрос, в котором они выполнены
+instrument_queries(async_engine.sync_engine)
+slow_query_log.instrument(async_engine)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with async_session_maker() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
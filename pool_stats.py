@@ -0,0 +1,132 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import Engine
+
+# границы корзин гистограммы ожидания соединения, мс
+WAIT_BUCKETS_MS: Tuple[float, ...] = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolStats:
+    '''Счётчики одного пула соединений и гистограмма времени ожидания checkout.'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.wait_count = 0
+        self.wait_sum_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe_wait(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum_ms += ms
+            self.wait_buckets[bisect_left(WAIT_BUCKETS_MS, ms)] += 1
+
+    def snapshot(self) -> Dict:
+        pool = self.engine.pool if self.engine is not None else None
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(WAIT_BUCKETS_MS + (float('inf'),), self.wait_buckets):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+            data = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'timeouts': self.timeouts,
+                'invalidations': self.invalidations,
+                'wait_ms': {'count': self.wait_count, 'sum': round(self.wait_sum_ms, 3), 'buckets': buckets},
+            }
+        if pool is not None and hasattr(pool, 'checkedout'):
+            data.update({
+                'pool_class': type(pool).__name__,
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+            })
+        return data
+
+
+# время открытия новых соединений внутри текущего _do_get; контекстная
+# переменная, а не поле пула: в асинхронном пуле соединение открывается с
+# переключением на event loop, и параллельно идут _do_get других задач
+_connect_seconds: ContextVar[Optional[List[float]]] = ContextVar('pool_connect_seconds', default=None)
+
+
+class _TimedPoolMixin:
+    '''
+    Замеряет в _do_get пула время ожидания свободного соединения. Открытие
+    нового соединения (_create_connection) из него вычитается: это не ожидание.
+    '''
+
+    stats: PoolStats
+
+    def _do_get(self):
+        if _connect_seconds.get() is not None:
+            # QueuePool повторно вызывает _do_get из себя: замер уже идёт
+            return super()._do_get()
+        opened = [0.0]
+        token = _connect_seconds.set(opened)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            with self.stats._lock:
+                self.stats.timeouts += 1
+            raise
+        finally:
+            _connect_seconds.reset(token)
+            self.stats.observe_wait(max(time.perf_counter() - start - opened[0], 0.0))
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            opened = _connect_seconds.get()
+            if opened is not None:
+                opened[0] += time.perf_counter() - start
+
+
+def timed_pool_class(base: type, stats: PoolStats) -> type:
+    # отдельный подкласс на каждый пул: Pool.recreate() создаёт пул через self.__class__,
+    # так что статистика переживает dispose()
+    return type(f'Timed{base.__name__}', (_TimedPoolMixin, base), {'stats': stats})
+
+
+def instrument_engine(engine: Engine, stats: PoolStats) -> None:
+    stats.engine = engine
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with stats._lock:
+            stats.checkouts += 1
+
+    @event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        with stats._lock:
+            stats.checkins += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        with stats._lock:
+            stats.invalidations += 1
+
+
+pool_stats: Dict[str, PoolStats] = {
+    'async': PoolStats('async'),
+    'sync': PoolStats('sync'),
+}
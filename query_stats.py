@@ -0,0 +1,79 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestQueryStats:
+    '''Запросы к БД одного HTTP-запроса: число, строки и суммарное время.'''
+
+    __slots__ = ('scope', 'queries', 'rows', 'db_seconds')
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+
+    def route(self) -> Optional[str]:
+        '''шаблон маршрута; роутер FastAPI кладёт его в scope, когда запрос сопоставлен'''
+        route = self.scope.get('route') if self.scope is not None else None
+        return route.path if route is not None else None
+
+
+class QueryTotals:
+    '''Счётчики всех запросов движка, включая выполненные вне HTTP-запросов.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+
+    def add(self, rows: int, seconds: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.rows += rows
+            self.db_seconds += seconds
+
+
+# статистика текущего HTTP-запроса; выставляет MetricsMiddleware.
+# Объект изменяемый, поэтому запросы из задач, созданных обработчиком
+# (копия контекста, например single-flight), попадают в тот же запрос.
+current_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar('current_request_stats', default=None)
+
+query_totals = QueryTotals()
+
+_START_KEY = 'query_stats_start'
+
+
+def instrument_queries(engine: Engine) -> None:
+    '''время и число строк каждого запроса — в query_totals и статистику текущего HTTP-запроса'''
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+    def _record(conn, rows: int) -> None:
+        elapsed = time.perf_counter() - conn.info[_START_KEY].pop()
+        query_totals.add(rows, elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.rows += rows
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        # для SELECT драйверы возвращают число строк уже выбранного результата или -1
+        _record(conn, max(cursor.rowcount, 0))
+
+    @event.listens_for(engine, 'handle_error')
+    def _on_error(exception_context):
+        # after_cursor_execute при ошибке не вызывается; упавший запрос тоже считается
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None and conn.info.get(_START_KEY):
+            _record(conn, 0)
@@ -0,0 +1,91 @@
+'''
+Запуск API в продакшене: несколько процессов uvicorn на uvloop и httptools.
+
+До запуска воркеров из БД один раз собирается снимок spatial index и
+справочника видов деятельности (src/api/snapshot.py). Воркеры отображают
+его массивы в память только для чтения, поэтому память на здания не растёт
+с числом воркеров, а перезапущенный воркер не читает их из БД заново.
+
+    python run_prod.py --workers 4 --host 0.0.0.0 --port 8000
+
+Снимок помнит версии зданий и справочника из catalog_versions. Воркер,
+загрузивший снимок (в том числе перезапущенный uvicorn после падения),
+сверяет версию зданий с БД и при расхождении перестраивает свой индекс.
+
+При --workers больше 1 процессы согласуются так:
+  - сброс кэша ответов и изменения зданий, записанные одним воркером,
+    рассылаются остальным через LISTEN/NOTIFY Postgres (src/api/broadcast.py);
+  - каждый воркер пишет свои метрики в --metrics-dir, /metrics отдаёт их сумму;
+  - админские ручки с состоянием одного процесса (пулы, кэш, single-flight,
+    медленные запросы, профили) отвечают 409: запрос к ним попал бы в
+    случайный воркер. Медленные запросы и их планы остаются в логе.
+'''
+import argparse
+import os
+import shutil
+
+import uvicorn
+
+from config import METRICS_DIR, SNAPSHOT_DIR, WORKERS
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR or os.path.join(project_root, 'var', 'snapshot'))
+    parser.add_argument('--metrics-dir', default=METRICS_DIR or os.path.join(project_root, 'var', 'metrics'),
+                        help='каталог метрик воркеров для общего /metrics (при --workers > 1)')
+    parser.add_argument('--reuse-snapshot', action='store_true',
+                        help='не пересобирать снимок, если он есть и его версии совпадают с БД')
+    parser.add_argument('--loop', default='uvloop')
+    parser.add_argument('--http', default='httptools')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers должен быть >= 1')
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    # воркеры запускаются через spawn и читают каталог снимка из окружения
+    os.environ['SNAPSHOT_DIR'] = os.path.abspath(args.snapshot_dir)
+    if args.workers > 1:
+        os.environ['MULTI_WORKER'] = 'true'
+        # метрики прошлого запуска не должны попасть в суммы
+        metrics_dir = os.path.abspath(args.metrics_dir)
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+        os.environ['METRICS_DIR'] = metrics_dir
+
+    from database import engine
+    from src.api.snapshot import build_snapshot, read_meta, snapshot_is_current
+
+    meta = read_meta(args.snapshot_dir) if args.reuse_snapshot else None
+    if meta is not None and not snapshot_is_current(meta):
+        print(f'снимок {args.snapshot_dir} старше БД, собирается заново')
+        meta = None
+    if meta is None:
+        meta = build_snapshot(args.snapshot_dir)
+    engine.dispose()
+    print(f"снимок {args.snapshot_dir} от {meta['created_at']}: {meta['buildings']} зданий, "
+          f"{meta['activities']} видов деятельности")
+
+    uvicorn.run(
+        'src.main:app',
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        log_level=args.log_level,
+        proxy_headers=True,
+    )
+
+
+if __name__ == '__main__':
+    main()
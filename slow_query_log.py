@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import (
+    MULTI_WORKER, SLOW_QUERY_EXPLAIN_RATE, SLOW_QUERY_EXPLAIN_TIMEOUT_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_MS,
+    SLOW_QUERY_REDACT_PARAMS,
+)
+from query_stats import current_request_stats
+
+logger = logging.getLogger(__name__)
+
+# execution option собственных запросов журнала (EXPLAIN): они в журнал не попадают
+SKIP_OPTION = 'skip_slow_query_log'
+
+_START_KEY = 'slow_query_log_start'
+_SETTINGS_KEY = 'slow_query_log_settings'
+
+_SET_CONFIG_PREFIX = 'SELECT set_config('
+
+# EXPLAIN ANALYZE выполняет запрос, поэтому он снимается только для простых
+# SELECT. WITH может содержать INSERT/UPDATE/DELETE: даже в откатываемой
+# транзакции они возьмут блокировки, сдвинут последовательности и вызовут
+# триггеры. Для WITH и остальных — план без выполнения.
+_ANALYZE_PREFIX = 'SELECT'
+
+
+def analyzable(statement: str) -> bool:
+    '''можно ли снять EXPLAIN ANALYZE, то есть выполнить запрос'''
+    return statement.lstrip().upper().startswith(_ANALYZE_PREFIX)
+
+
+def _describe(value: Any) -> Any:
+    '''значение параметра для журнала: длинные строки и массивы (unnest) обрезаются'''
+    if isinstance(value, (list, tuple)):
+        head = [_describe(item) for item in value[:5]]
+        return head + [f'... ещё {len(value) - 5}'] if len(value) > 5 else head
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= 200 else text[:200] + '...'
+
+
+def _redact(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return f'<{type(value).__name__}[{len(value)}]>'
+    return f'<{type(value).__name__}>'
+
+
+class SlowQueryLog:
+    '''
+    Журнал запросов дольше threshold_ms: кольцевой буфер последних size записей
+    с текстом запроса, параметрами (или только их типами при redact), маршрутом
+    HTTP-запроса и планом. Для доли explain_rate записей план снимается
+    EXPLAIN (ANALYZE, BUFFERS) в отдельной задаче на отдельном соединении,
+    не больше одного одновременно, и дописывается в запись, когда готов.
+
+    Настройки, которые обработчик выставил на время транзакции через
+    set_config(..., true) (например, pg_trgm.word_similarity_threshold
+    поиска), запоминаются до её конца, попадают в запись (settings) и
+    выставляются так же перед EXPLAIN, иначе план снимался бы с другими.
+
+    log_plans — планы пишутся и в лог: при нескольких воркерах журнал
+    процесса через /admin недоступен, и лог остаётся единственным местом.
+    '''
+
+    def __init__(self, threshold_ms: float, size: int, redact: bool, explain_rate: float, explain_timeout_ms: int,
+                 log_plans: bool = False):
+        self.threshold_ms = threshold_ms
+        self.log_plans = log_plans
+        self.redact = redact
+        self.explain_rate = explain_rate
+        self.explain_timeout_ms = explain_timeout_ms
+        self.entries: Deque[Dict] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._engine: Optional[AsyncEngine] = None
+        self._explain_task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.explained = 0
+        self.explain_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def instrument(self, engine: AsyncEngine) -> None:
+        if not self.enabled:
+            return
+        self._engine = engine
+
+        @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if context is None or not context.execution_options.get(SKIP_OPTION):
+                conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+                if statement.startswith(_SET_CONFIG_PREFIX) and not executemany:
+                    self._remember_setting(conn, parameters)
+
+        @event.listens_for(engine.sync_engine, 'commit')
+        @event.listens_for(engine.sync_engine, 'rollback')
+        def _end_transaction(conn):
+            conn.info.pop(_SETTINGS_KEY, None)
+
+        @event.listens_for(engine.sync_engine, 'checkin')
+        def _on_checkin(dbapi_connection, connection_record):
+            # info живёт с соединением пула; транзакция могла закончиться сбросом пула
+            connection_record.info.pop(_SETTINGS_KEY, None)
+
+        @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            if context is None or not context.execution_options.get(SKIP_OPTION):
+                self._finish(conn, statement, parameters, executemany)
+
+        @event.listens_for(engine.sync_engine, 'handle_error')
+        def _on_error(exception_context):
+            # в том числе запросы, прерванные statement_timeout
+            conn = exception_context.connection
+            context = exception_context.execution_context
+            if conn is None or context is None or not conn.info.get(_START_KEY):
+                return
+            if not context.execution_options.get(SKIP_OPTION):
+                self._finish(
+                    conn, exception_context.statement, exception_context.parameters, context.executemany,
+                    error=str(exception_context.original_exception).splitlines()[0],
+                )
+
+    @staticmethod
+    def _remember_setting(conn, parameters) -> None:
+        '''set_config(name, value, is_local) с is_local = true действует до конца транзакции'''
+        values = list(parameters.values()) if isinstance(parameters, dict) else list(parameters or ())
+        if len(values) == 3 and values[2] is True:
+            conn.info.setdefault(_SETTINGS_KEY, {})[str(values[0])] = str(values[1])
+
+    def _finish(self, conn, statement: str, parameters, executemany: bool, error: Optional[str] = None) -> None:
+        elapsed_ms = (time.perf_counter() - conn.info[_START_KEY].pop()) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+        settings = dict(conn.info.get(_SETTINGS_KEY, {}))
+        entry = self.record(statement, parameters, elapsed_ms, executemany, error, settings)
+        if error is None and not executemany and random.random() < self.explain_rate:
+            self._schedule_explain(entry, statement, parameters, settings)
+
+    def _parameters(self, parameters, executemany: bool) -> Any:
+        if executemany:
+            return f'<executemany: {len(parameters)} наборов>'
+        convert = _redact if self.redact else _describe
+        if isinstance(parameters, dict):
+            return {key: convert(value) for key, value in parameters.items()}
+        return [convert(value) for value in parameters or ()]
+
+    def record(self, statement: str, parameters, elapsed_ms: float, executemany: bool = False,
+               error: Optional[str] = None, settings: Optional[Dict[str, str]] = None) -> Dict:
+        stats = current_request_stats.get()
+        route = stats.route() if stats is not None else None
+        entry = {
+            'id': next(self._ids),
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'duration_ms': round(elapsed_ms, 2),
+            'route': route,
+            'statement': statement,
+            'parameters': self._parameters(parameters, executemany),
+            'settings': settings or {},
+            'error': error,
+            'plan_status': None,
+            'plan': None,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self.recorded += 1
+        logger.warning(
+            'медленный запрос %.1f мс, %s: %s', elapsed_ms, route or '-', ' '.join(statement.split())[:500],
+        )
+        return entry
+
+    def _schedule_explain(self, entry: Dict, statement: str, parameters, settings: Dict[str, str]) -> None:
+        if self._engine is None or self._engine.dialect.name != 'postgresql':
+            return
+        if self._explain_task is not None and not self._explain_task.done():
+            entry['plan_status'] = 'skipped: уже снимается другой план'
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        entry['plan_status'] = 'pending'
+        self._explain_task = loop.create_task(self._explain(entry, statement, parameters, settings))
+
+    async def _explain(self, entry: Dict, statement: str, parameters, settings: Dict[str, str]) -> None:
+        # задача унаследовала контекст HTTP-запроса: EXPLAIN не должен считаться его запросом
+        current_request_stats.set(None)
+        analyze = analyzable(statement)
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+        try:
+            async with self._engine.connect() as conn:
+                conn = await conn.execution_options(**{SKIP_OPTION: True})
+                async with conn.begin() as transaction:
+                    for name, value in settings.items():
+                        await conn.execute(select(func.set_config(name, value, True)))
+                    await conn.execute(select(func.set_config('statement_timeout', str(self.explain_timeout_ms), True)))
+                    raw = (await conn.exec_driver_sql(f'EXPLAIN ({options}) {statement}', parameters)).scalar()
+                    await transaction.rollback()
+            entry['plan'] = json.loads(raw) if isinstance(raw, str) else raw
+            entry['plan_status'] = 'analyzed' if analyze else 'estimated'
+            self.explained += 1
+            if self.log_plans:
+                logger.warning('план медленного запроса #%d (%s): %s', entry['id'], entry['plan_status'],
+                               json.dumps(entry['plan'], ensure_ascii=False))
+        except Exception as er:
+            entry['plan_status'] = f'error: {er}'.splitlines()[0]
+            self.explain_errors += 1
+
+    def snapshot(self, limit: int) -> Dict:
+        with self._lock:
+            entries = [dict(entry) for entry in itertools.islice(reversed(self.entries), limit)]
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'redact_parameters': self.redact,
+            'explain_rate': self.explain_rate,
+            'recorded': self.recorded,
+            'explained': self.explained,
+            'explain_errors': self.explain_errors,
+            'entries': entries,
+        }
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self.entries)
+            self.entries.clear()
+        return count
+
+
+slow_query_log = SlowQueryLog(
+    SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_REDACT_PARAMS, SLOW_QUERY_EXPLAIN_RATE,
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS, log_plans=MULTI_WORKER,
+)
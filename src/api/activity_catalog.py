@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from config import ACTIVITY_CATALOG_CHECK_INTERVAL
+from src.api.cache import response_cache
+from src.models.models import ActivitiesClosureModels, ActivitiesModels, CatalogVersionsModels
+
+logger = logging.getLogger(__name__)
+
+
+class Activity(NamedTuple):
+    id: uuid.UUID
+    name: str
+    parent_id: Optional[uuid.UUID]
+
+
+class _Snapshot:
+    '''Неизменяемый срез справочника; подменяется целиком при перезагрузке.'''
+
+    def __init__(self, rows: Iterable[Activity], version: Optional[int]):
+        self.version = version
+        self.by_id: Dict[uuid.UUID, Activity] = {}
+        self.ids_by_name: Dict[str, List[uuid.UUID]] = {}
+        self.children: Dict[Optional[uuid.UUID], List[uuid.UUID]] = {}
+
+        for row in sorted(rows, key=lambda r: r.name):
+            self.by_id[row.id] = row
+            self.ids_by_name.setdefault(row.name, []).append(row.id)
+        for row in self.by_id.values():
+            # потомки вершины без существующего родителя считаются отдельными поддеревьями
+            parent = row.parent_id if row.parent_id in self.by_id else None
+            self.children.setdefault(parent, []).append(row.id)
+
+        self.roots = self.children.get(None, [])
+        self.root_by_name: Dict[str, uuid.UUID] = {}
+        for root_id in self.roots:
+            if self.by_id[root_id].parent_id is None:
+                self.root_by_name.setdefault(self.by_id[root_id].name, root_id)
+
+        self.descendants: Dict[uuid.UUID, FrozenSet[uuid.UUID]] = {}
+        for root_id in self.roots:
+            self._collect(root_id)
+
+    def _collect(self, root_id: uuid.UUID) -> None:
+        # обход в обратном порядке без рекурсии: потомки готовы раньше предка
+        order = []
+        stack = [root_id]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.children.get(node, ()))
+        for node in reversed(order):
+            ids = {node}
+            for child in self.children.get(node, ()):
+                ids |= self.descendants[child]
+            self.descendants[node] = frozenset(ids)
+
+
+class ActivityCatalog:
+    '''
+    Справочник видов деятельности в памяти процесса: имя -> id, родитель ->
+    дети и заранее посчитанные множества потомков.
+
+    Свежесть проверяется по catalog_versions.version (в Postgres его
+    увеличивает триггер на activities) не чаще раза в check_interval секунд;
+    запись activities через ORM в этом процессе помечает справочник
+    устаревшим сразу.
+    '''
+
+    def __init__(self, check_interval: float = ACTIVITY_CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.generation = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def load(self, rows: Iterable[Activity], version: Optional[int] = None) -> None:
+        previous = self._snapshot
+        self._snapshot = _Snapshot(rows, version)
+        self.generation += 1
+        if previous is not None:
+            # справочник поменялся — закэшированные ответы могли устареть. Только
+            # в этом процессе: остальные сами сверяют версию справочника с БД
+            response_cache.invalidate(propagate=False)
+        self._stale = False
+        self._checked_at = time.monotonic()
+
+    async def _db_version(self, session: AsyncSession) -> Optional[int]:
+        return (await session.execute(
+            select(CatalogVersionsModels.version).where(CatalogVersionsModels.name == 'activities')
+        )).scalar_one_or_none()
+
+    async def refresh(self, session: AsyncSession) -> None:
+        '''Перечитывает справочник из БД.'''
+        version = await self._db_version(session)
+        rows = (await session.execute(
+            select(ActivitiesModels.id, ActivitiesModels.name, ActivitiesModels.parent_id)
+        )).all()
+        self.load((Activity(*row) for row in rows), version)
+        logger.info('activity catalog: загружено %d видов деятельности, версия %s', len(rows), version)
+
+    async def ensure_fresh(self, session: AsyncSession) -> None:
+        '''Перезагружает справочник, если он устарел; в остальное время не ходит в БД.'''
+        if not self._stale and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        async with self._lock:
+            if not self._stale and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            if not self._stale and self._snapshot is not None:
+                version = await self._db_version(session)
+                if version == self._snapshot.version:
+                    self._checked_at = time.monotonic()
+                    return
+            await self.refresh(session)
+
+    def roots(self) -> List[Activity]:
+        snapshot = self._snapshot
+        return [snapshot.by_id[i] for i in snapshot.roots if snapshot.by_id[i].parent_id is None]
+
+    def root_id(self, name: str) -> Optional[uuid.UUID]:
+        return self._snapshot.root_by_name.get(name)
+
+    def ids_by_name(self, name: str) -> List[uuid.UUID]:
+        return self._snapshot.ids_by_name.get(name, [])
+
+    def descendants(self, activity_id: uuid.UUID) -> FrozenSet[uuid.UUID]:
+        '''id вершины и всех её потомков.'''
+        return self._snapshot.descendants.get(activity_id, frozenset())
+
+    def subtree(self, activity_id: uuid.UUID) -> List[Activity]:
+        '''Вершина и все потомки, отсортированные по имени.'''
+        snapshot = self._snapshot
+        return sorted((snapshot.by_id[i] for i in self.descendants(activity_id)), key=lambda r: r.name)
+
+
+activity_catalog = ActivityCatalog()
+
+
+@event.listens_for(ActivitiesModels, 'after_insert')
+@event.listens_for(ActivitiesModels, 'after_update')
+@event.listens_for(ActivitiesModels, 'after_delete')
+def _invalidate_activity_catalog(mapper, connection, target):
+    activity_catalog.invalidate()
+
+
+# --- чтение справочника в ручках ---
+# Пока справочник не загружен (не удалось ни при старте, ни в ensure_fresh),
+# ручки берут то же из БД: поддерево — одним индексным join по activity_closure.
+
+async def catalog_loaded(session: AsyncSession) -> bool:
+    '''ensure_fresh; False — справочника в памяти нет и загрузить его не удалось'''
+    try:
+        await activity_catalog.ensure_fresh(session)
+    except Exception as er:
+        if activity_catalog.ready:
+            raise
+        logger.warning('activity catalog не загружен, запросы идут в БД: %s', er)
+        await session.rollback()
+        return False
+    return True
+
+
+def _closure_subtree(root_name: str):
+    '''join от корня первого уровня root_name к его потомкам через activity_closure'''
+    root = aliased(ActivitiesModels, name='root')
+    return (
+        select(ActivitiesModels.id, ActivitiesModels.name, ActivitiesModels.parent_id)
+        .join(ActivitiesClosureModels, ActivitiesClosureModels.descendant_id == ActivitiesModels.id)
+        .join(root, root.id == ActivitiesClosureModels.ancestor_id)
+        .where(root.name == root_name, root.parent_id.is_(None))
+    )
+
+
+async def activity_subtree_ids(session: AsyncSession, root_name: str) -> FrozenSet[uuid.UUID]:
+    '''id корня первого уровня root_name и всех его потомков; пустое множество — корня нет'''
+    if await catalog_loaded(session):
+        root_id = activity_catalog.root_id(root_name)
+        return activity_catalog.descendants(root_id) if root_id is not None else frozenset()
+    return frozenset((await session.execute(_closure_subtree(root_name))).scalars())
+
+
+async def activity_subtree(session: AsyncSession, root_name: str) -> List[Activity]:
+    '''корень первого уровня root_name и все потомки по имени; пустой список — корня нет'''
+    if await catalog_loaded(session):
+        root_id = activity_catalog.root_id(root_name)
+        return activity_catalog.subtree(root_id) if root_id is not None else []
+    rows = await session.execute(_closure_subtree(root_name).order_by(ActivitiesModels.name))
+    return [Activity(*row) for row in rows]
+
+
+async def activity_roots(session: AsyncSession) -> List[Activity]:
+    if await catalog_loaded(session):
+        return activity_catalog.roots()
+    rows = await session.execute(
+        select(ActivitiesModels.id, ActivitiesModels.name, ActivitiesModels.parent_id)
+        .where(ActivitiesModels.parent_id.is_(None))
+        .order_by(ActivitiesModels.name)
+    )
+    return [Activity(*row) for row in rows]
+
+
+async def activity_ids_by_name(session: AsyncSession, name: str) -> List[uuid.UUID]:
+    if await catalog_loaded(session):
+        return activity_catalog.ids_by_name(name)
+    return list((await session.execute(select(ActivitiesModels.id).where(ActivitiesModels.name == name))).scalars())
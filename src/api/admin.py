@@ -0,0 +1,99 @@
+import hmac
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from config import ADMIN_TOKEN, MULTI_WORKER
+from pool_stats import pool_stats
+from slow_query_log import slow_query_log
+from src.api.cache import response_cache
+from src.api.profiling import collapsed, profile_store
+from src.api.singleflight import query_flight
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    '''Пропускает только запросы с заголовком X-Admin-Token, равным ADMIN_TOKEN.'''
+    if not ADMIN_TOKEN or x_admin_token is None or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail='Доступ запрещён')
+
+
+def require_single_process():
+    '''
+    Ручки с состоянием одного процесса (пулы, кэш, журналы, профили): при
+    нескольких воркерах запрос попадает в случайный из них, и ответ ни о чём
+    не говорит. Сводные счётчики всех процессов — в /metrics.
+    '''
+    if MULTI_WORKER:
+        raise HTTPException(
+            status_code=409,
+            detail='API запущен несколькими процессами: состояние отдельного процесса недоступно, см. /metrics',
+        )
+
+
+per_process = [Depends(require_single_process)]
+
+
+admin_router = APIRouter(
+    prefix="/v1/secunda/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)],
+)
+
+@admin_router.get('/pool', dependencies=per_process)
+async def get_pool_stats() -> Dict:
+    '''текущее состояние пулов соединений и гистограмма ожидания checkout'''
+    return {name: stats.snapshot() for name, stats in pool_stats.items()}
+
+@admin_router.get('/cache', dependencies=per_process)
+async def get_cache_stats() -> Dict:
+    '''счётчики кэша ответов'''
+    return response_cache.stats()
+
+@admin_router.post('/cache/invalidate')
+async def invalidate_cache(route: Optional[str] = None) -> Dict:
+    '''
+    сброс кэша ответов: маршрута (шаблон пути) или целиком — для внешних
+    загрузчиков данных. Сбрасывается кэш процесса, принявшего запрос, а при
+    BROADCAST_EVENTS сброс рассылается и остальным процессам
+    '''
+    return {'invalidated': response_cache.invalidate(route or '')}
+
+@admin_router.get('/singleflight', dependencies=per_process)
+async def get_singleflight_stats() -> Dict:
+    '''сколько запросов к БД выполнено и сколько одновременных вызовов к ним присоединилось'''
+    return query_flight.stats()
+
+@admin_router.get('/slow_queries', dependencies=per_process)
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000, description="сколько последних записей вернуть")) -> Dict:
+    '''последние медленные запросы с маршрутом, параметрами и планом, новые первыми'''
+    return slow_query_log.snapshot(limit)
+
+@admin_router.delete('/slow_queries', dependencies=per_process)
+async def clear_slow_queries() -> Dict:
+    '''очистка журнала медленных запросов'''
+    return {'cleared': slow_query_log.clear()}
+
+@admin_router.get('/profiles', dependencies=per_process)
+async def get_profiles() -> List[Dict]:
+    '''сохранённые профили запросов без стеков, новые первыми'''
+    return profile_store.summaries()
+
+@admin_router.get('/profiles/{profile_id}', dependencies=per_process)
+async def get_profile(profile_id: int, format: str = Query('json', pattern='^(json|collapsed)$')):
+    '''
+    профиль запроса: json — разбивка времени и стеки, collapsed — стеки
+    в формате flamegraph.pl / speedscope
+    '''
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail='Профиль не найден')
+    if format == 'collapsed':
+        return PlainTextResponse(collapsed(profile['samples']))
+    return {
+        **{key: value for key, value in profile.items() if key != 'samples'},
+        'stacks': [
+            {'stack': [f'{name} ({path})' for path, name in stack], 'samples': count}
+            for stack, count in profile['samples'].most_common()
+        ],
+    }
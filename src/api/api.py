@@ -1,126 +1,255 @@
-from typing import Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+import time
+import uuid
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
-from src.api.scripts import bbox_for_radius, haversine_m, parse_latlon_decimal
-from database import get_db
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Text, and_, cast, func, literal_column, or_, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.activity_catalog import (
+    activity_catalog, activity_ids_by_name, activity_roots, activity_subtree, activity_subtree_ids,
+)
+from src.api.admin import require_admin
+from src.api.cache import response_cache
+from src.api.export import MEDIA_TYPES, export_organizations
+from src.api.ingest import ingest_batch
+from src.api.pagination import decode_name_id_cursor, decode_score_id_cursor, split_page
+from src.api.profiling import ProfilingRoute
+from src.api.schemas import (
+    ActivityTreeResponse, ActivityTreeSearchResponse, GeoNearestResponse, GeoSearchByBBoxResponse,
+    GeoSearchByCenterResponse, IngestRequest, IngestResponse, OrganizationBatchRequest, OrganizationBatchResponse,
+    OrgInBuildingPage, OrganizationDetail, OrganizationSearchResponse, OrgShortPage,
+)
+from src.api.scripts import bbox_for_radius, haversine_m_batch, radius_top_k
+from src.api.singleflight import query_flight
+from src.api.spatial_index import spatial_index
+from database import async_session_maker, get_db
 from src.models.models import *
-from sqlalchemy.orm import aliased
+from sqlalchemy.orm import joinedload, selectinload
 
 router = APIRouter(
     prefix="/v1/secunda",
-    tags=["clients"]
+    tags=["clients"],
+    # профилирование отдельного запроса по X-Profile-Token, см. src/api/profiling.py
+    route_class=ProfilingRoute,
 )
 
-@router.get('/org_in_builds')
-def get_org_in_builds(org_address: str, session: Session = Depends(get_db)): 
-    '''список всех организаций находящихся в конкретном здании'''
-    try:
-        result_list = []
+# здание грузится JOIN-ом в том же запросе, телефоны и виды деятельности —
+# по одному запросу IN (...) на всю выборку, независимо от числа организаций
+ORGANIZATION_DOCUMENT_OPTIONS = (
+    joinedload(OrganizationsModels.building, innerjoin=True),
+    selectinload(OrganizationsModels.phones),
+    selectinload(OrganizationsModels.activities),
+)
+
+def organization_document(org: OrganizationsModels) -> Dict:
+    '''документ организации; связи должны быть загружены через ORGANIZATION_DOCUMENT_OPTIONS'''
+    return {
+        'id': org.id,
+        'name': org.name,
+        'building': {
+            'id': org.building.id,
+            'address': org.building.address,
+            'latitude_longitude': org.building.latitude_longitude
+        },
+        'phones': [phone.phone_number for phone in org.phones],
+        'activities': [activity.name for activity in org.activities]
+    }
+
+def organization_json_query(organization_id: str):
+    '''
+    Postgres: весь документ organization_document одним запросом.
+    Телефоны и виды деятельности собираются json_agg в LATERAL-подзапросах,
+    результат приводится к text и отдаётся клиенту без разбора в Python.
+    json_build_object (не jsonb) сохраняет порядок ключей документа.
+    '''
+    empty = literal_column("'[]'::json")
+    phones = (
+        select(func.coalesce(func.json_agg(OrganizationPhonesModels.phone_number), empty).label('agg'))
+        .where(OrganizationPhonesModels.organization_id == OrganizationsModels.id)
+        .lateral('phones')
+    )
+    activities = (
+        select(func.coalesce(func.json_agg(ActivitiesModels.name), empty).label('agg'))
+        .select_from(OrganizationActivitiesModels)
+        .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
+        .where(OrganizationActivitiesModels.organization_id == OrganizationsModels.id)
+        .lateral('activities')
+    )
+    document = func.json_build_object(
+        'id', OrganizationsModels.id,
+        'name', OrganizationsModels.name,
+        'building', func.json_build_object(
+            'id', BuildingsModel.id,
+            'address', BuildingsModel.address,
+            'latitude_longitude', BuildingsModel.latitude_longitude,
+        ),
+        'phones', phones.c.agg,
+        'activities', activities.c.agg,
+    )
+    return (
+        select(cast(document, Text))
+        .select_from(OrganizationsModels)
+        .join(BuildingsModel, OrganizationsModels.buildings_id == BuildingsModel.id)
+        .join(phones, true())
+        .join(activities, true())
+        .where(OrganizationsModels.id == organization_id)
+    )
 
+async def load_org_in_builds(
+    org_address: str, after: Optional[Tuple[str, uuid.UUID]], limit: int
+) -> Tuple[List[Dict], Optional[str]]:
+    '''страница организаций в здании по адресу и курсор следующей; вызывается через query_flight'''
+    async with async_session_maker() as session:
         query = (
-            select(BuildingsModel, OrganizationsModels)
+            select(BuildingsModel.address, BuildingsModel.latitude_longitude, OrganizationsModels.name, OrganizationsModels.id)
             .join(OrganizationsModels, OrganizationsModels.buildings_id == BuildingsModel.id)
             .where(BuildingsModel.address == org_address)
-        )       
-        res = session.execute(query)
-        
-        for building, org in res:
-            result = {
-                'address': building.address,
-                'latitude_longitude': building.latitude_longitude,
+            .order_by(OrganizationsModels.name, OrganizationsModels.id)
+            .limit(limit + 1)
+        )
+        if after is not None:
+            query = query.where(tuple_(OrganizationsModels.name, OrganizationsModels.id) > tuple_(*after))
+        rows, next_cursor = split_page((await session.execute(query)).all(), limit, lambda r: [r.name, r.id])
+        return [
+            {
+                'address': address,
+                'latitude_longitude': latitude_longitude,
 
-                'org_name': org.name
+                'org_name': org_name
             }
-            result_list.append(result)
-        return result_list
+            for address, latitude_longitude, org_name, _ in rows
+        ], next_cursor
+
+@router.get('/org_in_builds')
+@response_cache.cached()
+async def get_org_in_builds(
+    org_address: str,
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+) -> OrgInBuildingPage: 
+    '''список всех организаций находящихся в конкретном здании'''
+    try:
+        after = decode_name_id_cursor(cursor)
+        # одновременные запросы одной страницы ждут один и тот же запрос к БД
+        organizations, next_cursor = await query_flight.do(
+            ('org_in_builds', org_address, after, limit), load_org_in_builds, org_address, after, limit,
+        )
+        return {'count': len(organizations), 'next_cursor': next_cursor, 'organizations': organizations}
+    except HTTPException:
+        raise
     except Exception as er:
         print(er)
         raise HTTPException(status_code=500, detail='Не удалось выполнить чтение из БД')
 
 @router.get('/org_by_activiys')
-def get_org_by_activiys(org_activities: str, session: Session = Depends(get_db)):
+@response_cache.cached()
+async def get_org_by_activiys(
+    org_activities: str,
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    session: AsyncSession = Depends(get_db),
+) -> OrgShortPage:
     '''список всех организаций, которые относятся к указанному виду деятельности'''
     try:
-        result_list = []
+        after = decode_name_id_cursor(cursor)
+        activity_ids = await activity_ids_by_name(session, org_activities)
+        if not activity_ids:
+            return {'count': 0, 'next_cursor': None, 'organizations': []}
 
         query = (
-            select(OrganizationsModels)
-            .select_from(OrganizationActivitiesModels)
-            .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
-            .join(OrganizationsModels, OrganizationActivitiesModels.organization_id == OrganizationsModels.id)
-            .where(ActivitiesModels.name == org_activities)
-            .distinct()
+            select(OrganizationsModels.id, OrganizationsModels.name)
+            .where(OrganizationsModels.id.in_(
+                select(OrganizationActivitiesModels.organization_id)
+                .where(OrganizationActivitiesModels.activity_id.in_(activity_ids))
+            ))
+            .order_by(OrganizationsModels.name, OrganizationsModels.id)
+            .limit(limit + 1)
         )
+        if after is not None:
+            query = query.where(tuple_(OrganizationsModels.name, OrganizationsModels.id) > tuple_(*after))
 
-        res = session.execute(query).scalars().all()
-        for org in res:
-            result = {
-                'org_id': str(org.id),
-                'org_name': org.name
-            }
-            result_list.append(result)
-            
-        return result_list
+        rows, next_cursor = split_page((await session.execute(query)).all(), limit, lambda r: [r.name, r.id])
+        organizations = [{'org_id': org_id, 'org_name': org_name} for org_id, org_name in rows]
+        return {'count': len(organizations), 'next_cursor': next_cursor, 'organizations': organizations}
+    except HTTPException:
+        raise
     except Exception as er:
         print(er)
         raise HTTPException(status_code=500, detail='Не удалось выполнить чтение из БД')
 
 @router.get("/geo_search_by_center")
-def geo_search_by_center(
+@response_cache.cached()
+async def geo_search_by_center(
     building_id: str = Query(..., description="id здания — будет использовано как центр"),
     radius_m: float = Query(..., description="радиус в метрах — обязательный параметр"),
     limit: int = Query(200, description="максимум результатов для защиты от слишком больших ответов"),
-    session: Session = Depends(get_db),
-) -> Dict:
+    session: AsyncSession = Depends(get_db),
+) -> GeoSearchByCenterResponse:
     """
     Поиск зданий и организаций в радиусе относительно здания по building_id.
     """
     try:
-        center_b = session.execute(select(BuildingsModel).where(BuildingsModel.id == building_id)).scalar_one_or_none()
+        center_b = (await session.execute(select(BuildingsModel).where(BuildingsModel.id == building_id))).scalar_one_or_none()
         if center_b is None:
             raise HTTPException(status_code=404, detail="building_id не найден в БД")
 
-        try:
-            center_lat, center_lon = parse_latlon_decimal(center_b.latitude_longitude)
-        except Exception as e:
+        if center_b.latitude is None or center_b.longitude is None:
             raise HTTPException(status_code=500, detail="Некорректные координаты у центра")
-
-        min_lat, max_lat, min_lon, max_lon = bbox_for_radius(center_lat, center_lon, radius_m)
-
-        stmt = select(BuildingsModel).where(BuildingsModel.latitude_longitude.isnot(None))
-        buildings = session.execute(stmt).scalars().all()
+        center_lat, center_lon = center_b.latitude, center_b.longitude
 
         found = []
         found_building_ids = []
 
-        for b in buildings:
-            try:
-                b_lat, b_lon = parse_latlon_decimal(b.latitude_longitude)
-            except Exception:
-                continue
-
-            if not (min_lat <= b_lat <= max_lat and min_lon <= b_lon <= max_lon):
-                continue
-
-            dist = haversine_m(center_lat, center_lon, b_lat, b_lon)
-            if dist <= radius_m:
+        if spatial_index.ready:
+            for b_id, b_lat, b_lon, dist in spatial_index.query_radius(center_lat, center_lon, radius_m, limit):
                 found.append({
-                    "building_id": str(b.id),
-                    "address": getattr(b, "address", None),
+                    "building_id": b_id,
+                    "address": None,
                     "latitude": b_lat,
                     "longitude": b_lon,
                     "distance_m": round(dist, 2),
                 })
-                found_building_ids.append(b.id)
+                found_building_ids.append(b_id)
+
+            if found_building_ids:
+                addresses_res = await session.execute(
+                    select(BuildingsModel.id, BuildingsModel.address)
+                    .where(BuildingsModel.id.in_(found_building_ids))
+                )
+                addresses = dict(addresses_res.all())
+                for r, b_id in zip(found, found_building_ids):
+                    r["address"] = addresses.get(b_id)
+        else:
+            min_lat, max_lat, min_lon, max_lon = bbox_for_radius(center_lat, center_lon, radius_m)
 
-            if len(found) >= limit:
-                break
+            stmt = (
+                select(BuildingsModel.id, BuildingsModel.address, BuildingsModel.latitude, BuildingsModel.longitude)
+                .where(BuildingsModel.latitude.between(min_lat, max_lat))
+                .where(BuildingsModel.longitude.between(min_lon, max_lon))
+            )
+
+            rows = (await session.execute(stmt)).all()
+            if rows:
+                lat_rad = np.radians(np.array([r.latitude for r in rows], dtype=np.float64))
+                lon_rad = np.radians(np.array([r.longitude for r in rows], dtype=np.float64))
+                distances = haversine_m_batch(center_lat, center_lon, lat_rad, lon_rad)
+                for i in radius_top_k(distances, radius_m, limit).tolist():
+                    b_id, b_address, b_lat, b_lon = rows[i]
+                    found.append({
+                        "building_id": b_id,
+                        "address": b_address,
+                        "latitude": b_lat,
+                        "longitude": b_lon,
+                        "distance_m": round(float(distances[i]), 2),
+                    })
+                    found_building_ids.append(b_id)
 
         if not found:
             return {
-                "center": {"building_id": str(center_b.id), "address": getattr(center_b, "address", None),
+                "center": {"building_id": center_b.id, "address": getattr(center_b, "address", None),
                            "latitude": center_lat, "longitude": center_lon},
                 "radius_m": radius_m,
                 "count": 0,
@@ -128,11 +257,11 @@ def geo_search_by_center(
             }
 
         orgs_stmt = select(OrganizationsModels).where(OrganizationsModels.buildings_id.in_(found_building_ids))
-        orgs = session.execute(orgs_stmt).scalars().all()
+        orgs = (await session.execute(orgs_stmt)).scalars().all()
 
         orgs_by_building = {}
         for o in orgs:
-            orgs_by_building.setdefault(str(o.buildings_id), []).append({"org_id": str(o.id), "org_name": o.name})
+            orgs_by_building.setdefault(o.buildings_id, []).append({"org_id": o.id, "org_name": o.name})
 
         for r in found:
             r["organizations"] = orgs_by_building.get(r["building_id"], [])
@@ -141,7 +270,7 @@ def geo_search_by_center(
         results = found[:limit]
 
         return {
-            "center": {"building_id": str(center_b.id), "address": getattr(center_b, "address", None),
+            "center": {"building_id": center_b.id, "address": getattr(center_b, "address", None),
                        "latitude": center_lat, "longitude": center_lon},
             "radius_m": radius_m,
             "count": len(results),
@@ -152,49 +281,289 @@ def geo_search_by_center(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка поиска by_center")
+
+@router.get("/geo_nearest")
+async def geo_nearest(
+    building_id: Optional[str] = Query(None, description="id здания — будет использовано как центр"),
+    lat: Optional[float] = Query(None, description="широта центра, если building_id не задан"),
+    lon: Optional[float] = Query(None, description="долгота центра, если building_id не задан"),
+    k: int = Query(10, ge=1, le=1000, description="сколько ближайших зданий вернуть"),
+    max_radius_m: Optional[float] = Query(None, description="не искать дальше этого радиуса в метрах"),
+    session: AsyncSession = Depends(get_db),
+) -> GeoNearestResponse:
+    """
+    k ближайших к центру зданий с организациями, по возрастанию расстояния.
+    """
+    try:
+        if building_id is not None:
+            center_b = (await session.execute(select(BuildingsModel).where(BuildingsModel.id == building_id))).scalar_one_or_none()
+            if center_b is None:
+                raise HTTPException(status_code=404, detail="building_id не найден в БД")
+            if center_b.latitude is None or center_b.longitude is None:
+                raise HTTPException(status_code=500, detail="Некорректные координаты у центра")
+            center = {"building_id": center_b.id, "address": center_b.address,
+                      "latitude": center_b.latitude, "longitude": center_b.longitude}
+        elif lat is not None and lon is not None:
+            center = {"building_id": None, "address": None, "latitude": lat, "longitude": lon}
+        else:
+            raise HTTPException(status_code=400, detail="Нужно указать building_id или lat и lon")
+
+        if not spatial_index.ready:
+            await spatial_index.build(session)
+
+        nearest = spatial_index.nearest(center["latitude"], center["longitude"], k, max_radius_m)
+        found_building_ids = [b_id for b_id, _, _, _ in nearest]
+
+        addresses = {}
+        orgs_by_building = {}
+        if found_building_ids:
+            addresses_res = await session.execute(
+                select(BuildingsModel.id, BuildingsModel.address)
+                .where(BuildingsModel.id.in_(found_building_ids))
+            )
+            addresses = dict(addresses_res.all())
+            orgs_stmt = select(OrganizationsModels).where(OrganizationsModels.buildings_id.in_(found_building_ids))
+            for o in (await session.execute(orgs_stmt)).scalars():
+                orgs_by_building.setdefault(o.buildings_id, []).append({"org_id": o.id, "org_name": o.name})
+
+        results = [
+            {
+                "building_id": b_id,
+                "address": addresses.get(b_id),
+                "latitude": b_lat,
+                "longitude": b_lon,
+                "distance_m": round(dist, 2),
+                "organizations": orgs_by_building.get(b_id, []),
+            }
+            for b_id, b_lat, b_lon, dist in nearest
+        ]
+
+        return {
+            "center": center,
+            "k": k,
+            "max_radius_m": max_radius_m,
+            "count": len(results),
+            "results": results,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка поиска ближайших зданий")
+
+@router.get("/geo_search_by_bbox")
+async def geo_search_by_bbox(
+    min_lat: float = Query(..., description="южная граница прямоугольника"),
+    max_lat: float = Query(..., description="северная граница прямоугольника"),
+    min_lon: float = Query(..., description="западная граница прямоугольника"),
+    max_lon: float = Query(..., description="восточная граница прямоугольника"),
+    limit: int = Query(200, description="максимум результатов для защиты от слишком больших ответов"),
+    session: AsyncSession = Depends(get_db),
+) -> GeoSearchByBBoxResponse:
+    """
+    Поиск зданий и организаций внутри прямоугольной области.
+    Фильтр выполняется в БД по индексу ix_buildings_latitude_longitude.
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="Минимальная граница больше максимальной")
+    try:
+        stmt = (
+            select(BuildingsModel.id, BuildingsModel.address, BuildingsModel.latitude, BuildingsModel.longitude)
+            .where(BuildingsModel.latitude.between(min_lat, max_lat))
+            .where(BuildingsModel.longitude.between(min_lon, max_lon))
+            .limit(limit)
+        )
+        found = [
+            {
+                "building_id": b_id,
+                "address": b_address,
+                "latitude": b_lat,
+                "longitude": b_lon,
+            }
+            for b_id, b_address, b_lat, b_lon in await session.execute(stmt)
+        ]
+
+        orgs_by_building = {}
+        if found:
+            orgs_stmt = select(OrganizationsModels).where(
+                OrganizationsModels.buildings_id.in_([r["building_id"] for r in found])
+            )
+            for o in (await session.execute(orgs_stmt)).scalars():
+                orgs_by_building.setdefault(o.buildings_id, []).append({"org_id": o.id, "org_name": o.name})
+
+        for r in found:
+            r["organizations"] = orgs_by_building.get(r["building_id"], [])
+
+        return {
+            "bbox": {"min_lat": min_lat, "max_lat": max_lat, "min_lon": min_lon, "max_lon": max_lon},
+            "count": len(found),
+            "results": found,
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка поиска by_bbox")
     
+@router.get('/organization/search')
+async def search_organizations_by_name(
+    name: str = Query(..., description="Название организации для поиска"),
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    min_similarity: float = Query(0.5, ge=0, le=1, description="Порог похожести названия (pg_trgm word_similarity)"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    session: AsyncSession = Depends(get_db)
+) -> OrganizationSearchResponse:
+    '''
+    Нечёткий поиск организаций по названию.
+    В Postgres — по GIN-триграммному индексу с ранжированием по word_similarity,
+    в остальных БД — ilike с сортировкой по названию. Страницы листаются
+    keyset-курсором, поэтому любая страница стоит как первая.
+    '''
+    try:
+        if session.bind.dialect.name == 'postgresql':
+            # порог оператора %> действует до конца транзакции
+            await session.execute(select(
+                func.set_config('pg_trgm.word_similarity_threshold', str(min_similarity), True)
+            ))
+            score = func.word_similarity(name, OrganizationsModels.name)
+            query = (
+                select(OrganizationsModels, score.label('score'))
+                .where(OrganizationsModels.name.op('%>')(name))
+                .order_by(score.desc(), OrganizationsModels.id)
+            )
+            after = decode_score_id_cursor(cursor)
+            if after is not None:
+                last_score, last_id = after
+                query = query.where(or_(
+                    score < last_score,
+                    and_(score == last_score, OrganizationsModels.id > last_id),
+                ))
+        else:
+            query = (
+                select(OrganizationsModels, OrganizationsModels.name.label('score'))
+                .where(OrganizationsModels.name.ilike(f"%{name}%"))
+                .order_by(OrganizationsModels.name, OrganizationsModels.id)
+            )
+            after = decode_name_id_cursor(cursor)
+            if after is not None:
+                query = query.where(tuple_(OrganizationsModels.name, OrganizationsModels.id) > tuple_(*after))
+
+        query = query.options(*ORGANIZATION_DOCUMENT_OPTIONS).limit(limit + 1)
+        rows, next_cursor = split_page((await session.execute(query)).all(), limit, lambda r: [r[1], r[0].id])
+
+        organizations_list = [organization_document(org) for org, _ in rows]
+
+        return {
+            'search_query': name,
+            'count': len(organizations_list),
+            'next_cursor': next_cursor,
+            'organizations': organizations_list
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail='Не удалось выполнить поиск организаций')
+
+@router.get('/export')
+async def export_organizations_dump(
+    format: str = Query('ndjson', pattern='^(ndjson|csv)$', description="ndjson или csv"),
+    activity_name: Optional[str] = Query(None, description="только организации из поддерева этого вида деятельности первого уровня"),
+    building_id: Optional[uuid.UUID] = Query(None, description="только организации в этом здании"),
+    session: AsyncSession = Depends(get_db),
+):
+    '''потоковая выгрузка организаций с зданием, телефонами и видами деятельности'''
+    activity_ids = None
+    if activity_name is not None:
+        activity_ids = await activity_subtree_ids(session, activity_name)
+        if not activity_ids:
+            raise HTTPException(status_code=404, detail=f"Вид деятельности '{activity_name}' не найден")
+
+    return StreamingResponse(
+        export_organizations(format, activity_ids, building_id),
+        media_type=MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="organizations.{format}"'},
+    )
+
+@router.post('/organization/bulk', dependencies=[Depends(require_admin)])
+async def ingest_organizations(
+    payload: IngestRequest,
+    batch_size: int = Query(500, ge=1, le=5000, description="организаций в одной транзакции"),
+    session: AsyncSession = Depends(get_db),
+) -> IngestResponse:
+    '''
+    Загрузка организаций из внешнего реестра: upsert зданий, организаций,
+    телефонов и связей с видами деятельности пачками по batch_size.
+    Каждая пачка — отдельная транзакция; в ответе время каждой пачки.
+    '''
+    started = time.perf_counter()
+    batches = []
+    try:
+        for start in range(0, len(payload.organizations), batch_size):
+            batches.append(await ingest_batch(session, payload.organizations[start:start + batch_size]))
+    except Exception as e:
+        print(f"Error: {e}")
+        await session.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f'Не удалось загрузить организации, сохранено пачек: {len(batches)}'
+        )
+    return {
+        'organizations': sum(batch['organizations'] for batch in batches),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+        'batches': batches,
+    }
+
+@router.post('/organization/batch')
+async def get_organizations_batch(
+    payload: OrganizationBatchRequest,
+    session: AsyncSession = Depends(get_db),
+) -> OrganizationBatchResponse:
+    '''
+    документы организаций по списку id в порядке запроса (повторы
+    отбрасываются); не найденные id перечислены в missing
+    '''
+    try:
+        ids = list(dict.fromkeys(payload.ids))
+        query = (
+            select(OrganizationsModels)
+            .options(*ORGANIZATION_DOCUMENT_OPTIONS)
+            .where(OrganizationsModels.id.in_(ids))
+        )
+        found = {org.id: org for org in (await session.execute(query)).scalars()}
+
+        organizations = [organization_document(found[org_id]) for org_id in ids if org_id in found]
+        return {
+            'count': len(organizations),
+            'organizations': organizations,
+            'missing': [org_id for org_id in ids if org_id not in found],
+        }
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail='Не удалось выполнить чтение из БД')
+
 @router.get('/organization/{organization_id}')
-def get_organization_by_id(organization_id: str, session: Session = Depends(get_db)):
+@response_cache.cached()
+async def get_organization_by_id(organization_id: str, session: AsyncSession = Depends(get_db)) -> OrganizationDetail:
     '''получение информации об организации по её идентификатору'''
     try:
+        if session.bind.dialect.name == 'postgresql':
+            document = (await session.execute(organization_json_query(organization_id))).scalar_one_or_none()
+            if document is None:
+                raise HTTPException(status_code=404, detail="Организация не найдена")
+            return Response(content=document, media_type='application/json')
+
         query = (
-            select(OrganizationsModels, BuildingsModel)
-            .join(BuildingsModel, OrganizationsModels.buildings_id == BuildingsModel.id)
+            select(OrganizationsModels)
+            .options(*ORGANIZATION_DOCUMENT_OPTIONS)
             .where(OrganizationsModels.id == organization_id)
         )
-        result = session.execute(query).first()
+        org = (await session.execute(query)).scalar_one_or_none()
         
-        if not result:
+        if org is None:
             raise HTTPException(status_code=404, detail="Организация не найдена")
         
-        org, building = result
-
-        phones_query = select(OrganizationPhonesModels.phone_number).where(
-            OrganizationPhonesModels.organization_id == organization_id
-        )
-        phones = session.execute(phones_query).scalars().all()
-
-        activities_query = (
-            select(ActivitiesModels.name)
-            .select_from(OrganizationActivitiesModels)
-            .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
-            .where(OrganizationActivitiesModels.organization_id == organization_id)
-        )
-        activities = session.execute(activities_query).scalars().all()
-
-        response = {
-            'id': str(org.id),
-            'name': org.name,
-            'building': {
-                'id': str(building.id),
-                'address': building.address,
-                'latitude_longitude': building.latitude_longitude
-            },
-            'phones': phones,
-            'activities': activities
-        }
-        
-        return response
+        return organization_document(org)
         
     except HTTPException:
         raise
@@ -202,70 +571,80 @@ def get_organization_by_id(organization_id: str, session: Session = Depends(get_
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail='Не удалось выполнить чтение из БД')
     
-@router.get('/org_by_activity_tree')
-def get_organizations_by_activity_tree(
-    activity_name: str = Query(..., description="Название вида деятельности на первом уровне дерева"),
-    session: Session = Depends(get_db)
-):
-    try:
-        ActivityParent = aliased(ActivitiesModels, name='parent')
-        ActivityChild = aliased(ActivitiesModels, name='child')
-        
-        activity_hierarchy = (
-            select(ActivityParent.id)
-            .where(ActivityParent.name == activity_name)
-            .where(ActivityParent.parent_id.is_(None))
-            .cte(recursive=True, name='activity_hierarchy')
-        )
-        
-        activity_hierarchy_union = activity_hierarchy.union_all(
-            select(ActivityChild.id)
-            .select_from(ActivityChild)
-            .join(activity_hierarchy, ActivityChild.parent_id == activity_hierarchy.c.id)
+async def load_organizations_by_activities(
+    activity_ids: FrozenSet[uuid.UUID], after: Optional[Tuple[str, uuid.UUID]], limit: int
+) -> Tuple[List[Dict], Optional[str]]:
+    '''
+    Страница организаций с указанными видами деятельности по (name, id) и
+    курсор следующей; вызывается через query_flight. Виды деятельности
+    подгружаются вторым запросом только для организаций страницы.
+    '''
+    async with async_session_maker() as session:
+        linked = (
+            select(OrganizationActivitiesModels.organization_id)
+            .where(OrganizationActivitiesModels.activity_id.in_(activity_ids))
         )
-        
-        all_activity_ids = select(activity_hierarchy_union.c.id)
-        
         organizations_query = (
-            select(
-                OrganizationsModels.id,
-                OrganizationsModels.name,
-                BuildingsModel.address,
-                ActivitiesModels.name.label('activity_name')
-            )
-            .select_from(OrganizationsModels)
-            .join(OrganizationActivitiesModels, OrganizationsModels.id == OrganizationActivitiesModels.organization_id)
-            .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
+            select(OrganizationsModels.id, OrganizationsModels.name, BuildingsModel.address)
             .join(BuildingsModel, OrganizationsModels.buildings_id == BuildingsModel.id)
-            .where(ActivitiesModels.id.in_(all_activity_ids))
-            .order_by(OrganizationsModels.name, ActivitiesModels.name)
+            .where(OrganizationsModels.id.in_(linked))
+            .order_by(OrganizationsModels.name, OrganizationsModels.id)
+            .limit(limit + 1)
         )
-        
-        result = session.execute(organizations_query).all()
-        
-        if not result:
+        if after is not None:
+            organizations_query = organizations_query.where(
+                tuple_(OrganizationsModels.name, OrganizationsModels.id) > tuple_(*after)
+            )
+        rows, next_cursor = split_page((await session.execute(organizations_query)).all(), limit, lambda r: [r.name, r.id])
+
+        organizations = {
+            org_id: {'id': org_id, 'name': org_name, 'address': address, 'activities': []}
+            for org_id, org_name, address in rows
+        }
+        if organizations:
+            activities_query = (
+                select(OrganizationActivitiesModels.organization_id, ActivitiesModels.name)
+                .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
+                .where(OrganizationActivitiesModels.organization_id.in_(list(organizations)))
+                .where(OrganizationActivitiesModels.activity_id.in_(activity_ids))
+                .order_by(ActivitiesModels.name)
+            )
+            for org_id, activity in await session.execute(activities_query):
+                organizations[org_id]['activities'].append(activity)
+        return list(organizations.values()), next_cursor
+
+@router.get('/org_by_activity_tree')
+async def get_organizations_by_activity_tree(
+    activity_name: str = Query(..., description="Название вида деятельности на первом уровне дерева"),
+    limit: int = Query(100, ge=1, le=1000, description="Размер страницы"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    session: AsyncSession = Depends(get_db)
+) -> ActivityTreeSearchResponse:
+    try:
+        after = decode_name_id_cursor(cursor)
+        activity_ids = await activity_subtree_ids(session, activity_name)
+        if not activity_ids:
             raise HTTPException(
                 status_code=404, 
                 detail=f"Вид деятельности '{activity_name}' не найден или не имеет дочерних элементов"
             )
         
-        organizations_dict = {}
-        for org_id, org_name, address, activity_name in result:
-            if org_id not in organizations_dict:
-                organizations_dict[org_id] = {
-                    'id': str(org_id),
-                    'name': org_name,
-                    'address': address,
-                    'activities': []
-                }
-            organizations_dict[org_id]['activities'].append(activity_name)
+        organizations, next_cursor = await query_flight.do(
+            ('org_by_activity_tree', activity_name, activity_catalog.generation, after, limit),
+            load_organizations_by_activities, activity_ids, after, limit,
+        )
         
-        response = list(organizations_dict.values())
+        if not organizations and after is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Вид деятельности '{activity_name}' не найден или не имеет дочерних элементов"
+            )
         
         return {
             'search_activity': activity_name,
-            'count': len(response),
-            'organizations': response
+            'count': len(organizations),
+            'next_cursor': next_cursor,
+            'organizations': organizations
         }
         
     except HTTPException:
@@ -275,55 +654,28 @@ def get_organizations_by_activity_tree(
         raise HTTPException(status_code=500, detail='Не удалось выполнить поиск по дереву видов деятельности')
 
 @router.get('/activity_tree')
-def get_activity_tree(
+@response_cache.cached()
+async def get_activity_tree(
     parent_name: Optional[str] = Query(None, description="Название родительского вида деятельности"),
-    session: Session = Depends(get_db)
-):
+    session: AsyncSession = Depends(get_db)
+) -> ActivityTreeResponse:
+    '''
+    дерево видов деятельности; отдаётся из activity_catalog без запросов к БД,
+    а пока справочник не загружен — из БД через activity_closure
+    '''
     try:
         if parent_name:
-            parent_activity = session.execute(
-                select(ActivitiesModels).where(
-                    ActivitiesModels.name == parent_name, 
-                    ActivitiesModels.parent_id.is_(None)
-                )
-            ).scalar_one_or_none()
-            
-            if not parent_activity:
+            tree = await activity_subtree(session, parent_name)
+            if not tree:
                 raise HTTPException(status_code=404, detail="Родительский вид деятельности не найден")
             
-            ParentActivity = aliased(ActivitiesModels, name='parent')
-            ChildActivity = aliased(ActivitiesModels, name='child')
-            
-            activity_tree = (
-                select(ParentActivity.id, ParentActivity.name, ParentActivity.parent_id)
-                .where(ParentActivity.id == parent_activity.id)
-                .cte(recursive=True, name='activity_tree')
-            )
-            
-            activity_tree_union = activity_tree.union_all(
-                select(ChildActivity.id, ChildActivity.name, ChildActivity.parent_id)
-                .select_from(ChildActivity)
-                .join(activity_tree, ChildActivity.parent_id == activity_tree.c.id)
-            )
-            
-            tree_result = session.execute(
-                select(activity_tree_union.c.id, activity_tree_union.c.name, activity_tree_union.c.parent_id)
-                .order_by(activity_tree_union.c.name)
-            ).all()
-            
             return {
                 'parent_activity': parent_name,
-                'tree': [{'id': str(row.id), 'name': row.name, 'parent_id': str(row.parent_id) if row.parent_id else None} 
-                        for row in tree_result]
+                'tree': [row._asdict() for row in tree]
             }
         else:
-            root_activities = session.execute(
-                select(ActivitiesModels).where(ActivitiesModels.parent_id.is_(None))
-                .order_by(ActivitiesModels.name)
-            ).scalars().all()
-            
             return {
-                'root_activities': [{'id': str(act.id), 'name': act.name} for act in root_activities]
+                'root_activities': [{'id': act.id, 'name': act.name} for act in await activity_roots(session)]
             }
             
     except HTTPException:
@@ -331,57 +683,3 @@ def get_activity_tree(
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail='Не удалось получить дерево видов деятельности')
-    
-@router.get('/organization/search')
-def search_organizations_by_name(
-    name: str = Query(..., description="Название организации для поиска"),
-    limit: int = Query(100, description="Максимальное количество результатов"),
-    session: Session = Depends(get_db)
-):
-    try:
-        query = (
-            select(OrganizationsModels, BuildingsModel)
-            .join(BuildingsModel, OrganizationsModels.buildings_id == BuildingsModel.id)
-            .where(OrganizationsModels.name.ilike(f"%{name}%"))
-            .limit(limit)
-        )
-        
-        results = session.execute(query).all()
-        
-        organizations_list = []
-        for org, building in results:
-            phones_query = select(OrganizationPhonesModels.phone_number).where(
-                OrganizationPhonesModels.organization_id == org.id
-            )
-            phones = session.execute(phones_query).scalars().all()
-            
-            activities_query = (
-                select(ActivitiesModels.name)
-                .select_from(OrganizationActivitiesModels)
-                .join(ActivitiesModels, OrganizationActivitiesModels.activity_id == ActivitiesModels.id)
-                .where(OrganizationActivitiesModels.organization_id == org.id)
-            )
-            activities = session.execute(activities_query).scalars().all()
-            
-            organization_data = {
-                'id': str(org.id),
-                'name': org.name,
-                'building': {
-                    'id': str(building.id),
-                    'address': building.address,
-                    'latitude_longitude': building.latitude_longitude
-                },
-                'phones': phones,
-                'activities': activities
-            }
-            organizations_list.append(organization_data)
-        
-        return {
-            'search_query': name,
-            'count': len(organizations_list),
-            'organizations': organizations_list
-        }
-        
-    except Exception as e:
-        print(f"Error: {e}")
-        raise HTTPException(status_code=500, detail='Не удалось выполнить поиск организаций')
\ No newline at end of file
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict, List, Optional, Set
+
+import asyncpg
+from sqlalchemy.engine.url import make_url
+
+from database import ASYNC_DATABASE_URL, async_session_maker
+from src.api.cache import response_cache
+from src.api.spatial_index import spatial_index
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'secunda_events'
+# id зданий в одном уведомлении: payload NOTIFY ограничен 8000 байт
+BUILDINGS_PER_MESSAGE = 150
+# при большем числе изменённых зданий получатели перестраивают индекс из БД целиком
+RELOAD_THRESHOLD = 5000
+# пауза перед повторным подключением, с
+RECONNECT_DELAY = 1.0
+# сколько при остановке ждать отправки накопленных событий, с
+STOP_FLUSH_TIMEOUT = 2.0
+
+
+class EventBroadcast:
+    '''
+    Рассылка изменений между процессами API через LISTEN/NOTIFY Postgres.
+
+    У каждого процесса одно отдельное от пула соединение: на нём он слушает
+    канал и в него же отправляет свои события. События процесса:
+      cache     — сброс кэша ответов (route: шаблон пути или '' — весь кэш);
+      buildings — здания ids изменены в БД: получатель перечитывает их
+                  координаты в spatial index и сбрасывает свой кэш;
+      reload    — изменений слишком много: индекс перестраивается целиком.
+    NOTIFY доставляется только после commit, а события отправляются после
+    commit записавшей транзакции, так что получатель читает уже новые данные.
+
+    Изменения, записанные до первого LISTEN (например, пока воркер
+    перезапускался), ловит сверка версии зданий после подключения
+    (spatial_index.ensure_fresh). Пока соединения нет, чужие события
+    теряются, поэтому после переподключения процесс перестраивает индекс
+    и сбрасывает кэш.
+    '''
+
+    def __init__(self, database_url: str, channel: str):
+        self.database_url = database_url
+        self.channel = channel
+        # метка отправителя: свои уведомления процесс тоже получает и пропускает
+        self.sender = uuid.uuid4().hex
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._jobs: Set[asyncio.Task] = set()
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _dsn(self) -> str:
+        return make_url(self.database_url).set(drivername='postgresql').render_as_string(hide_password=False)
+
+    def publish(self, event: Dict) -> None:
+        '''Ставит событие в очередь отправки. Вызывается и из синхронных хуков ORM; без start() ничего не делает.'''
+        if self._queue is None:
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, json.dumps({**event, 'sender': self.sender}))
+
+    def cache_invalidated(self, route_path: str) -> None:
+        self.publish({'kind': 'cache', 'route': route_path})
+
+    def buildings_changed(self, building_ids: List[uuid.UUID]) -> None:
+        if len(building_ids) > RELOAD_THRESHOLD:
+            self.publish({'kind': 'reload'})
+            return
+        for start in range(0, len(building_ids), BUILDINGS_PER_MESSAGE):
+            self.publish({'kind': 'buildings', 'ids': [str(i) for i in building_ids[start:start + BUILDINGS_PER_MESSAGE]]})
+
+    def start(self) -> None:
+        if make_url(self.database_url).get_backend_name() != 'postgresql':
+            logger.warning('рассылка событий между процессами работает только с Postgres')
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._refresh_lock = asyncio.Lock()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), STOP_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning('рассылка событий: не отправлено %d событий', self._queue.qsize())
+        self._queue = None
+        for task in (self._task, *self._jobs):
+            task.cancel()
+        await asyncio.gather(self._task, *self._jobs, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        unsent: Optional[str] = None
+        connected_before = False
+        while True:
+            try:
+                conn = await asyncpg.connect(self._dsn())
+            except (OSError, asyncpg.PostgresError) as er:
+                self.errors += 1
+                logger.error('рассылка событий: нет соединения с БД: %s', er)
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: lost.set())
+            lost_wait = asyncio.ensure_future(lost.wait())
+            try:
+                await conn.add_listener(self.channel, self._on_notify)
+                # изменения, записанные до LISTEN, видны уже по версии зданий в БД
+                self._schedule(self._reload() if connected_before else self._check())
+                connected_before = True
+                while True:
+                    if unsent is None:
+                        get = asyncio.ensure_future(self._queue.get())
+                        await asyncio.wait({get, lost_wait}, return_when=asyncio.FIRST_COMPLETED)
+                        if not get.done():
+                            get.cancel()
+                            self.errors += 1
+                            logger.error('рассылка событий: соединение закрыто сервером')
+                            break
+                        unsent = get.result()
+                    await conn.execute('SELECT pg_notify($1, $2)', self.channel, unsent)
+                    unsent = None
+                    self.sent += 1
+                    self._queue.task_done()
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as er:
+                self.errors += 1
+                logger.error('рассылка событий: соединение потеряно: %s', er)
+            finally:
+                lost_wait.cancel()
+                if not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning('рассылка событий: неразборчивое сообщение %r', payload[:200])
+            return
+        if event.get('sender') == self.sender:
+            return
+        self.received += 1
+        kind = event.get('kind')
+        if kind == 'cache':
+            response_cache.invalidate(event.get('route', ''), propagate=False)
+        elif kind == 'buildings':
+            self._schedule(self._refresh([uuid.UUID(i) for i in event['ids']]))
+        elif kind == 'reload':
+            self._schedule(self._reload())
+
+    def _schedule(self, coro) -> None:
+        task = self._loop.create_task(coro)
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+
+    async def _refresh(self, building_ids: List[uuid.UUID]) -> None:
+        async with self._refresh_lock:
+            try:
+                if spatial_index.ready:
+                    async with async_session_maker() as session:
+                        await spatial_index.refresh(session, building_ids)
+            except Exception as er:
+                self.errors += 1
+                logger.error('рассылка событий: не удалось обновить здания в spatial index: %s', er)
+            # кэш сбрасывается после индекса: иначе его могли бы заполнить ответы по старым координатам
+            response_cache.invalidate(propagate=False)
+
+    async def _check(self) -> None:
+        async with self._refresh_lock:
+            try:
+                async with async_session_maker() as session:
+                    rebuilt = await spatial_index.ensure_fresh(session)
+            except Exception as er:
+                self.errors += 1
+                logger.error('рассылка событий: не удалось сверить spatial index с БД: %s', er)
+                return
+            if rebuilt:
+                response_cache.invalidate(propagate=False)
+
+    async def _reload(self) -> None:
+        async with self._refresh_lock:
+            try:
+                async with async_session_maker() as session:
+                    await spatial_index.build(session)
+            except Exception as er:
+                self.errors += 1
+                logger.error('рассылка событий: не удалось перестроить spatial index: %s', er)
+            response_cache.invalidate(propagate=False)
+
+    def stats(self) -> Dict:
+        return {
+            'running': self.running,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'sent': self.sent,
+            'received': self.received,
+            'errors': self.errors,
+        }
+
+
+event_broadcast = EventBroadcast(ASYNC_DATABASE_URL, CHANNEL)
+
+response_cache.on_invalidate(event_broadcast.cache_invalidated)
+spatial_index.on_change(event_broadcast.buildings_changed)
@@ -0,0 +1,253 @@
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    media_type: str
+    expires_at: float
+
+
+class CacheBackend(ABC):
+    '''
+    Хранилище готовых ответов. Реализация по умолчанию — LRUCache в памяти
+    процесса; общий для нескольких процессов бэкенд (Redis, memcached)
+    подключается через тот же интерфейс.
+    '''
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: CacheEntry) -> None:
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str) -> int:
+        '''Удаляет записи с ключом, начинающимся с prefix; '' — все.'''
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class LRUCache(CacheBackend):
+    '''Ограниченный по числу записей LRU с TTL.'''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            if not prefix:
+                count = len(self._data)
+                self._data.clear()
+                return count
+            keys = [key for key in self._data if key.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self._data),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+class ResponseCache:
+    '''
+    Read-through кэш ответов GET-ручек.
+
+    Ключ — шаблон пути маршрута и нормализованные (уже разобранные FastAPI)
+    параметры запроса. В кэше лежит готовое тело ответа и его сильный ETag:
+    попадание отдаёт байты без повторной сериализации, а запрос с
+    совпадающим If-None-Match получает 304 без тела.
+
+    invalidate() сбрасывает только backend этого процесса: с LRUCache другие
+    процессы API (несколько воркеров) о нём не узнают. Чтобы разнести сброс,
+    к нему подписываются через on_invalidate, а полученный извне сброс
+    применяют через invalidate(..., propagate=False).
+    '''
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @staticmethod
+    def key(route_path: str, params: Dict) -> str:
+        query = urlencode(sorted((name, '' if value is None else str(value)) for name, value in params.items()))
+        return f'{route_path}?{query}'
+
+    def _respond(self, entry: CacheEntry, request: Request, status: str) -> Response:
+        headers = {'ETag': entry.etag, 'X-Cache': status}
+        if _etag_matches(request.headers.get('if-none-match'), entry.etag):
+            self._count('not_modified')
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+    @staticmethod
+    def _render(result, adapter: Optional[TypeAdapter]) -> Response:
+        # тот же путь, что у FastAPI для response_model: валидация и
+        # сериализация в pydantic-core, затем orjson
+        if isinstance(result, Response):
+            return result
+        if adapter is None:
+            return ORJSONResponse(content=jsonable_encoder(result))
+        return ORJSONResponse(content=adapter.dump_python(adapter.validate_python(result), mode='json'))
+
+    def cached(self, ttl: Optional[float] = None, exclude: tuple = ('session',)) -> Callable:
+        '''
+        Декоратор async-обработчика: кэширует ответы со статусом 200.
+        Тело сериализуется по аннотации возвращаемого типа (модели ответа).
+        Параметры из exclude (зависимости) в ключ не входят.
+        '''
+        def decorator(func):
+            signature = inspect.signature(func)
+            parameters = list(signature.parameters.values())
+            inject_request = 'request' not in signature.parameters
+            returns = signature.return_annotation
+            adapter = None if returns is inspect.Signature.empty else TypeAdapter(returns)
+            if inject_request:
+                parameters.append(inspect.Parameter('request', inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request: Request = kwargs.pop('request') if inject_request else kwargs['request']
+                params = {name: value for name, value in kwargs.items() if name not in exclude and name != 'request'}
+                route = request.scope.get('route')
+                key = self.key(route.path if route is not None else request.url.path, params)
+
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count('hits')
+                    return self._respond(entry, request, 'HIT')
+
+                self._count('misses')
+                response = self._render(await func(*args, **kwargs), adapter)
+                if response.status_code != 200:
+                    return response
+                body = bytes(response.body)
+                entry = CacheEntry(
+                    body=body,
+                    etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+                    media_type=response.media_type or 'application/json',
+                    expires_at=time.monotonic() + (self.ttl if ttl is None else ttl),
+                )
+                self.backend.set(key, entry)
+                return self._respond(entry, request, 'MISS')
+
+            wrapper.__signature__ = signature.replace(parameters=parameters)
+            return wrapper
+        return decorator
+
+    def on_invalidate(self, listener: Callable[[str], None]) -> None:
+        '''listener(route_path) вызывается после каждого сброса, выполненного в этом процессе.'''
+        self._listeners.append(listener)
+
+    def invalidate(self, route_path: str = '', propagate: bool = True) -> int:
+        '''
+        Сбрасывает кэш маршрута (шаблон пути, как в @router.get) или весь кэш.
+        propagate=False — сброс пришёл от другого процесса, слушатели не вызываются.
+        '''
+        self._count('invalidations')
+        count = self.backend.delete_prefix(f'{route_path}?' if route_path else '')
+        if propagate:
+            for listener in self._listeners:
+                listener(route_path)
+        return count
+
+    def stats(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'invalidations': self.invalidations,
+            **self.backend.stats(),
+        }
+
+
+response_cache = ResponseCache(LRUCache(RESPONSE_CACHE_MAX_ENTRIES), RESPONSE_CACHE_TTL)
+
+
+# любой commit с изменениями через ORM в этом процессе сбрасывает кэш целиком
+# (в других процессах — только через слушателей on_invalidate)
+
+_DIRTY_KEY = 'response_cache_dirty'
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_cache_dirty(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info[_DIRTY_KEY] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        response_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_cache_dirty(session):
+    session.info.pop(_DIRTY_KEY, None)
@@ -0,0 +1,153 @@
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.api.cache import response_cache
+from src.api.schemas import IngestOrganization
+from src.api.scripts import format_latlon_decimal
+from src.api.spatial_index import spatial_index
+from src.models.models import (
+    ActivitiesModels, BuildingsModel, OrganizationActivitiesModels, OrganizationPhonesModels, OrganizationsModels,
+)
+
+DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _rows_source(table, columns: Sequence[str]):
+    '''
+    Postgres: строки пачки как SELECT unnest(:col1), unnest(:col2), ... —
+    один параметр-массив на колонку, поэтому запрос один и тот же при любом
+    размере пачки: он не перекомпилируется и не упирается в лимит параметров.
+    '''
+    return select(*[
+        func.unnest(bindparam(column, type_=postgresql.ARRAY(table.c[column].type))).label(column)
+        for column in columns
+    ])
+
+
+def _columns(rows: List[Dict]) -> Dict[str, List]:
+    return {column: [row[column] for row in rows] for column in rows[0]}
+
+
+def _in(session: AsyncSession, column, values: List):
+    '''
+    column IN values; в Postgres — IN (SELECT unnest(массив)) одним параметром:
+    подзапрос планируется hash-соединением, а = ANY(массив) перебирал бы
+    массив для каждой строки таблицы.
+    '''
+    if session.bind.dialect.name == 'postgresql':
+        return column.in_(select(func.unnest(bindparam(None, values, type_=postgresql.ARRAY(column.type)))))
+    return column.in_(values)
+
+
+async def _write(session: AsyncSession, table, rows: List[Dict], key: Optional[str] = None,
+                 update: Sequence[str] = ()) -> None:
+    '''
+    INSERT строк пачки одним запросом; с key — INSERT ... ON CONFLICT (key) DO UPDATE.
+    В остальных БД тот же INSERT выполняется как executemany.
+    '''
+    if not rows:
+        return
+    dialect = session.bind.dialect.name
+    stmt = DIALECT_INSERTS[dialect](table) if key else table.insert()
+    if dialect == 'postgresql':
+        stmt = stmt.from_select(list(rows[0]), _rows_source(table, list(rows[0])))
+    if key:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: stmt.excluded[column] for column in update},
+        )
+    if dialect == 'postgresql':
+        await session.execute(stmt, _columns(rows))
+    else:
+        await session.execute(stmt, rows)
+
+
+async def ingest_batch(session: AsyncSession, organizations: List[IngestOrganization]) -> Dict:
+    '''
+    Upsert пачки организаций в одной транзакции.
+
+    Здания и организации обновляются по id, телефоны — по уникальному
+    phone_number (номер переходит к организации из пачки), виды деятельности
+    организаций из пачки заменяются целиком. Имена видов деятельности
+    разрешаются одним запросом на пачку; неизвестные имена пропускаются и
+    возвращаются в unknown_activities.
+    '''
+    started = time.perf_counter()
+
+    # внутри одного INSERT ... ON CONFLICT строка с тем же ключом допустима один раз: последняя побеждает
+    by_org = {org.id: org for org in organizations}
+    buildings = {org.building.id: org.building for org in by_org.values()}
+    phone_owner = {phone: org.id for org in by_org.values() for phone in org.phones}
+
+    names = {name for org in by_org.values() for name in org.activities}
+    activity_ids: Dict[str, List[uuid.UUID]] = {}
+    if names:
+        for activity_id, name in await session.execute(
+            select(ActivitiesModels.id, ActivitiesModels.name).where(_in(session, ActivitiesModels.name, list(names)))
+        ):
+            activity_ids.setdefault(name, []).append(activity_id)
+
+    links: Set[Tuple[uuid.UUID, uuid.UUID]] = set()
+    for org in by_org.values():
+        for name in org.activities:
+            links.update((org.id, activity_id) for activity_id in activity_ids.get(name, ()))
+
+    await _write(session, BuildingsModel.__table__, [
+        {
+            'id': b.id,
+            'address': b.address,
+            'latitude_longitude': format_latlon_decimal(b.latitude, b.longitude),
+            'latitude': b.latitude,
+            'longitude': b.longitude,
+        }
+        for b in buildings.values()
+    ], 'id', ['address', 'latitude_longitude', 'latitude', 'longitude'])
+
+    await _write(session, OrganizationsModels.__table__, [
+        {'id': org.id, 'buildings_id': org.building.id, 'name': org.name}
+        for org in by_org.values()
+    ], 'id', ['buildings_id', 'name'])
+
+    await _write(session, OrganizationPhonesModels.__table__, [
+        {'id': uuid.uuid4(), 'organization_id': org_id, 'phone_number': phone}
+        for phone, org_id in phone_owner.items()
+    ], 'phone_number', ['organization_id'])
+    # номера, которых больше нет в реестре у организаций пачки
+    stale_phones = delete(OrganizationPhonesModels).where(_in(session, OrganizationPhonesModels.organization_id, list(by_org)))
+    if phone_owner:
+        stale_phones = stale_phones.where(~_in(session, OrganizationPhonesModels.phone_number, list(phone_owner)))
+    await session.execute(stale_phones)
+
+    await session.execute(
+        delete(OrganizationActivitiesModels).where(_in(session, OrganizationActivitiesModels.organization_id, list(by_org)))
+    )
+    await _write(session, OrganizationActivitiesModels.__table__, [
+        {'id': uuid.uuid4(), 'organization_id': org_id, 'activity_id': activity_id}
+        for org_id, activity_id in links
+    ])
+
+    await session.commit()
+
+    # Core-запросы не проходят через события ORM, поэтому индекс и кэш обновляются явно
+    if spatial_index.ready:
+        for b in buildings.values():
+            spatial_index.upsert(b.id, b.latitude, b.longitude)
+    spatial_index.changed([b.id for b in buildings.values()])
+    response_cache.invalidate()
+
+    return {
+        'organizations': len(by_org),
+        'buildings': len(buildings),
+        'phones': len(phone_owner),
+        'activity_links': len(links),
+        'unknown_activities': sorted(names - activity_ids.keys()),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,369 @@
+import asyncio
+import glob
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from config import METRICS_DIR, METRICS_WRITE_INTERVAL
+from pool_stats import pool_stats
+from query_stats import RequestQueryStats, current_request_stats, query_totals
+from src.api.broadcast import event_broadcast
+from src.api.cache import response_cache
+from src.api.singleflight import query_flight
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограмм, с
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# границы корзин числа запросов к БД на HTTP-запрос
+QUERY_COUNT_BUCKETS: Tuple[float, ...] = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# метка route для запросов, не попавших ни в один маршрут: путь в метку не
+# пишется, чтобы случайные URL не раздували число серий
+UNMATCHED_ROUTE = '<unmatched>'
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, le: Optional[str] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.label_names, key)} {_number(value)}' for key, value in values)
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        # метки -> [счётчики корзин (последняя — +Inf), сумма, количество]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = '+Inf' if bound == float('inf') else _number(float(bound))
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class RequestMetrics:
+    '''Метрики HTTP-запросов по шаблону маршрута и статусу и их запросов к БД.'''
+
+    def __init__(self):
+        self.duration = Histogram(
+            'http_request_duration_seconds', 'Время обработки HTTP-запроса до конца тела ответа',
+            ('method', 'route', 'status'), LATENCY_BUCKETS,
+        )
+        self.db_queries = Histogram(
+            'http_request_db_queries', 'Число SQL-запросов на один HTTP-запрос',
+            ('method', 'route'), QUERY_COUNT_BUCKETS,
+        )
+        self.db_seconds = Counter(
+            'http_request_db_seconds_total', 'Время SQL-запросов HTTP-запросов', ('method', 'route'),
+        )
+        self.db_rows = Counter(
+            'http_request_db_rows_total', 'Строк, возвращённых или изменённых SQL-запросами', ('method', 'route'),
+        )
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestQueryStats) -> None:
+        self.duration.observe((method, route, status), seconds)
+        self.db_queries.observe((method, route), stats.queries)
+        if stats.queries:
+            self.db_seconds.inc((method, route), stats.db_seconds)
+            self.db_rows.inc((method, route), stats.rows)
+
+    def render(self) -> List[str]:
+        return self.duration.render() + self.db_queries.render() + self.db_seconds.render() + self.db_rows.render()
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware: время запроса по шаблону маршрута (/organization/{organization_id},
+    а не конкретный путь) и статусу, плюс запросы к БД, выполненные при его обработке.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats(scope)
+        token = current_request_stats.set(stats)
+        # необработанное исключение до начала ответа ServerErrorMiddleware превратит в 500
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            request_metrics.observe(scope['method'], stats.route() or UNMATCHED_ROUTE, status, elapsed, stats)
+
+
+def _pool_metrics() -> List[str]:
+    snapshots = {name: stats.snapshot() for name, stats in pool_stats.items()}
+    lines = []
+    for metric, key, kind, help in (
+        ('db_pool_checkouts_total', 'checkouts', 'counter', 'Выдано соединений из пула'),
+        ('db_pool_timeouts_total', 'timeouts', 'counter', 'Таймаутов ожидания соединения'),
+        ('db_pool_invalidations_total', 'invalidations', 'counter', 'Инвалидированных соединений'),
+        ('db_pool_size', 'size', 'gauge', 'Размер пула'),
+        ('db_pool_checked_out', 'checked_out', 'gauge', 'Соединений выдано сейчас'),
+        ('db_pool_overflow', 'overflow', 'gauge', 'Соединений сверх pool_size сейчас'),
+    ):
+        lines += [f'# HELP {metric} {help}', f'# TYPE {metric} {kind}']
+        lines += [f'{metric}{{pool="{name}"}} {data[key]}' for name, data in snapshots.items() if key in data]
+
+    lines += [
+        '# HELP db_pool_wait_seconds Ожидание свободного соединения в пуле, без открытия нового',
+        '# TYPE db_pool_wait_seconds histogram',
+    ]
+    for name, data in snapshots.items():
+        wait = data['wait_ms']
+        for bound, cumulative in wait['buckets'].items():
+            le = bound if bound == '+Inf' else _number(float(bound) / 1000)
+            lines.append(f'db_pool_wait_seconds_bucket{{pool="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'db_pool_wait_seconds_sum{{pool="{name}"}} {_number(wait["sum"] / 1000)}')
+        lines.append(f'db_pool_wait_seconds_count{{pool="{name}"}} {wait["count"]}')
+    return lines
+
+
+def _flat_metrics(prefix: str, values: Dict, counters: Tuple[str, ...], help: str) -> List[str]:
+    lines = []
+    for key, value in values.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        metric = f'{prefix}_{key}_total' if key in counters else f'{prefix}_{key}'
+        lines += [
+            f'# HELP {metric} {help}: {key}',
+            f'# TYPE {metric} {"counter" if key in counters else "gauge"}',
+            f'{metric} {_number(value)}',
+        ]
+    return lines
+
+
+def render_metrics() -> str:
+    lines = request_metrics.render()
+    lines += [
+        '# HELP db_queries_total SQL-запросов асинхронного движка', '# TYPE db_queries_total counter',
+        f'db_queries_total {query_totals.queries}',
+        '# HELP db_query_seconds_total Время SQL-запросов асинхронного движка', '# TYPE db_query_seconds_total counter',
+        f'db_query_seconds_total {_number(query_totals.db_seconds)}',
+    ]
+    lines += _pool_metrics()
+    lines += _flat_metrics(
+        'response_cache', response_cache.stats(),
+        ('hits', 'misses', 'not_modified', 'invalidations', 'evictions', 'expirations'), 'Кэш ответов',
+    )
+    lines += _flat_metrics('singleflight', query_flight.stats(), ('executions', 'coalesced'), 'Single-flight запросов к БД')
+    lines += _flat_metrics('event_broadcast', event_broadcast.stats(), ('sent', 'received', 'errors'), 'Рассылка событий между процессами')
+    return '\n'.join(lines) + '\n'
+
+
+# --- метрики нескольких процессов (run_prod.py --workers N) ---
+# Каждый процесс пишет свои метрики в METRICS_DIR/<pid>-<метка>.prom, /metrics
+# любого процесса складывает файлы всех. Счётчики и гистограммы суммируются по
+# всем файлам, в том числе завершившихся процессов, чтобы сумма не убывала при
+# перезапуске воркера; gauge — только по живым процессам. Метрики других
+# процессов отстают не больше чем на METRICS_WRITE_INTERVAL.
+
+METRICS_FILE_SUFFIX = '.prom'
+
+
+def _parse_number(value: str) -> float:
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def merge_metrics(sources: Iterable[Tuple[str, bool]]) -> str:
+    '''
+    Складывает метрики в текстовом формате Prometheus от нескольких
+    процессов: sources — пары (текст, процесс жив). Серии с одинаковыми
+    именем и метками суммируются; gauge завершившихся процессов пропускаются.
+    '''
+    helps: Dict[str, str] = {}
+    kinds: Dict[str, str] = {}
+    families: Dict[str, Dict[str, float]] = {}
+    for text, alive in sources:
+        family = None
+        for line in text.splitlines():
+            if line.startswith('# HELP '):
+                family = line.split(' ', 3)[2]
+                helps.setdefault(family, line)
+                families.setdefault(family, {})
+            elif line.startswith('# TYPE '):
+                _, _, family, kind = line.split(' ', 3)
+                kinds.setdefault(family, kind)
+                families.setdefault(family, {})
+            elif line and family is not None:
+                if kinds.get(family) == 'gauge' and not alive:
+                    continue
+                series, value = line.rsplit(' ', 1)
+                samples = families[family]
+                samples[series] = samples.get(series, 0) + _parse_number(value)
+    lines = []
+    for family, samples in families.items():
+        if family in helps:
+            lines.append(helps[family])
+        lines.append(f'# TYPE {family} {kinds.get(family, "untyped")}')
+        lines.extend(f'{series} {_number(value)}' for series, value in samples.items())
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# метка процесса в имени файла метрик: pid может достаться перезапущенному
+# воркеру, и тогда его файл затёр бы накопленные счётчики завершившегося
+_instance: Optional[Tuple[int, str]] = None
+
+
+def _metrics_path(directory: str) -> str:
+    global _instance
+    if _instance is None or _instance[0] != os.getpid():
+        _instance = (os.getpid(), uuid.uuid4().hex[:12])
+    return os.path.join(directory, f'{_instance[0]}-{_instance[1]}{METRICS_FILE_SUFFIX}')
+
+
+def write_metrics(directory: str) -> None:
+    '''метрики этого процесса в directory/<pid>-<метка>.prom; файл подменяется целиком'''
+    path = _metrics_path(directory)
+    with open(path + '.tmp', 'w') as f:
+        f.write(render_metrics())
+    os.replace(path + '.tmp', path)
+
+
+def collect_metrics(directory: str, write_interval: float = METRICS_WRITE_INTERVAL) -> str:
+    '''
+    метрики всех процессов, записавших файлы в directory, включая свежие
+    этого процесса. Процесс файла считается живым, если его pid существует,
+    файл обновлялся в последние три write_interval и он самый новый из
+    файлов этого pid; файлы завершившихся процессов остаются и дают только
+    свои счётчики
+    '''
+    write_metrics(directory)
+    files = []
+    for path in glob.glob(os.path.join(directory, f'*{METRICS_FILE_SUFFIX}')):
+        pid = os.path.basename(path).split('-', 1)[0]
+        try:
+            with open(path) as f:
+                text = f.read()
+            modified = os.path.getmtime(path)
+        except OSError:
+            continue
+        files.append((path, int(pid) if pid.isdigit() else None, modified, text))
+
+    newest: Dict[int, float] = {}
+    for _, pid, modified, _ in files:
+        if pid is not None:
+            newest[pid] = max(newest.get(pid, modified), modified)
+    fresh_after = time.time() - 3 * write_interval
+    sources = [
+        (text, pid is not None and modified == newest[pid] and modified >= fresh_after and _pid_alive(pid))
+        for _, pid, modified, text in sorted(files)
+    ]
+    return merge_metrics(sources)
+
+
+async def write_metrics_periodically(directory: str, interval: float) -> None:
+    '''фоновая задача процесса: обновляет его файл метрик, последний раз — при остановке'''
+    try:
+        while True:
+            try:
+                write_metrics(directory)
+            except OSError as er:
+                logger.error('не удалось записать метрики в %s: %s', directory, er)
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            write_metrics(directory)
+        except OSError:
+            pass
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    '''метрики в текстовом формате Prometheus; при METRICS_DIR — сумма по всем процессам API'''
+    text = collect_metrics(METRICS_DIR) if METRICS_DIR else render_metrics()
+    return PlainTextResponse(text, media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,63 @@
+import base64
+import json
+import math
+import uuid
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: List[Any]) -> str:
+    '''Непрозрачный курсор keyset-пагинации: последний ключ сортировки страницы.'''
+    raw = json.dumps([str(v) if not isinstance(v, (int, float, str)) else v for v in values],
+                     separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    '''Разбирает курсор из encode_cursor; None, если курсор не передан.'''
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Некорректный cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail='Некорректный cursor')
+    return values
+
+
+def decode_name_id_cursor(cursor: Optional[str]) -> Optional[Tuple[str, uuid.UUID]]:
+    '''Курсор списков организаций, отсортированных по (name, id).'''
+    values = decode_cursor(cursor, 2)
+    if values is None:
+        return None
+    try:
+        return str(values[0]), uuid.UUID(values[1])
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail='Некорректный cursor')
+
+
+def decode_score_id_cursor(cursor: Optional[str]) -> Optional[Tuple[float, uuid.UUID]]:
+    '''Курсор результатов, отсортированных по (score desc, id): score — конечное число.'''
+    values = decode_cursor(cursor, 2)
+    if values is None:
+        return None
+    score = values[0]
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not math.isfinite(score):
+        raise HTTPException(status_code=400, detail='Некорректный cursor')
+    try:
+        return float(score), uuid.UUID(values[1])
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail='Некорректный cursor')
+
+
+def split_page(rows: Sequence, limit: int, key: Callable[[Any], List[Any]]) -> Tuple[Sequence, Optional[str]]:
+    '''
+    Страница из выборки с LIMIT limit + 1: первые limit строк и курсор по
+    ключу последней из них, если за ней есть ещё строки.
+    '''
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,218 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from config import MULTI_WORKER, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_STORE_SIZE, PROFILE_TOKEN
+from query_stats import current_request_stats
+
+# профилирование включается заголовком со значением PROFILE_TOKEN. Только
+# заголовком: параметр запроса попал бы в access-логи, логи прокси и историю браузера
+PROFILE_HEADER = 'x-profile-token'
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# кадры, время в которых считается сериализацией ответа (файл, функция)
+SERIALIZATION_FRAMES = {
+    ('fastapi/routing.py', 'serialize_response'),
+    ('fastapi/encoders.py', 'jsonable_encoder'),
+    ('fastapi/responses.py', 'render'),
+    ('starlette/responses.py', 'render'),
+    ('pydantic/type_adapter.py', 'dump_python'),
+    ('src/api/cache.py', '_render'),
+}
+# пакеты драйвера БД: время на стороне клиента (сборка запроса, разбор строк)
+DB_PACKAGES = ('sqlalchemy/', 'asyncpg/')
+
+
+def _short_path(filename: str) -> str:
+    '''путь файла относительно проекта или site-packages, с "/" как разделителем'''
+    marker = 'site-packages' + os.sep
+    if filename.startswith(_PROJECT_ROOT):
+        filename = os.path.relpath(filename, _PROJECT_ROOT)
+    elif marker in filename:
+        filename = filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return filename.replace(os.sep, '/')
+
+
+# пока идёт хотя бы одно профилирование, интервал переключения GIL уменьшается
+# до шага сэмплера: с умолчательными 5 мс занятый event loop не отдаёт GIL
+# сэмплеру чаще, и выборок получается в несколько раз меньше
+_switch_lock = threading.Lock()
+_active_samplers = 0
+_saved_switch_interval = sys.getswitchinterval()
+
+
+class StackSampler(threading.Thread):
+    '''
+    Раз в interval снимает стек потока thread_id через sys._current_frames()
+    и считает одинаковые стеки. Поток event loop общий для всех запросов,
+    поэтому в профиль попадают и одновременно выполняемые чужие запросы.
+    '''
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name='request-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((_short_path(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self) -> None:
+        global _active_samplers, _saved_switch_interval
+        with _switch_lock:
+            if _active_samplers == 0:
+                _saved_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(_saved_switch_interval, self.interval))
+            _active_samplers += 1
+        super().start()
+
+    def stop(self) -> Counter:
+        global _active_samplers
+        self._done.set()
+        self.join()
+        with _switch_lock:
+            _active_samplers -= 1
+            if _active_samplers == 0:
+                sys.setswitchinterval(_saved_switch_interval)
+        return self.samples
+
+
+def _category(stack: Tuple[Tuple[str, str], ...]) -> str:
+    leaf_file, _ = stack[-1]
+    if leaf_file.endswith('selectors.py'):
+        # event loop ждёт ввода-вывода: ответа БД или клиента
+        return 'idle'
+    if any(frame in SERIALIZATION_FRAMES for frame in stack):
+        return 'serialization'
+    if any(path.startswith(DB_PACKAGES) for path, _ in stack):
+        return 'db_client'
+    return 'python'
+
+
+def collapsed(samples: Counter) -> str:
+    '''стеки в формате collapsed stacks (flamegraph.pl, speedscope): "кадр;кадр;кадр count"'''
+    return ''.join(
+        ';'.join(f'{name} ({path})' for path, name in stack) + f' {count}\n'
+        for stack, count in samples.most_common()
+    )
+
+
+class ProfileStore:
+    '''Последние size профилей запросов в памяти процесса.'''
+
+    def __init__(self, size: int):
+        self._profiles: Deque[Dict] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict) -> int:
+        with self._lock:
+            profile['id'] = next(self._ids)
+            self._profiles.append(profile)
+        return profile['id']
+
+    def get(self, profile_id: int) -> Optional[Dict]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile['id'] == profile_id), None)
+
+    def summaries(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {key: value for key, value in profile.items() if key != 'samples'}
+                for profile in reversed(self._profiles)
+            ]
+
+
+profile_store = ProfileStore(PROFILE_STORE_SIZE)
+
+
+async def _profile(request: Request, handler, route_path: str) -> Response:
+    stats = current_request_stats.get()
+    queries_before = stats.queries if stats is not None else 0
+    db_before = stats.db_seconds if stats is not None else 0.0
+
+    sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        response = await handler(request)
+    finally:
+        wall = time.perf_counter() - started
+        samples = sampler.stop()
+
+    total = sum(samples.values())
+    by_category = Counter()
+    for stack, count in samples.items():
+        by_category[_category(stack)] += count
+    # доли выборок переводятся во время запроса: фактический шаг сэмплера плавает
+    breakdown_ms = {
+        category: round(wall * 1000 * by_category[category] / total, 3) if total else 0.0
+        for category in ('python', 'serialization', 'db_client', 'idle')
+    }
+    profile = {
+        'route': route_path,
+        'method': request.method,
+        'url': str(request.url),
+        'status': response.status_code,
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'wall_ms': round(wall * 1000, 3),
+        # время SQL-запросов по событиям движка, включая ожидание ответа сервера
+        'db_ms': round(((stats.db_seconds if stats is not None else 0.0) - db_before) * 1000, 3),
+        'db_queries': (stats.queries if stats is not None else 0) - queries_before,
+        'samples_total': total,
+        'breakdown_ms': breakdown_ms,
+        'samples': samples,
+    }
+    if not MULTI_WORKER:
+        # при нескольких воркерах /admin/profiles выключен: профиль остался бы
+        # в случайном процессе, поэтому его разбивка есть только в Server-Timing
+        response.headers['X-Profile-Id'] = str(profile_store.add(profile))
+    response.headers['Server-Timing'] = ', '.join(
+        [f'total;dur={profile["wall_ms"]}', f'db;dur={profile["db_ms"]}']
+        + [f'{category};dur={ms}' for category, ms in breakdown_ms.items()]
+    )
+    return response
+
+
+class ProfilingRoute(APIRoute):
+    '''
+    Маршрут, обработчик которого профилируется по запросу: заголовок
+    X-Profile-Token со значением PROFILE_TOKEN. Профиль (стеки и разбивка
+    времени) сохраняется в profile_store, его id возвращается в
+    X-Profile-Id (кроме MULTI_WORKER), разбивка — в Server-Timing. Без заголовка добавляется
+    только его проверка, без PROFILE_TOKEN — ничего.
+    '''
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route_path = self.path
+
+        async def route_handler(request: Request) -> Response:
+            if PROFILE_TOKEN:
+                token = request.headers.get(PROFILE_HEADER)
+                # байты: compare_digest не принимает строки с не-ASCII символами
+                if token is not None and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+                    return await _profile(request, handler, route_path)
+            return await handler(request)
+
+        return route_handler
@@ -0,0 +1,190 @@
+import uuid
+from typing import Annotated, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+# Модели ответов API. FastAPI валидирует и сериализует по ним ответ в
+# pydantic-core, минуя jsonable_encoder; uuid.UUID отдаётся строкой без str() в обработчиках.
+
+
+class OrgInBuilding(BaseModel):
+    address: str
+    latitude_longitude: str
+    org_name: str
+
+
+class OrgInBuildingPage(BaseModel):
+    count: int
+    next_cursor: Optional[str]
+    organizations: List[OrgInBuilding]
+
+
+class OrgShort(BaseModel):
+    org_id: uuid.UUID
+    org_name: str
+
+
+class OrgShortPage(BaseModel):
+    count: int
+    next_cursor: Optional[str]
+    organizations: List[OrgShort]
+
+
+class GeoCenter(BaseModel):
+    building_id: Optional[uuid.UUID]
+    address: Optional[str]
+    latitude: float
+    longitude: float
+
+
+class GeoBuilding(BaseModel):
+    building_id: uuid.UUID
+    address: Optional[str]
+    latitude: float
+    longitude: float
+    distance_m: float
+    organizations: List[OrgShort]
+
+
+class GeoSearchByCenterResponse(BaseModel):
+    center: GeoCenter
+    radius_m: float
+    count: int
+    results: List[GeoBuilding]
+
+
+class GeoNearestResponse(BaseModel):
+    center: GeoCenter
+    k: int
+    max_radius_m: Optional[float]
+    count: int
+    results: List[GeoBuilding]
+
+
+class BBox(BaseModel):
+    min_lat: float
+    max_lat: float
+    min_lon: float
+    max_lon: float
+
+
+class BBoxBuilding(BaseModel):
+    building_id: uuid.UUID
+    address: str
+    latitude: float
+    longitude: float
+    organizations: List[OrgShort]
+
+
+class GeoSearchByBBoxResponse(BaseModel):
+    bbox: BBox
+    count: int
+    results: List[BBoxBuilding]
+
+
+class BuildingShort(BaseModel):
+    id: uuid.UUID
+    address: str
+    latitude_longitude: str
+
+
+class OrganizationDetail(BaseModel):
+    id: uuid.UUID
+    name: str
+    building: BuildingShort
+    phones: List[str]
+    activities: List[str]
+
+
+class OrganizationBatchRequest(BaseModel):
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=500)
+
+
+class OrganizationBatchResponse(BaseModel):
+    count: int
+    organizations: List[OrganizationDetail]
+    missing: List[uuid.UUID]
+
+
+class OrganizationSearchResponse(BaseModel):
+    search_query: str
+    count: int
+    next_cursor: Optional[str]
+    organizations: List[OrganizationDetail]
+
+
+class OrgWithActivities(BaseModel):
+    id: uuid.UUID
+    name: str
+    address: str
+    activities: List[str]
+
+
+class ActivityTreeSearchResponse(BaseModel):
+    search_activity: str
+    count: int
+    next_cursor: Optional[str]
+    organizations: List[OrgWithActivities]
+
+
+class ActivityNode(BaseModel):
+    id: uuid.UUID
+    name: str
+    parent_id: Optional[uuid.UUID]
+
+
+class RootActivity(BaseModel):
+    id: uuid.UUID
+    name: str
+
+
+class ActivitySubtreeResponse(BaseModel):
+    parent_activity: str
+    tree: List[ActivityNode]
+
+
+class RootActivitiesResponse(BaseModel):
+    root_activities: List[RootActivity]
+
+
+ActivityTreeResponse = Union[ActivitySubtreeResponse, RootActivitiesResponse]
+
+
+class IngestBuilding(BaseModel):
+    id: uuid.UUID
+    address: str
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+
+# organization_phones.phone_number — String(15): длинный номер должен дать 422
+# до записи, а не ошибку БД посреди загрузки, когда прошлые пачки уже зафиксированы
+PhoneNumber = Annotated[str, Field(min_length=1, max_length=15)]
+
+
+class IngestOrganization(BaseModel):
+    id: uuid.UUID
+    name: str
+    building: IngestBuilding
+    phones: List[PhoneNumber] = Field(default_factory=list, max_length=10)
+    activities: List[str] = Field(default_factory=list, max_length=20)
+
+
+class IngestRequest(BaseModel):
+    organizations: List[IngestOrganization] = Field(max_length=50_000)
+
+
+class IngestBatchStats(BaseModel):
+    organizations: int
+    buildings: int
+    phones: int
+    activity_links: int
+    unknown_activities: List[str]
+    elapsed_ms: float
+
+
+class IngestResponse(BaseModel):
+    organizations: int
+    elapsed_ms: float
+    batches: List[IngestBatchStats]
@@ -1,6 +1,8 @@
     
 import math
-from typing import Tuple
+from typing import Optional, Tuple
+
+import numpy as np
 
 def parse_latlon_decimal(value: str) -> Tuple[float, float]:
     try:
@@ -10,6 +12,11 @@ def parse_latlon_decimal(value: str) -> Tuple[float, float]:
         raise ValueError(f"Invalid lat/lon format: {value}") from e
 
 
+def format_latlon_decimal(lat: float, lon: float) -> str:
+    """Обратное к parse_latlon_decimal: "lat,lon"."""
+    return f"{lat},{lon}"
+
+
 def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Возвращает расстояние в метрах между двумя точками (Haversine)."""
     R = 6371000.0
@@ -26,4 +33,44 @@ def bbox_for_radius(lat: float, lon: float, radius_m: float):
     R = 6371000.0
     lat_delta = (radius_m / R) * (180.0 / math.pi)
     lon_delta = (radius_m / R) * (180.0 / math.pi) / max(math.cos(math.radians(lat)), 1e-6)
-    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
\ No newline at end of file
+    return lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta
+
+# --- векторизованный расчёт расстояний (numpy) ---
+# haversine_m_batch считает ту же формулу, что haversine_m, в float64, но
+# разности координат берёт в радианах, поэтому результаты расходятся на ошибку
+# округления: не больше HAVERSINE_BATCH_ATOL + HAVERSINE_BATCH_RTOL * расстояние
+# (tests/test_geo.py). Больше всего — у почти диаметрально противоположных точек:
+# там haversine плохо обусловлена (a близко к 1), и разница доходит до ~2 см.
+
+EARTH_RADIUS_M = 6371000.0
+
+HAVERSINE_BATCH_ATOL = 1e-6
+HAVERSINE_BATCH_RTOL = 1e-8
+
+
+def haversine_m_batch(lat: float, lon: float, lat_rad: np.ndarray, lon_rad: np.ndarray,
+                      cos_lat: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Расстояния в метрах от точки (lat, lon) в градусах до массива точек,
+    заданных в радианах. cos_lat — заранее посчитанный cos(lat_rad), если есть.
+    """
+    phi1 = math.radians(lat)
+    lambda1 = math.radians(lon)
+    if cos_lat is None:
+        cos_lat = np.cos(lat_rad)
+    a = np.sin((lat_rad - phi1) / 2) ** 2 + math.cos(phi1) * cos_lat * np.sin((lon_rad - lambda1) / 2) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def radius_top_k(distances: np.ndarray, radius_m: float, k: Optional[int] = None) -> np.ndarray:
+    """
+    Индексы элементов distances, попавших в радиус, по возрастанию расстояния.
+    При заданном k возвращается не больше k ближайших (argpartition, без полной сортировки).
+    """
+    idx = np.flatnonzero(distances <= radius_m)
+    if k is not None and k < idx.size:
+        if k <= 0:
+            return idx[:0]
+        idx = idx[np.argpartition(distances[idx], k)[:k]]
+    return idx[np.argsort(distances[idx], kind='stable')]
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    '''
+    Склейка одинаковых одновременных вызовов для потоков (синхронные
+    обработчики в thread pool, скрипты): пока функция с данным ключом
+    выполняется, остальные вызовы с тем же ключом ждут её и получают тот же
+    результат или то же исключение. Результат общий — его нельзя изменять.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> Dict:
+        return {'in_flight': len(self._calls), 'executions': self.executions, 'coalesced': self.coalesced}
+
+
+class AsyncSingleFlight:
+    '''
+    То же для asyncio. Выполнение идёт в отдельной задаче, которую каждый
+    вызывающий ждёт через shield: отмена одного запроса (например, клиент
+    отключился) не прерывает выполнение для остальных. Поэтому функция не
+    должна зависеть от ресурсов конкретного запроса — сессию БД она
+    открывает сама.
+    '''
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tasks[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {'in_flight': len(self._tasks), 'executions': self.executions, 'coalesced': self.coalesced}
+
+
+# общий экземпляр для запросов к БД из обработчиков API
+query_flight = AsyncSingleFlight()
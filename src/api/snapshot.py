@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from src.api.activity_catalog import Activity, activity_catalog
+from src.api.spatial_index import BUILDINGS_VERSION, SNAPSHOT_ARRAYS, spatial_index
+from src.models.models import ActivitiesModels, BuildingsModel, CatalogVersionsModels
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+
+META_FILE = 'meta.json'
+ACTIVITIES_FILE = 'activities.json'
+
+
+def _version(session, name: str) -> Optional[int]:
+    return session.execute(
+        select(CatalogVersionsModels.version).where(CatalogVersionsModels.name == name)
+    ).scalar_one_or_none()
+
+
+def _write(directory: str) -> Dict:
+    from database import session_maker
+
+    with session_maker() as session:
+        # версия раньше зданий, как в SpatialIndex.build
+        buildings_version = _version(session, BUILDINGS_VERSION)
+        buildings = session.execute(
+            select(BuildingsModel.id, BuildingsModel.latitude, BuildingsModel.longitude)
+            .where(BuildingsModel.latitude.isnot(None), BuildingsModel.longitude.isnot(None))
+        ).all()
+        activities = session.execute(
+            select(ActivitiesModels.id, ActivitiesModels.name, ActivitiesModels.parent_id)
+        ).all()
+        activity_version = _version(session, 'activities')
+
+    for name, array in spatial_index.snapshot_arrays(buildings).items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+    with open(os.path.join(directory, ACTIVITIES_FILE), 'w') as f:
+        json.dump(
+            [[str(a.id), a.name, str(a.parent_id) if a.parent_id is not None else None] for a in activities],
+            f, ensure_ascii=False,
+        )
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cell_deg': spatial_index.cell_deg,
+        'buildings': len(buildings),
+        'activities': len(activities),
+        'activity_version': activity_version,
+        'buildings_version': buildings_version,
+    }
+    # meta.json пишется последним: по нему load_snapshot считает снимок целым
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def build_snapshot(directory: str) -> Dict:
+    '''
+    Снимок справочников из БД для процессов API: массивы spatial index
+    (.npy, отображаются в память) и справочник видов деятельности.
+    Собирается во временном каталоге и подменяет directory переименованием;
+    уже отображённые воркерами файлы прежнего снимка остаются доступны им
+    до закрытия.
+    '''
+    directory = os.path.abspath(directory)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    tmp = f'{directory}.tmp-{os.getpid()}'
+    old = f'{directory}.old-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        meta = _write(tmp)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info('снимок %s: %d зданий, %d видов деятельности', directory, meta['buildings'], meta['activities'])
+    return meta
+
+
+def read_meta(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('format') == SNAPSHOT_FORMAT else None
+
+
+def load_snapshot(directory: str) -> bool:
+    '''
+    Загружает spatial index и справочник видов деятельности из снимка.
+    Массивы индекса отображаются только для чтения (mmap_mode='r'): страницы
+    общие для всех воркеров через page cache. Справочник видов деятельности
+    мал и разбирается в каждом процессе; его свежесть дальше сверяется с БД
+    по catalog_versions, как обычно. Индекс с БД сверяет вызывающий
+    (spatial_index.ensure_fresh): снимок мог устареть. False — снимка нет
+    или он другого формата.
+    '''
+    meta = read_meta(directory)
+    if meta is None:
+        return False
+    arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in SNAPSHOT_ARRAYS}
+    # снимки без buildings_version считаются устаревшими при сверке с БД
+    spatial_index.load_shared(arrays, meta['cell_deg'], meta.get('buildings_version'))
+
+    with open(os.path.join(directory, ACTIVITIES_FILE)) as f:
+        activities = json.load(f)
+    activity_catalog.load(
+        (
+            Activity(uuid.UUID(id_), name, uuid.UUID(parent_id) if parent_id is not None else None)
+            for id_, name, parent_id in activities
+        ),
+        meta['activity_version'],
+    )
+    logger.info(
+        'снимок %s от %s: %d зданий, %d видов деятельности',
+        directory, meta['created_at'], meta['buildings'], meta['activities'],
+    )
+    return True
+
+
+def snapshot_is_current(meta: Dict) -> bool:
+    '''версии зданий и справочника в снимке совпадают с БД (для run_prod.py --reuse-snapshot)'''
+    from database import session_maker
+
+    with session_maker() as session:
+        return (
+            meta.get('buildings_version') == _version(session, BUILDINGS_VERSION)
+            and meta.get('activity_version') == _version(session, 'activities')
+        )
@@ -0,0 +1,509 @@
+import itertools
+import logging
+import math
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.api.scripts import EARTH_RADIUS_M, bbox_for_radius, haversine_m_batch, radius_top_k
+from src.models.models import BuildingsModel, CatalogVersionsModels
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[int, int]
+
+_LOW_MASK = (1 << 64) - 1
+
+# строка catalog_versions со счётчиком изменений buildings (его увеличивает триггер)
+BUILDINGS_VERSION = 'buildings'
+
+# массивы снимка индекса (см. SpatialIndex.snapshot_arrays)
+SNAPSHOT_ARRAYS = (
+    'id_hi', 'id_lo', 'lat', 'lon', 'lat_rad', 'lon_rad', 'cos_lat', 'cell_keys', 'cell_offsets', 'cell_slots',
+)
+
+
+class _SortedIds:
+    '''
+    id зданий снимка: старшие и младшие 64 бита UUID в двух массивах,
+    упорядоченных по id, так что номер слота ищется бинарным поиском. Заменяет
+    и список _ids, и словарь _slots, не создавая по объекту на здание.
+    '''
+
+    def __init__(self, hi: np.ndarray, lo: np.ndarray):
+        self.hi = hi
+        self.lo = lo
+
+    def __len__(self) -> int:
+        return len(self.hi)
+
+    def __getitem__(self, slot: int) -> uuid.UUID:
+        return uuid.UUID(int=(int(self.hi[slot]) << 64) | int(self.lo[slot]))
+
+    def __iter__(self):
+        for hi, lo in zip(self.hi.tolist(), self.lo.tolist()):
+            yield uuid.UUID(int=(hi << 64) | lo)
+
+    def get(self, building_id: uuid.UUID) -> Optional[int]:
+        hi, lo = np.uint64(building_id.int >> 64), np.uint64(building_id.int & _LOW_MASK)
+        left = int(np.searchsorted(self.hi, hi, 'left'))
+        right = int(np.searchsorted(self.hi, hi, 'right'))
+        slot = left + int(np.searchsorted(self.lo[left:right], lo))
+        return slot if slot < right and self.lo[slot] == lo else None
+
+
+def _candidates(buckets: List) -> np.ndarray:
+    '''слоты из ячеек: множества у изменяемого индекса, срезы массива у снимка'''
+    if isinstance(buckets[0], np.ndarray):
+        return np.concatenate(buckets)
+    return np.fromiter(itertools.chain.from_iterable(buckets), dtype=np.int64)
+
+
+class SpatialIndex:
+    '''
+    Сеточный индекс зданий по координатам.
+
+    Плоскость lat/lon разбита на квадратные ячейки размером cell_deg градусов,
+    в каждой ячейке хранятся номера слотов зданий. Координаты лежат в
+    непрерывных массивах float64 (градусы, радианы и cos широты посчитаны
+    заранее), поэтому точная проверка расстояния для всех кандидатов из
+    ячеек bbox выполняется одним векторным проходом.
+
+    Индекс можно загрузить из снимка (load_shared): массивы тогда отображены
+    из файлов только для чтения и общие для всех процессов, а первое
+    изменение копирует их в память процесса.
+    '''
+
+    def __init__(self, cell_deg: float = 0.01, capacity: int = 1024):
+        self.cell_deg = cell_deg
+        self.ready = False
+        # версия зданий в catalog_versions, с которой индекс собран или снят в снимок
+        self.version: Optional[int] = None
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[List[uuid.UUID]], None]] = []
+        self._reset(capacity)
+
+    def _reset(self, capacity: int) -> None:
+        self._ids: List[Optional[uuid.UUID]] = [None] * capacity
+        self._slots: Dict[uuid.UUID, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._lat = np.zeros(capacity, dtype=np.float64)
+        self._lon = np.zeros(capacity, dtype=np.float64)
+        self._lat_rad = np.zeros(capacity, dtype=np.float64)
+        self._lon_rad = np.zeros(capacity, dtype=np.float64)
+        self._cos_lat = np.zeros(capacity, dtype=np.float64)
+        self._cells: Dict[Cell, Set[int]] = {}
+        # границы занятых ячеек (min_i, max_i, min_j, max_j); при удалениях не сужаются
+        self._extent: Optional[Tuple[int, int, int, int]] = None
+        # массивы отображены из снимка и не изменяются на месте
+        self._shared = False
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _cell(self, lat: float, lon: float) -> Cell:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def _grow(self) -> None:
+        capacity = max(2 * len(self._ids), 1024)
+        for name in ('_lat', '_lon', '_lat_rad', '_lon_rad', '_cos_lat'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=np.float64)
+            new[:old.size] = old
+            setattr(self, name, new)
+        self._ids.extend([None] * (capacity - len(self._ids)))
+
+    def _put(self, building_id: uuid.UUID, lat: float, lon: float) -> None:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._size == len(self._ids):
+                self._grow()
+            slot = self._size
+            self._size += 1
+        self._ids[slot] = building_id
+        self._slots[building_id] = slot
+        self._lat[slot] = lat
+        self._lon[slot] = lon
+        self._lat_rad[slot] = math.radians(lat)
+        self._lon_rad[slot] = math.radians(lon)
+        self._cos_lat[slot] = math.cos(self._lat_rad[slot])
+        cell = self._cell(lat, lon)
+        self._cells.setdefault(cell, set()).add(slot)
+        self._extend(cell)
+
+    def _extend(self, cell: Cell) -> None:
+        i, j = cell
+        if self._extent is None:
+            self._extent = (i, i, j, j)
+        else:
+            min_i, max_i, min_j, max_j = self._extent
+            self._extent = (min(min_i, i), max(max_i, i), min(min_j, j), max(max_j, j))
+
+    def load(self, rows: Iterable[Tuple[uuid.UUID, float, float]], version: Optional[int] = None) -> None:
+        '''Полностью пересобирает индекс из (building_id, lat, lon).'''
+        rows = list(rows)
+        ids = [row[0] for row in rows]
+        lat = np.array([row[1] for row in rows], dtype=np.float64)
+        lon = np.array([row[2] for row in rows], dtype=np.float64)
+
+        cells: Dict[Cell, Set[int]] = {}
+        cell_i = np.floor(lat / self.cell_deg).astype(np.int64)
+        cell_j = np.floor(lon / self.cell_deg).astype(np.int64)
+        for slot, cell in enumerate(zip(cell_i.tolist(), cell_j.tolist())):
+            cells.setdefault(cell, set()).add(slot)
+
+        with self._lock:
+            self._ids = ids
+            self._slots = {building_id: slot for slot, building_id in enumerate(ids)}
+            self._free = []
+            self._size = len(ids)
+            self._lat = lat
+            self._lon = lon
+            self._lat_rad = np.radians(lat)
+            self._lon_rad = np.radians(lon)
+            self._cos_lat = np.cos(self._lat_rad)
+            self._cells = cells
+            self._extent = None
+            if cells:
+                self._extent = (int(cell_i.min()), int(cell_i.max()), int(cell_j.min()), int(cell_j.max()))
+            self._shared = False
+            self.version = version
+            self.ready = True
+
+    def snapshot_arrays(self, rows: Iterable[Tuple[uuid.UUID, float, float]]) -> Dict[str, np.ndarray]:
+        '''
+        Массивы снимка индекса для load_shared: здания упорядочены по id,
+        ячейки хранятся как CSR — ключи (i, j), смещения и номера слотов.
+        '''
+        rows = sorted(rows, key=lambda row: row[0].int)
+        lat = np.array([row[1] for row in rows], dtype=np.float64)
+        lon = np.array([row[2] for row in rows], dtype=np.float64)
+        cell_i = np.floor(lat / self.cell_deg).astype(np.int64)
+        cell_j = np.floor(lon / self.cell_deg).astype(np.int64)
+
+        cell_slots = np.lexsort((cell_j, cell_i))
+        keys = np.stack((cell_i[cell_slots], cell_j[cell_slots]), axis=1)
+        starts = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+        starts = np.concatenate(([0], starts)) if len(rows) else starts
+        lat_rad = np.radians(lat)
+        return {
+            'id_hi': np.array([row[0].int >> 64 for row in rows], dtype=np.uint64),
+            'id_lo': np.array([row[0].int & _LOW_MASK for row in rows], dtype=np.uint64),
+            'lat': lat,
+            'lon': lon,
+            'lat_rad': lat_rad,
+            'lon_rad': np.radians(lon),
+            'cos_lat': np.cos(lat_rad),
+            'cell_keys': keys[starts],
+            'cell_offsets': np.append(starts, len(rows)).astype(np.int64),
+            'cell_slots': cell_slots.astype(np.int64),
+        }
+
+    def load_shared(self, arrays: Dict[str, np.ndarray], cell_deg: float, version: Optional[int] = None) -> None:
+        '''
+        Подключает массивы снимка (обычно np.load(..., mmap_mode='r')) без
+        копирования. В памяти процесса остаётся только словарь занятых ячеек
+        со срезами cell_slots.
+        '''
+        offsets = arrays['cell_offsets'].tolist()
+        cell_keys = arrays['cell_keys']
+        cells = {
+            (i, j): arrays['cell_slots'][offsets[k]:offsets[k + 1]]
+            for k, (i, j) in enumerate(cell_keys.tolist())
+        }
+        ids = _SortedIds(arrays['id_hi'], arrays['id_lo'])
+        with self._lock:
+            self.cell_deg = cell_deg
+            self._ids = ids
+            self._slots = ids
+            self._free = []
+            self._size = len(ids)
+            for name in ('lat', 'lon', 'lat_rad', 'lon_rad', 'cos_lat'):
+                setattr(self, f'_{name}', arrays[name])
+            self._cells = cells
+            self._extent = None
+            if cells:
+                self._extent = (
+                    int(cell_keys[:, 0].min()), int(cell_keys[:, 0].max()),
+                    int(cell_keys[:, 1].min()), int(cell_keys[:, 1].max()),
+                )
+            self._shared = True
+            self.version = version
+            self.ready = True
+
+    def _make_private(self) -> None:
+        '''копирует массивы снимка в память процесса перед первым изменением'''
+        if not self._shared:
+            return
+        self._ids = list(self._ids)
+        self._slots = {building_id: slot for slot, building_id in enumerate(self._ids)}
+        for name in ('_lat', '_lon', '_lat_rad', '_lon_rad', '_cos_lat'):
+            setattr(self, name, np.array(getattr(self, name)))
+        self._cells = {cell: set(slots.tolist()) for cell, slots in self._cells.items()}
+        self._shared = False
+
+    def upsert(self, building_id: uuid.UUID, lat: float, lon: float) -> None:
+        with self._lock:
+            self._make_private()
+            self._discard(building_id)
+            self._put(building_id, lat, lon)
+
+    def remove(self, building_id: uuid.UUID) -> None:
+        with self._lock:
+            self._make_private()
+            self._discard(building_id)
+
+    def _discard(self, building_id: uuid.UUID) -> None:
+        slot = self._slots.pop(building_id, None)
+        if slot is None:
+            return
+        cell = self._cell(self._lat[slot], self._lon[slot])
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(slot)
+            if not bucket:
+                del self._cells[cell]
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def on_change(self, listener: Callable[[List[uuid.UUID]], None]) -> None:
+        '''listener(building_ids) вызывается из changed(): здания изменены в БД этим процессом'''
+        self._listeners.append(listener)
+
+    def changed(self, building_ids: List[uuid.UUID]) -> None:
+        '''
+        Сообщает слушателям, что этот процесс записал в БД здания building_ids
+        (индекс процесса уже обновлён). Другие процессы узнают об изменениях
+        только через слушателей.
+        '''
+        if building_ids:
+            for listener in self._listeners:
+                listener(building_ids)
+
+    async def refresh(self, session: AsyncSession, building_ids: List[uuid.UUID]) -> None:
+        '''Перечитывает из БД координаты зданий building_ids: изменения другого процесса.'''
+        res = await session.execute(
+            select(BuildingsModel.id, BuildingsModel.latitude, BuildingsModel.longitude)
+            .where(BuildingsModel.id.in_(building_ids))
+        )
+        found = {row.id: row for row in res}
+        for building_id in building_ids:
+            row = found.get(building_id)
+            if row is None or row.latitude is None or row.longitude is None:
+                self.remove(building_id)
+            else:
+                self.upsert(building_id, row.latitude, row.longitude)
+
+    def get(self, building_id: uuid.UUID) -> Optional[Tuple[float, float]]:
+        slot = self._slots.get(building_id)
+        if slot is None:
+            return None
+        return float(self._lat[slot]), float(self._lon[slot])
+
+    def query_radius(self, lat: float, lon: float, radius_m: float,
+                     limit: Optional[int] = None) -> List[Tuple[uuid.UUID, float, float, float]]:
+        '''
+        Возвращает [(building_id, lat, lon, distance_m)] в радиусе radius_m,
+        отсортированные по расстоянию; не больше limit ближайших, если он задан.
+        '''
+        min_lat, max_lat, min_lon, max_lon = bbox_for_radius(lat, lon, radius_m)
+        min_i, min_j = self._cell(min_lat, min_lon)
+        max_i, max_j = self._cell(max_lat, max_lon)
+
+        with self._lock:
+            # при большом радиусе ячеек в bbox больше, чем занятых, — идём по занятым
+            if (max_i - min_i + 1) * (max_j - min_j + 1) > len(self._cells):
+                buckets = [
+                    slots for (i, j), slots in self._cells.items()
+                    if min_i <= i <= max_i and min_j <= j <= max_j
+                ]
+            else:
+                buckets = [
+                    self._cells[(i, j)]
+                    for i in range(min_i, max_i + 1)
+                    for j in range(min_j, max_j + 1)
+                    if (i, j) in self._cells
+                ]
+            if not buckets:
+                return []
+            candidates = _candidates(buckets)
+
+            distances = haversine_m_batch(
+                lat, lon, self._lat_rad[candidates], self._lon_rad[candidates], self._cos_lat[candidates],
+            )
+            order = radius_top_k(distances, radius_m, limit)
+            slots = candidates[order]
+            return [
+                (self._ids[slot], b_lat, b_lon, dist)
+                for slot, b_lat, b_lon, dist in zip(
+                    slots.tolist(), self._lat[slots].tolist(), self._lon[slots].tolist(), distances[order].tolist(),
+                )
+            ]
+
+    def _ring_cells(self, ci: int, cj: int, r: int) -> Iterable[Cell]:
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def _outside_lower_bound(self, lat: float, lon: float, ci: int, cj: int, r: int) -> float:
+        '''
+        Нижняя оценка расстояния (м) от (lat, lon) до любой точки вне квадрата
+        ячеек [ci-r, ci+r] x [cj-r, cj+r].
+        '''
+        cd = self.cell_deg
+        dlat = min(lat - (ci - r) * cd, (ci + r + 1) * cd - lat)
+        lat_bound = EARTH_RADIUS_M * math.radians(dlat)
+
+        dlon = min(lon - (cj - r) * cd, (cj + r + 1) * cd - lon)
+        if dlon >= 180.0:
+            return lat_bound
+        # точки, вышедшие за квадрат по долготе, лежат в его полосе широт
+        phi_max = min(max(abs((ci - r) * cd), abs((ci + r + 1) * cd)), 90.0)
+        lon_bound = 2 * EARTH_RADIUS_M * math.asin(
+            min(1.0, math.cos(math.radians(phi_max)) * math.sin(math.radians(dlon) / 2))
+        )
+        return min(lat_bound, lon_bound)
+
+    def nearest(self, lat: float, lon: float, k: int,
+                max_radius_m: Optional[float] = None) -> List[Tuple[uuid.UUID, float, float, float]]:
+        '''
+        k ближайших зданий к (lat, lon): [(building_id, lat, lon, distance_m)]
+        по возрастанию расстояния, не дальше max_radius_m, если он задан.
+
+        Ячейки обходятся кольцами вокруг ячейки центра в порядке роста нижней
+        оценки расстояния; обход останавливается, как только k-й найденный
+        кандидат ближе, чем любая точка за пределами просмотренного квадрата.
+        Стоимость зависит от k и плотности точек, а не от размера таблицы.
+        '''
+        if k <= 0:
+            return []
+        ci, cj = self._cell(lat, lon)
+        limit = math.inf if max_radius_m is None else max_radius_m
+
+        with self._lock:
+            if self._extent is None:
+                return []
+            min_i, max_i, min_j, max_j = self._extent
+            max_r = max(ci - min_i, max_i - ci, cj - min_j, max_j - cj, 0)
+
+            best_slots = np.empty(0, dtype=np.int64)
+            best_dist = np.empty(0, dtype=np.float64)
+            r = 0
+            while r <= max_r:
+                if 8 * r > len(self._cells):
+                    # кольцо длиннее числа занятых ячеек — добираем все оставшиеся разом
+                    buckets = [
+                        slots for (i, j), slots in self._cells.items()
+                        if max(abs(i - ci), abs(j - cj)) >= r
+                    ]
+                    r = max_r
+                else:
+                    buckets = [self._cells[cell] for cell in self._ring_cells(ci, cj, r) if cell in self._cells]
+
+                if buckets:
+                    slots = _candidates(buckets)
+                    dist = haversine_m_batch(lat, lon, self._lat_rad[slots], self._lon_rad[slots], self._cos_lat[slots])
+                    keep = dist <= limit
+                    best_slots = np.concatenate((best_slots, slots[keep]))
+                    best_dist = np.concatenate((best_dist, dist[keep]))
+                    if best_dist.size > k:
+                        part = np.argpartition(best_dist, k - 1)[:k]
+                        best_slots, best_dist = best_slots[part], best_dist[part]
+
+                bound = self._outside_lower_bound(lat, lon, ci, cj, r)
+                if bound > limit:
+                    break
+                if best_dist.size == k and best_dist.max() <= bound:
+                    break
+                r += 1
+
+            order = np.argsort(best_dist, kind='stable')
+            slots = best_slots[order]
+            return [
+                (self._ids[slot], b_lat, b_lon, dist)
+                for slot, b_lat, b_lon, dist in zip(
+                    slots.tolist(), self._lat[slots].tolist(), self._lon[slots].tolist(), best_dist[order].tolist(),
+                )
+            ]
+
+    async def build(self, session: AsyncSession) -> None:
+        '''Загружает все здания из БД.'''
+        # версия читается раньше зданий: если их изменят между запросами,
+        # индекс окажется новее версии и при сверке просто перестроится ещё раз
+        version = await buildings_version(session)
+        res = await session.execute(
+            select(BuildingsModel.id, BuildingsModel.latitude, BuildingsModel.longitude)
+            .where(BuildingsModel.latitude.isnot(None), BuildingsModel.longitude.isnot(None))
+        )
+        rows = res.all()
+        self.load(rows, version)
+        logger.info('spatial index: загружено %d зданий, версия %s', len(rows), version)
+
+    async def ensure_fresh(self, session: AsyncSession) -> bool:
+        '''
+        Перестраивает индекс из БД, если версия зданий в БД не та, с которой
+        он собран: снимок старше БД (воркер перезапущен после изменений,
+        run_prod.py --reuse-snapshot). True — индекс перестроен.
+        '''
+        if self.ready and await buildings_version(session) == self.version:
+            return False
+        await self.build(session)
+        return True
+
+
+async def buildings_version(session: AsyncSession) -> Optional[int]:
+    return (await session.execute(
+        select(CatalogVersionsModels.version).where(CatalogVersionsModels.name == BUILDINGS_VERSION)
+    )).scalar_one_or_none()
+
+
+spatial_index = SpatialIndex()
+
+
+# --- синхронизация с изменениями зданий через ORM ---
+# Изменения копятся в session.info на flush и применяются к индексу только после commit.
+
+_PENDING_KEY = 'spatial_index_pending'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_building_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, BuildingsModel):
+            pending[obj.id] = (obj.latitude, obj.longitude)
+    for obj in session.deleted:
+        if isinstance(obj, BuildingsModel):
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_building_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if spatial_index.ready:
+        for building_id, coords in pending.items():
+            if coords is None or None in coords:
+                spatial_index.remove(building_id)
+            else:
+                spatial_index.upsert(building_id, *coords)
+    spatial_index.changed(list(pending))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_building_changes(session):
+    session.info.pop(_PENDING_KEY, None)
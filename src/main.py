@@ -1,9 +1,77 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
+from config import BROADCAST_EVENTS, METRICS_DIR, METRICS_WRITE_INTERVAL, SNAPSHOT_DIR
+from database import async_session_maker
+from src.api.activity_catalog import activity_catalog
+from src.api.admin import admin_router
 from src.api.api import router as router
+from src.api.broadcast import event_broadcast
+from src.api.metrics import MetricsMiddleware, metrics_router, write_metrics_periodically
+from src.api.snapshot import load_snapshot
+from src.api.spatial_index import spatial_index
+
+logger = logging.getLogger(__name__)
+
+
+async def load_from_db() -> None:
+    try:
+        async with async_session_maker() as session:
+            await spatial_index.build(session)
+    except Exception as er:
+        # без индекса geo_search_by_center фильтрует по bbox в БД
+        logger.error('не удалось построить spatial index: %s', er)
+    try:
+        async with async_session_maker() as session:
+            await activity_catalog.refresh(session)
+    except Exception as er:
+        # справочник загрузится при первом запросе через ensure_fresh
+        logger.error('не удалось загрузить activity catalog: %s', er)
+
+
+async def check_snapshot() -> None:
+    '''
+    Снимок собран при запуске run_prod.py (или раньше, при --reuse-snapshot):
+    воркер, перезапущенный после изменений зданий, иначе отдавал бы старые
+    координаты до конца жизни.
+    '''
+    try:
+        async with async_session_maker() as session:
+            if await spatial_index.ensure_fresh(session):
+                logger.warning('снимок spatial index старше БД, индекс перестроен из БД')
+    except Exception as er:
+        logger.error('не удалось сверить снимок spatial index с БД: %s', er)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # воркеры run_prod.py отображают в память снимок, собранный до их запуска
+    if SNAPSHOT_DIR and load_snapshot(SNAPSHOT_DIR):
+        await check_snapshot()
+    else:
+        await load_from_db()
+    # изменения, записанные другими процессами API, приходят через LISTEN/NOTIFY
+    if BROADCAST_EVENTS:
+        event_broadcast.start()
+    metrics_writer = None
+    if METRICS_DIR:
+        metrics_writer = asyncio.create_task(write_metrics_periodically(METRICS_DIR, METRICS_WRITE_INTERVAL))
+    yield
+    if metrics_writer is not None:
+        metrics_writer.cancel()
+        await asyncio.gather(metrics_writer, return_exceptions=True)
+    await event_broadcast.stop()
+
 
-app = FastAPI()
+# модели ответов сериализуются в pydantic-core, итоговый JSON пишет orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.include_router(router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
 
-from src import api
\ No newline at end of file
+app.add_middleware(MetricsMiddleware)
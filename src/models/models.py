@@ -1,10 +1,16 @@
-from sqlalchemy import Column, ForeignKey, String, Uuid
+from sqlalchemy import (
+    BigInteger, Column, Float, ForeignKey, Index, Integer, String, Uuid, and_, delete, event, insert, inspect, select,
+    true,
+)
+from sqlalchemy.orm import relationship
 
 from database import Base
+from src.api.scripts import format_latlon_decimal, parse_latlon_decimal
 
 __all__ = [
-    'BuildingsModel', 'ActivitiesModels',
+    'BuildingsModel', 'ActivitiesModels', 'ActivitiesClosureModels',
     'OrganizationsModels', 'OrganizationPhonesModels', 'OrganizationActivitiesModels',
+    'CatalogVersionsModels',
 ]
 
 class BuildingsModel(Base):
@@ -16,6 +22,22 @@ class BuildingsModel(Base):
     address = Column(String, nullable=False)
     latitude_longitude = Column(String, nullable=False)
 
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+
+    __table_args__ = (
+        # частичный: здания без координат (не разобранный latitude_longitude)
+        # в bbox и радиус не попадают, и в индексе им не место
+        Index(
+            'ix_buildings_latitude_longitude', 'latitude', 'longitude',
+            postgresql_where=and_(latitude.isnot(None), longitude.isnot(None)),
+            sqlite_where=and_(latitude.isnot(None), longitude.isnot(None)),
+        ),
+        Index('ix_buildings_address', 'address'),
+    )
+
+    organizations = relationship('OrganizationsModels', back_populates='building')
+
 class ActivitiesModels(Base):
 
     __tablename__ = 'activities'
@@ -26,6 +48,51 @@ class ActivitiesModels(Base):
 
     name = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index('ix_activities_parent_id', 'parent_id'),
+        Index('ix_activities_name', 'name'),
+    )
+
+    # parent_id без внешнего ключа в схеме, поэтому связь задана явно
+    parent = relationship(
+        'ActivitiesModels',
+        primaryjoin='ActivitiesModels.parent_id == ActivitiesModels.id',
+        foreign_keys=[parent_id],
+        remote_side=[id],
+        back_populates='children',
+    )
+    children = relationship(
+        'ActivitiesModels',
+        primaryjoin='ActivitiesModels.parent_id == ActivitiesModels.id',
+        foreign_keys=[parent_id],
+        back_populates='parent',
+    )
+    organizations = relationship(
+        'OrganizationsModels',
+        secondary='organization_activities',
+        back_populates='activities',
+        viewonly=True,
+    )
+
+class ActivitiesClosureModels(Base):
+    '''
+    Транзитивное замыкание дерева activities: строка на каждую пару
+    (предок, потомок), включая саму вершину с depth = 0. Поддерживается
+    событиями ActivitiesModels ниже. Ручки читают поддеревья из
+    activity_catalog, а эту таблицу — пока справочник не загружен.
+    '''
+
+    __tablename__ = 'activity_closure'
+
+    ancestor_id = Column(Uuid, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = Column(Uuid, ForeignKey('activities.id', ondelete='CASCADE'), primary_key=True)
+
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_activity_closure_descendant_id', 'descendant_id'),
+    )
+
 class OrganizationsModels(Base):
 
     __tablename__ = 'organizations'
@@ -36,6 +103,27 @@ class OrganizationsModels(Base):
 
     name = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index(
+            'ix_organizations_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'},
+        ),
+        # keyset-пагинация списков организаций по (name, id)
+        Index('ix_organizations_name_id', 'name', 'id'),
+        Index('ix_organizations_buildings_id_name_id', 'buildings_id', 'name', 'id'),
+    )
+
+    building = relationship('BuildingsModel', back_populates='organizations')
+    phones = relationship('OrganizationPhonesModels', back_populates='organization')
+    activity_links = relationship('OrganizationActivitiesModels', back_populates='organization')
+    # только чтение: строки связи создаются через OrganizationActivitiesModels (у неё свой id)
+    activities = relationship(
+        'ActivitiesModels',
+        secondary='organization_activities',
+        back_populates='organizations',
+        viewonly=True,
+    )
+
 class OrganizationPhonesModels(Base):
     
     __tablename__ = 'organization_phones'
@@ -46,6 +134,12 @@ class OrganizationPhonesModels(Base):
 
     phone_number = Column(String(length=15), nullable=False, unique=True)
 
+    __table_args__ = (
+        Index('ix_organization_phones_organization_id', 'organization_id'),
+    )
+
+    organization = relationship('OrganizationsModels', back_populates='phones')
+
 class OrganizationActivitiesModels(Base):
     
     __tablename__ = 'organization_activities'
@@ -54,4 +148,107 @@ class OrganizationActivitiesModels(Base):
 
     organization_id = Column(Uuid, ForeignKey('organizations.id'))
     activity_id = Column(Uuid, ForeignKey('activities.id'))
-    
\ No newline at end of file
+
+    __table_args__ = (
+        Index('ix_organization_activities_organization_id_activity_id', 'organization_id', 'activity_id'),
+        Index('ix_organization_activities_activity_id_organization_id', 'activity_id', 'organization_id'),
+    )
+
+    organization = relationship('OrganizationsModels', back_populates='activity_links')
+    activity = relationship('ActivitiesModels')
+
+class CatalogVersionsModels(Base):
+    '''Счётчик изменений справочника; в Postgres увеличивается триггером на таблице name.'''
+
+    __tablename__ = 'catalog_versions'
+
+    name = Column(String, primary_key=True)
+
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+@event.listens_for(BuildingsModel, 'before_insert')
+@event.listens_for(BuildingsModel, 'before_update')
+def _sync_building_coordinates(mapper, connection, target):
+    '''
+    Двойная запись координат: latitude_longitude и latitude/longitude
+    всегда согласованы. Если менялась строка — пересчитываются числа,
+    если менялись только числа — пересобирается строка.
+    '''
+    state = inspect(target)
+    string_changed = state.attrs.latitude_longitude.history.has_changes()
+    numbers_changed = (
+        state.attrs.latitude.history.has_changes()
+        or state.attrs.longitude.history.has_changes()
+    )
+
+    if numbers_changed and not string_changed:
+        if target.latitude is not None and target.longitude is not None:
+            target.latitude_longitude = format_latlon_decimal(target.latitude, target.longitude)
+        return
+
+    if target.latitude_longitude is None:
+        return
+    try:
+        target.latitude, target.longitude = parse_latlon_decimal(target.latitude_longitude)
+    except ValueError:
+        target.latitude, target.longitude = None, None
+
+
+# --- поддержка activity_closure при записи activities через ORM ---
+
+_closure = ActivitiesClosureModels.__table__
+
+
+def _closure_subtree(activity_id):
+    return select(_closure.c.descendant_id).where(_closure.c.ancestor_id == activity_id)
+
+
+def _closure_attach(connection, activity_id, parent_id):
+    '''Пути от всех предков parent_id (и от него самого) ко всему поддереву activity_id.'''
+    if parent_id is None:
+        return
+    sup = _closure.alias('sup')
+    sub = _closure.alias('sub')
+    connection.execute(
+        insert(_closure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(sup.c.ancestor_id, sub.c.descendant_id, sup.c.depth + sub.c.depth + 1)
+            .select_from(sup.join(sub, true()))
+            .where(sup.c.descendant_id == parent_id, sub.c.ancestor_id == activity_id),
+        )
+    )
+
+
+def _closure_detach(connection, activity_id, include_self: bool):
+    '''Удаляет пути от предков activity_id к его поддереву.'''
+    ancestors = select(_closure.c.ancestor_id).where(_closure.c.descendant_id == activity_id)
+    if not include_self:
+        ancestors = ancestors.where(_closure.c.ancestor_id != activity_id)
+    connection.execute(
+        delete(_closure).where(
+            _closure.c.descendant_id.in_(_closure_subtree(activity_id)),
+            _closure.c.ancestor_id.in_(ancestors),
+        )
+    )
+
+
+@event.listens_for(ActivitiesModels, 'after_insert')
+def _closure_on_insert(mapper, connection, target):
+    connection.execute(insert(_closure).values(ancestor_id=target.id, descendant_id=target.id, depth=0))
+    _closure_attach(connection, target.id, target.parent_id)
+
+
+@event.listens_for(ActivitiesModels, 'after_update')
+def _closure_on_update(mapper, connection, target):
+    history = inspect(target).attrs.parent_id.history
+    if not history.has_changes():
+        return
+    _closure_detach(connection, target.id, include_self=False)
+    _closure_attach(connection, target.id, target.parent_id)
+
+
+@event.listens_for(ActivitiesModels, 'before_delete')
+def _closure_on_delete(mapper, connection, target):
+    # потомки удаляемой вершины становятся отдельными поддеревьями, как и в рекурсивном обходе по parent_id
+    _closure_detach(connection, target.id, include_self=True)
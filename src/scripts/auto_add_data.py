@@ -22,7 +22,8 @@ def add_data():
                 name=key,
             )
             session.add(activities)
-            session.commit()
+            # корень пишется раньше потомков: их строки activity_closure строятся от строк корня
+            session.flush()
 
 
             for i in activity_name[key]:
@@ -33,7 +34,6 @@ def add_data():
                     latitude_longitude=dg.gen_latitude_longitude()
                 )
                 session.add(buildings)
-                session.commit()
                 
                 child_id = dg.gen_uuid()
                 child_activites = ActivitiesModels(
@@ -42,7 +42,6 @@ def add_data():
                     name=i
                 )
                 session.add(child_activites)
-                session.commit()
 
                 organizations_id = dg.gen_uuid()
                 organizations = OrganizationsModels(
@@ -51,7 +50,6 @@ def add_data():
                     name=dg.gen_name(),
                 )
                 session.add(organizations)
-                session.commit()
 
                 organization_phones_id = dg.gen_uuid()
                 organization_phones = OrganizationPhonesModels(
@@ -60,7 +58,6 @@ def add_data():
                     phone_number=dg.gen_phone_number(),
                 )
                 session.add(organization_phones)
-                session.commit()
 
                 choice = random.choice(['child', 'parent', 'both'])
                 to_create = []
@@ -80,7 +77,8 @@ def add_data():
                     ))
                 for oa in to_create:
                     session.add(oa)
-                session.commit()
+        # одна транзакция на весь набор вместо commit после каждой строки
+        session.commit()
         print('данные добавлены')
 
 add_data()
\ No newline at end of file
@@ -0,0 +1,255 @@
+'''
+Генерация и массовая загрузка большого набора данных.
+
+Здания раскиданы нормальным распределением вокруг центров городов,
+организации привязаны к случайным зданиям, у каждой 1..--max-phones
+телефонов и 1..--max-activities видов деятельности из дерева глубины
+--tree-depth. Все id и значения детерминированы --seed.
+
+В Postgres (psycopg2) строки пишутся через COPY, в остальных БД — пачками
+insert().values(). Транзакций три: справочник видов деятельности с
+activity_closure, здания, организации с телефонами и связями.
+
+    python src/scripts/bulk_load.py --organizations 1000000 --seed 42 --truncate
+
+Загрузка идёт мимо ORM: уже запущенный API увидит новые данные в
+activity_catalog сам (по catalog_versions), а spatial index и кэш ответов —
+после перезапуска или POST /v1/secunda/admin/cache/invalidate.
+'''
+from pathlib import Path
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.append(str(project_root))
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import Connection
+
+from database import engine
+from src.api.scripts import format_latlon_decimal
+from src.models.models import *
+
+# (город, широта, долгота, разброс в км, вес)
+CITIES = [
+    ('Москва', 55.7558, 37.6173, 12.0, 12.0),
+    ('Санкт-Петербург', 59.9343, 30.3351, 9.0, 5.0),
+    ('Новосибирск', 55.0084, 82.9357, 7.0, 1.5),
+    ('Екатеринбург', 56.8389, 60.6057, 6.0, 1.5),
+    ('Казань', 55.7963, 49.1088, 5.0, 1.2),
+    ('Нижний Новгород', 56.2965, 43.9361, 5.0, 1.0),
+    ('Краснодар', 45.0355, 38.9753, 4.0, 1.0),
+    ('Владивосток', 43.1155, 131.8855, 3.0, 0.5),
+]
+STREETS = ['Ленина', 'Мира', 'Садовая', 'Тверская', 'Лесная', 'Школьная', 'Заводская', 'Центральная',
+           'Набережная', 'Советская', 'Молодёжная', 'Шоссе Энтузиастов', 'Кабельная', 'Разумовского']
+ROOT_ACTIVITIES = ['Еда', 'Автомобили', 'Продукты', 'Строительство', 'Услуги', 'Образование',
+                   'Медицина', 'Транспорт', 'Одежда', 'Электроника']
+ORG_PREFIXES = ['ООО', 'ОАО', 'ИП', 'АО', 'ЗАО']
+ORG_WORDS = ['Автозвук', 'Мясокомбинат', 'Магазин продуктов', 'Рога и копыта', 'Вектор', 'Альфа',
+             'Стройресурс', 'Молочный двор', 'Техносила', 'Северный ветер', 'Гранит', 'Меридиан']
+
+KM_PER_DEG_LAT = 111.32
+# множитель, взаимно простой с 10**10: номера телефонов уникальны, но выглядят случайными
+PHONE_MULTIPLIER = 7_919_302_231
+
+
+class Stats:
+    def __init__(self):
+        self.rows: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def add(self, table: str, count: int) -> None:
+        self.rows[table] = self.rows.get(table, 0) + count
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        for table, count in self.rows.items():
+            print(f'  {table:<26} {count:>12,}')
+        print(f'итого {total:,} строк за {elapsed:.1f} с, {total / max(elapsed, 1e-9):,.0f} строк/с')
+
+
+class Writer:
+    '''COPY для psycopg2, иначе пачки insert().values().'''
+
+    def __init__(self, connection: Connection, insert_batch: int, stats: Stats):
+        self.connection = connection
+        self.insert_batch = insert_batch
+        self.stats = stats
+        self.use_copy = connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+    def write(self, table, columns: Sequence[str], rows: List[tuple]) -> None:
+        if not rows:
+            return
+        if self.use_copy:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor = self.connection.connection.cursor()
+            try:
+                cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+            finally:
+                cursor.close()
+        else:
+            # не больше ~30000 параметров на запрос: ограничение SQLite и asyncpg/psycopg2
+            batch = max(1, min(self.insert_batch, 30000 // len(columns)))
+            for start in range(0, len(rows), batch):
+                self.connection.execute(
+                    insert(table).values([dict(zip(columns, row)) for row in rows[start:start + batch]])
+                )
+        self.stats.add(table.name, len(rows))
+
+
+def make_uuid(rnd: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rnd.getrandbits(128), version=4)
+
+
+def gen_activity_tree(rnd: random.Random, roots: int, depth: int, branching: int) -> List[Tuple[uuid.UUID, Optional[uuid.UUID], str]]:
+    '''(id, parent_id, name) в порядке обхода в ширину: родитель всегда раньше потомков'''
+    names = [ROOT_ACTIVITIES[i] if i < len(ROOT_ACTIVITIES) else f'Направление {i + 1}' for i in range(roots)]
+    level = [(make_uuid(rnd), None, name) for name in names]
+    nodes = list(level)
+    for _ in range(depth - 1):
+        next_level = []
+        for node_id, _, name in level:
+            for i in range(branching):
+                next_level.append((make_uuid(rnd), node_id, f'{name} / {i + 1}'))
+        nodes.extend(next_level)
+        level = next_level
+    return nodes
+
+
+def closure_rows(nodes: Iterable[Tuple[uuid.UUID, Optional[uuid.UUID], str]]) -> List[tuple]:
+    ancestors: Dict[uuid.UUID, List[uuid.UUID]] = {}
+    rows = []
+    for node_id, parent_id, _ in nodes:
+        chain = [node_id] + (ancestors[parent_id] if parent_id is not None else [])
+        ancestors[node_id] = chain
+        rows.extend((ancestor, node_id, depth) for depth, ancestor in enumerate(chain))
+    return rows
+
+
+def gen_coordinates(np_rng: np.random.Generator, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    weights = np.array([city[4] for city in CITIES])
+    city_idx = np_rng.choice(len(CITIES), size=count, p=weights / weights.sum())
+    center_lat = np.array([city[1] for city in CITIES])[city_idx]
+    center_lon = np.array([city[2] for city in CITIES])[city_idx]
+    spread_km = np.array([city[3] for city in CITIES])[city_idx]
+    lat = center_lat + np_rng.normal(0.0, 1.0, count) * spread_km / KM_PER_DEG_LAT
+    lon = center_lon + np_rng.normal(0.0, 1.0, count) * spread_km / (KM_PER_DEG_LAT * np.cos(np.radians(center_lat)))
+    return city_idx, np.round(lat, 6), np.round(lon, 6)
+
+
+def load_activities(writer: Writer, rnd: random.Random, args) -> List[uuid.UUID]:
+    nodes = gen_activity_tree(rnd, args.roots, args.tree_depth, args.branching)
+    writer.write(ActivitiesModels.__table__, ['id', 'parent_id', 'name'], nodes)
+    writer.write(ActivitiesClosureModels.__table__, ['ancestor_id', 'descendant_id', 'depth'], closure_rows(nodes))
+    return [node_id for node_id, _, _ in nodes]
+
+
+def load_buildings(writer: Writer, rnd: random.Random, np_rng: np.random.Generator, args) -> List[uuid.UUID]:
+    building_ids = []
+    for start in range(0, args.buildings, args.chunk_size):
+        count = min(args.chunk_size, args.buildings - start)
+        city_idx, lat, lon = gen_coordinates(np_rng, count)
+        rows = []
+        for city, b_lat, b_lon in zip(city_idx.tolist(), lat.tolist(), lon.tolist()):
+            building_id = make_uuid(rnd)
+            building_ids.append(building_id)
+            address = f'{CITIES[city][0]}, ул. {rnd.choice(STREETS)}, д.{rnd.randint(1, 250)}'
+            rows.append((building_id, address, format_latlon_decimal(b_lat, b_lon), b_lat, b_lon))
+        writer.write(BuildingsModel.__table__, ['id', 'address', 'latitude_longitude', 'latitude', 'longitude'], rows)
+    return building_ids
+
+
+def load_organizations(writer: Writer, rnd: random.Random, args, building_ids: List[uuid.UUID],
+                       activity_ids: List[uuid.UUID]) -> None:
+    phone_seq = rnd.randrange(10 ** 10)
+    for start in range(0, args.organizations, args.chunk_size):
+        count = min(args.chunk_size, args.organizations - start)
+        organizations, phones, links = [], [], []
+        for n in range(start, start + count):
+            org_id = make_uuid(rnd)
+            name = f'{rnd.choice(ORG_PREFIXES)} {rnd.choice(ORG_WORDS)} {n + 1}'
+            organizations.append((org_id, rnd.choice(building_ids), name))
+            for _ in range(rnd.randint(1, args.max_phones)):
+                phone_seq += 1
+                phones.append((make_uuid(rnd), org_id, f'+7{phone_seq * PHONE_MULTIPLIER % 10 ** 10:010d}'))
+            for activity_id in rnd.sample(activity_ids, min(len(activity_ids), rnd.randint(1, args.max_activities))):
+                links.append((make_uuid(rnd), org_id, activity_id))
+        writer.write(OrganizationsModels.__table__, ['id', 'buildings_id', 'name'], organizations)
+        writer.write(OrganizationPhonesModels.__table__, ['id', 'organization_id', 'phone_number'], phones)
+        writer.write(OrganizationActivitiesModels.__table__, ['id', 'organization_id', 'activity_id'], links)
+        print(f'  организации: {start + count:,} / {args.organizations:,}', end='\r', flush=True)
+    print()
+
+
+def truncate(connection: Connection) -> None:
+    tables = [
+        OrganizationActivitiesModels.__table__, OrganizationPhonesModels.__table__, OrganizationsModels.__table__,
+        BuildingsModel.__table__, ActivitiesClosureModels.__table__, ActivitiesModels.__table__,
+    ]
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f'TRUNCATE {", ".join(t.name for t in tables)}')
+        # TRUNCATE не вызывает триггер catalog_versions
+        connection.exec_driver_sql("UPDATE catalog_versions SET version = version + 1 WHERE name = 'activities'")
+    else:
+        for table in tables:
+            connection.execute(delete(table))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--organizations', type=int, default=100_000, help='число организаций')
+    parser.add_argument('--buildings', type=int, default=None, help='число зданий (по умолчанию организаций / 4)')
+    parser.add_argument('--max-phones', type=int, default=3, help='телефонов у организации: 1..N')
+    parser.add_argument('--max-activities', type=int, default=3, help='видов деятельности у организации: 1..N')
+    parser.add_argument('--roots', type=int, default=5, help='видов деятельности первого уровня')
+    parser.add_argument('--tree-depth', type=int, default=3, help='уровней в дереве видов деятельности')
+    parser.add_argument('--branching', type=int, default=4, help='потомков у каждого вида деятельности')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=50_000, help='строк генерируется и пишется за раз')
+    parser.add_argument('--insert-batch', type=int, default=1000, help='строк в одном insert().values() без COPY')
+    parser.add_argument('--truncate', action='store_true', help='очистить таблицы перед загрузкой')
+    args = parser.parse_args(argv)
+    if args.buildings is None:
+        args.buildings = max(1, args.organizations // 4)
+    if min(args.organizations, args.buildings, args.max_phones, args.max_activities,
+           args.roots, args.tree_depth, args.branching, args.chunk_size, args.insert_batch) < 1:
+        parser.error('все числовые параметры должны быть >= 1')
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    rnd = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+    stats = Stats()
+
+    with engine.connect() as connection:
+        writer = Writer(connection, args.insert_batch, stats)
+        print('запись через', 'COPY' if writer.use_copy else 'insert().values()')
+
+        with connection.begin():
+            if args.truncate:
+                truncate(connection)
+            activity_ids = load_activities(writer, rnd, args)
+        with connection.begin():
+            building_ids = load_buildings(writer, rnd, np_rng, args)
+        with connection.begin():
+            load_organizations(writer, rnd, args, building_ids, activity_ids)
+
+    stats.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+'''
+Проверка планов запросов API.
+
+Скрипт вызывает ручки API внутри процесса, записывает каждый SQL-запрос,
+который они отправили в БД, и выполняет его повторно под EXPLAIN
+(FORMAT JSON) в двух режимах:
+
+- forced: enable_seqscan = off. Без подходящего индекса планировщику
+  остаётся Seq Scan или обход всего индекса без Index Cond (например, по
+  первичному ключу с Filter) — работает на данных любого размера;
+- planner: настройки по умолчанию после ANALYZE, как в продакшене. Имеет
+  смысл только на данных реального размера (--min-rows строк в organizations),
+  на маленьких таблицах Seq Scan — честный выбор, и режим пропускается.
+
+Узел, читающий большую таблицу целиком, — ошибка: скрипт печатает запрос с
+планом и завершается с кодом 1. То же проверяет tests/test_query_plans.py.
+
+Нужен Postgres с применёнными миграциями и данными, например:
+
+    alembic upgrade head
+    python src/scripts/bulk_load.py --organizations 100000 --truncate
+    python src/scripts/check_query_plans.py
+'''
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import sys
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.append(str(project_root))
+
+import httpx
+from sqlalchemy import event, func, select
+
+from database import async_engine, async_session_maker
+from src.main import app
+from src.models.models import *
+
+PREFIX = '/v1/secunda'
+
+LARGE_TABLES = {
+    'buildings', 'organizations', 'organization_phones', 'organization_activities', 'activity_closure',
+}
+
+# запросы без фильтра, которым полный проход по таблице положен
+SKIP_PREFIXES = ('SELECT set_config(', 'SELECT catalog_versions.version')
+
+# с какого числа строк в organizations проверяются планы с настройками по умолчанию
+MIN_ROWS = 50000
+
+# узлы, которые читают весь вход до первой строки: Limit над ними не ограничивает обход
+BLOCKING_NODES = {'Sort', 'Hash', 'Aggregate', 'Materialize', 'WindowAgg', 'SetOp'}
+
+
+class PlanCheck(NamedTuple):
+    mode: str
+    label: str
+    statement: str
+    problems: List[str]
+    plan: Dict
+
+
+class EmptyDatabase(RuntimeError):
+    pass
+
+
+class Call(NamedTuple):
+    method: str
+    path: str
+    kwargs: Dict
+    # выгрузка большой доли таблицы: полный проход по ней — честный план
+    bulk: bool = False
+
+
+class Statement(NamedTuple):
+    label: str
+    sql: str
+    parameters: tuple
+    bulk: bool
+
+
+class Recorder:
+    def __init__(self):
+        self.call: Optional[Call] = None
+        self.statements: List[Statement] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.call is None or executemany or statement.lstrip().startswith(SKIP_PREFIXES):
+            return
+        label = f'{self.call.method} {self.call.path}'
+        self.statements.append(Statement(label, statement, tuple(parameters or ()), self.call.bulk))
+
+
+async def sample_inputs() -> Dict[str, str]:
+    '''значения для запросов: здание и организация с данными, корень и лист дерева'''
+    async with async_session_maker() as session:
+        org = (await session.execute(
+            select(OrganizationsModels.id, OrganizationsModels.name, BuildingsModel.id, BuildingsModel.address)
+            .join(BuildingsModel, OrganizationsModels.buildings_id == BuildingsModel.id)
+            .limit(1)
+        )).first()
+        root = (await session.execute(
+            select(ActivitiesModels.name).where(ActivitiesModels.parent_id.is_(None)).limit(1)
+        )).scalar()
+        leaf = (await session.execute(
+            select(ActivitiesModels.name).where(ActivitiesModels.parent_id.is_not(None)).limit(1)
+        )).scalar()
+        org_ids = (await session.execute(select(OrganizationsModels.id).limit(50))).scalars().all()
+    if org is None or root is None:
+        raise EmptyDatabase('БД пуста: сначала загрузите данные (src/scripts/bulk_load.py)')
+    return {
+        'org_id': str(org[0]), 'org_name': org[1].split()[-1], 'building_id': str(org[2]), 'address': org[3],
+        'root': root, 'leaf': leaf or root, 'org_ids': [str(i) for i in org_ids],
+    }
+
+
+def calls(inputs: Dict, trgm: bool) -> List[Call]:
+    '''
+    Ручки, которые ходят в БД. Поиск по названию проверяется только при
+    установленном pg_trgm: без расширения нет GIN-индекса, которым он пользуется.
+    '''
+    return [
+        Call('GET', '/org_in_builds', {'params': {'org_address': inputs['address']}}),
+        Call('GET', '/org_by_activiys', {'params': {'org_activities': inputs['leaf']}}),
+        Call('GET', '/geo_search_by_center', {'params': {'building_id': inputs['building_id'], 'radius_m': 1000}}),
+        Call('GET', '/geo_nearest', {'params': {'building_id': inputs['building_id'], 'k': 10}}),
+        Call('GET', '/geo_search_by_bbox',
+             {'params': {'min_lat': 55.7, 'max_lat': 55.71, 'min_lon': 37.6, 'max_lon': 37.61}}),
+        *([Call('GET', '/organization/search', {'params': {'name': inputs['org_name'], 'limit': 10}})] if trgm else []),
+        Call('GET', f"/organization/{inputs['org_id']}", {}),
+        Call('POST', '/organization/batch', {'json': {'ids': inputs['org_ids']}}),
+        Call('GET', '/org_by_activity_tree', {'params': {'activity_name': inputs['root'], 'limit': 50}}),
+        Call('GET', '/export', {'params': {'building_id': inputs['building_id']}}),
+        Call('GET', '/export', {'params': {'activity_name': inputs['root']}}, bulk=True),
+    ]
+
+
+def full_scans(plan: Dict, limited: bool = False) -> Iterator[str]:
+    '''
+    Узлы, читающие большую таблицу целиком: Seq Scan и Index (Only) Scan без
+    Index Cond. Обход индекса без условия допустим только ради порядка строк
+    под Limit и без Filter — иначе это тот же полный проход.
+    '''
+    node = plan.get('Node Type')
+    relation = plan.get('Relation Name')
+    if relation in LARGE_TABLES:
+        if node == 'Seq Scan':
+            yield f'Seq Scan on {relation}'
+        elif node in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in plan:
+            if 'Filter' in plan or not limited:
+                yield f"{node} using {plan['Index Name']} on {relation} без Index Cond"
+    limited = node == 'Limit' or (limited and node not in BLOCKING_NODES)
+    for child in plan.get('Plans', ()):
+        yield from full_scans(child, limited)
+
+
+def plan_summary(plan: Dict, depth: int = 0) -> Iterator[str]:
+    relation = f" on {plan['Relation Name']}" if 'Relation Name' in plan else ''
+    index = f" using {plan['Index Name']}" if 'Index Name' in plan else ''
+    condition = ''.join(f" {key}: {plan[key][:120]}" for key in ('Index Cond', 'Filter') if key in plan)
+    yield f"{'  ' * depth}-> {plan['Node Type']}{relation}{index}{condition}"
+    for child in plan.get('Plans', ()):
+        yield from plan_summary(child, depth + 1)
+
+
+async def record_statements(api_calls: List[Call]) -> List[Statement]:
+    recorder = Recorder()
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', recorder)
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://check') as client:
+                for call in api_calls:
+                    recorder.call = call
+                    response = await client.request(call.method, PREFIX + call.path, **call.kwargs)
+                    recorder.call = None
+                    if response.status_code != 200:
+                        raise RuntimeError(
+                            f'{call.method} {call.path}: HTTP {response.status_code} {response.text[:200]}'
+                        )
+    finally:
+        event.remove(async_engine.sync_engine, 'before_cursor_execute', recorder)
+    return recorder.statements
+
+
+async def explain(conn, mode: str, statements: List[Statement]) -> List[PlanCheck]:
+    checks = []
+    for statement in statements:
+        raw = (await conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement.sql}', statement.parameters)).scalar()
+        plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]['Plan']
+        problems = [] if statement.bulk else sorted(set(full_scans(plan)))
+        checks.append(PlanCheck(mode, statement.label, statement.sql, problems, plan))
+    return checks
+
+
+async def has_pg_trgm() -> bool:
+    async with async_engine.connect() as conn:
+        return (await conn.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+
+
+async def run_checks(min_rows: int = MIN_ROWS) -> Tuple[List[PlanCheck], int, bool]:
+    '''
+    Планы всех запросов API в режиме forced и, если в organizations не меньше
+    min_rows строк, в режиме planner. Возвращает проверки, число организаций
+    и был ли проверен поиск по названию (нужен pg_trgm).
+    '''
+    if async_engine.dialect.name != 'postgresql':
+        raise RuntimeError('проверка планов работает только с Postgres')
+    try:
+        trgm = await has_pg_trgm()
+        statements = await record_statements(calls(await sample_inputs(), trgm))
+        async with async_engine.connect() as conn:
+            # статистика как после обычного autovacuum, а не после свежей загрузки
+            await conn.exec_driver_sql(f'ANALYZE {", ".join(sorted(LARGE_TABLES))}')
+            rows = (await conn.execute(select(func.count()).select_from(OrganizationsModels))).scalar()
+            await conn.exec_driver_sql('SET enable_seqscan = off')
+            checks = await explain(conn, 'forced', statements)
+            await conn.exec_driver_sql('RESET enable_seqscan')
+            if rows >= min_rows:
+                checks += await explain(conn, 'planner', statements)
+            await conn.rollback()
+    finally:
+        await async_engine.dispose()
+    return checks, rows, trgm
+
+
+def report(checks: List[PlanCheck]) -> int:
+    failures = 0
+    for check in checks:
+        status = 'OK  ' if not check.problems else 'FAIL'
+        print(f"{status} [{check.mode}] {check.label}: {' '.join(check.statement.split())[:100]}")
+        if check.problems:
+            failures += 1
+            print('\n'.join(f'     {problem}' for problem in check.problems))
+            print('\n'.join(f'     {line}' for line in plan_summary(check.plan)))
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS,
+                        help='с какого числа организаций проверять планы с настройками по умолчанию')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        checks, rows, trgm = asyncio.run(run_checks(args.min_rows))
+    except RuntimeError as er:
+        print(er)
+        return 2
+    failures = report(checks)
+    if not trgm:
+        print('поиск по названию пропущен: в БД нет расширения pg_trgm')
+    if rows < args.min_rows:
+        print(f'режим planner пропущен: в organizations {rows:,} строк, нужно не меньше {args.min_rows:,}')
+    print(f'планов: {len(checks)}, с полным проходом по большим таблицам: {failures}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.api import activity_catalog as catalog_module
+from src.api.activity_catalog import (
+    ActivityCatalog, activity_ids_by_name, activity_roots, activity_subtree, activity_subtree_ids,
+)
+from src.models.models import ActivitiesClosureModels, ActivitiesModels, CatalogVersionsModels
+
+TREE = {'Еда': {'Мясная продукция': {'Колбасы': {}}, 'Молочная продукция': {}}, 'Автомобили': {'Запчасти': {}}}
+
+
+def _add(session, tree, parent_id=None):
+    for name, children in tree.items():
+        activity = ActivitiesModels(id=uuid.uuid4(), name=name, parent_id=parent_id)
+        session.add(activity)
+        # строки activity_closure потомка строятся от строк родителя
+        session.flush()
+        _add(session, children, activity.id)
+
+
+async def _read(session, name):
+    return (
+        await activity_subtree_ids(session, name),
+        [row.name for row in await activity_subtree(session, name)],
+        [row.name for row in await activity_roots(session)],
+        await activity_ids_by_name(session, 'Колбасы'),
+    )
+
+
+async def _compare(monkeypatch):
+    engine = create_async_engine('sqlite+aiosqlite://')
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: ActivitiesModels.metadata.create_all(c, tables=[
+            ActivitiesModels.__table__, ActivitiesClosureModels.__table__, CatalogVersionsModels.__table__,
+        ]))
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.run_sync(_add, TREE)
+        await session.commit()
+
+    catalog = ActivityCatalog()
+    monkeypatch.setattr(catalog_module, 'activity_catalog', catalog)
+    async with session_maker() as session:
+        from_catalog = await _read(session, 'Еда')
+        missing = await activity_subtree_ids(session, 'Колбасы')
+
+    async def unavailable(session):
+        raise ConnectionError('справочник не загрузить')
+
+    catalog = ActivityCatalog()
+    monkeypatch.setattr(catalog, 'ensure_fresh', unavailable)
+    monkeypatch.setattr(catalog_module, 'activity_catalog', catalog)
+    async with session_maker() as session:
+        from_closure = await _read(session, 'Еда')
+    await engine.dispose()
+    return from_catalog, from_closure, missing
+
+
+def test_closure_fallback_matches_catalog(monkeypatch):
+    from_catalog, from_closure, missing = asyncio.run(_compare(monkeypatch))
+    assert from_closure == from_catalog
+    assert len(from_catalog[0]) == 4
+    assert from_catalog[1] == ['Еда', 'Колбасы', 'Молочная продукция', 'Мясная продукция']
+    assert from_catalog[2] == ['Автомобили', 'Еда']
+    # не корень первого уровня
+    assert missing == frozenset()
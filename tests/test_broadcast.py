@@ -0,0 +1,35 @@
+import json
+import uuid
+
+from src.api.broadcast import BUILDINGS_PER_MESSAGE, RELOAD_THRESHOLD, EventBroadcast
+from src.api.cache import response_cache
+
+
+def _broadcast():
+    broadcast = EventBroadcast('postgresql+asyncpg://localhost/test', 'test')
+    broadcast.events = []
+    broadcast.publish = broadcast.events.append
+    return broadcast
+
+
+def test_buildings_are_split_into_messages():
+    broadcast = _broadcast()
+    ids = [uuid.uuid4() for _ in range(BUILDINGS_PER_MESSAGE + 1)]
+    broadcast.buildings_changed(ids)
+    assert [len(event['ids']) for event in broadcast.events] == [BUILDINGS_PER_MESSAGE, 1]
+    assert all(len(json.dumps(event)) < 8000 for event in broadcast.events)
+
+    broadcast.events.clear()
+    broadcast.buildings_changed([uuid.uuid4() for _ in range(RELOAD_THRESHOLD + 1)])
+    assert broadcast.events == [{'kind': 'reload'}]
+
+
+def test_cache_invalidation_from_other_process_is_applied_without_propagation():
+    broadcast = _broadcast()
+    before = response_cache.invalidations
+    broadcast._on_notify(None, 0, 'test', json.dumps({'kind': 'cache', 'route': '/x', 'sender': broadcast.sender}))
+    assert response_cache.invalidations == before and broadcast.received == 0
+
+    broadcast._on_notify(None, 0, 'test', json.dumps({'kind': 'cache', 'route': '/x', 'sender': 'other'}))
+    assert response_cache.invalidations == before + 1 and broadcast.received == 1
+    assert broadcast.events == []
@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+from src.api.cache import CacheBackend, CacheEntry, LRUCache, ResponseCache
+
+
+def _entry(ttl: float = 60) -> CacheEntry:
+    return CacheEntry(body=b'{}', etag='"x"', media_type='application/json', expires_at=time.monotonic() + ttl)
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_lru_evicts_and_expires():
+    cache = LRUCache(2)
+    cache.set('a', _entry())
+    cache.set('b', _entry())
+    cache.get('a')
+    cache.set('c', _entry())
+    assert cache.get('b') is None and cache.get('a') is not None
+    cache.set('d', _entry(ttl=-1))
+    assert cache.get('d') is None
+    assert cache.stats()['evictions'] == 2 and cache.stats()['expirations'] == 1
+
+
+def test_invalidate_by_route_and_listeners():
+    cache = ResponseCache(LRUCache(10), ttl=60)
+    cache.backend.set('/a?x=1', _entry())
+    cache.backend.set('/ab?x=1', _entry())
+    calls = []
+    cache.on_invalidate(calls.append)
+    assert cache.invalidate('/a') == 1
+    assert cache.invalidate('', propagate=False) == 1
+    assert calls == ['/a']
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from src.api.scripts import (
+    HAVERSINE_BATCH_ATOL, HAVERSINE_BATCH_RTOL, haversine_m, haversine_m_batch, radius_top_k,
+)
+
+
+def _compare(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> None:
+    batch = haversine_m_batch(lat, lon, np.radians(lats), np.radians(lons))
+    scalar = np.array([haversine_m(lat, lon, a, b) for a, b in zip(lats, lons)])
+    np.testing.assert_allclose(batch, scalar, rtol=HAVERSINE_BATCH_RTOL, atol=HAVERSINE_BATCH_ATOL)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_matches_scalar_random_points(seed):
+    rng = np.random.default_rng(seed)
+    lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+    _compare(lat, lon, rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_matches_scalar_near_antipodal(seed):
+    rng = np.random.default_rng(seed)
+    lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+    lats = np.clip(-lat + rng.normal(0, 1e-3, 2000), -90, 90)
+    lons = (lon + 180 + rng.normal(0, 1e-3, 2000) + 180) % 360 - 180
+    _compare(lat, lon, lats, lons)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_batch_matches_scalar_short_distances(seed):
+    rng = np.random.default_rng(seed)
+    lat, lon = rng.uniform(-89, 89), rng.uniform(-180, 180)
+    _compare(lat, lon, lat + rng.normal(0, 1e-4, 2000), lon + rng.normal(0, 1e-4, 2000))
+
+
+def test_batch_exact_antipode_and_same_point():
+    batch = haversine_m_batch(10.0, 20.0, np.radians([10.0, -10.0]), np.radians([20.0, -160.0]))
+    assert batch[0] == 0.0
+    assert batch[1] == pytest.approx(haversine_m(10.0, 20.0, -10.0, -160.0), rel=HAVERSINE_BATCH_RTOL)
+
+
+def test_radius_top_k_orders_and_limits():
+    distances = np.array([50.0, 10.0, 300.0, 20.0, 10.0])
+    assert radius_top_k(distances, 100).tolist() == [1, 4, 3, 0]
+    assert sorted(radius_top_k(distances, 100, k=2).tolist()) == [1, 4]
+    assert radius_top_k(distances, 100, k=0).tolist() == []
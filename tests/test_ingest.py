@@ -0,0 +1,28 @@
+import uuid
+
+from fastapi.testclient import TestClient
+
+from src.api import admin
+from src.main import app
+
+
+def _organization(phones):
+    return {
+        'id': str(uuid.uuid4()),
+        'name': 'ООО Тест',
+        'building': {'id': str(uuid.uuid4()), 'address': 'Москва', 'latitude': 55.75, 'longitude': 37.61},
+        'phones': phones,
+    }
+
+
+def test_overlong_phone_is_rejected_before_any_batch(monkeypatch):
+    monkeypatch.setattr(admin, 'ADMIN_TOKEN', 'token')
+    client = TestClient(app)
+    payload = {'organizations': [_organization(['8-923-666-13-13']), _organization(['+7 (923) 666-13-13'])]}
+
+    response = client.post('/v1/secunda/organization/bulk', json=payload, headers={'X-Admin-Token': 'token'})
+
+    assert response.status_code == 422
+    errors = response.json()['detail']
+    assert [error['loc'] for error in errors] == [['body', 'organizations', 1, 'phones', 0]]
+    assert errors[0]['type'] == 'string_too_long'
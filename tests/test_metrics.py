@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import time
+
+from src.api.metrics import collect_metrics, merge_metrics
+
+WORKER = '''# HELP requests_total Запросов
+# TYPE requests_total counter
+requests_total{route="/a b"} 2
+# HELP wait_seconds Ожидание
+# TYPE wait_seconds histogram
+wait_seconds_bucket{le="0.1"} 1
+wait_seconds_bucket{le="+Inf"} 2
+wait_seconds_sum 0.25
+wait_seconds_count 2
+# HELP pool_size Размер пула
+# TYPE pool_size gauge
+pool_size 5
+'''
+
+
+def _samples(text: str) -> dict:
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+
+def test_merge_sums_series_and_skips_gauges_of_dead_processes():
+    merged = merge_metrics([(WORKER, True), (WORKER, False)])
+    assert _samples(merged) == {
+        'requests_total{route="/a b"}': '4',
+        'wait_seconds_bucket{le="0.1"}': '2',
+        'wait_seconds_bucket{le="+Inf"}': '4',
+        'wait_seconds_sum': '0.5',
+        'wait_seconds_count': '4',
+        'pool_size': '5',
+    }
+    assert merged.count('# TYPE requests_total counter') == 1
+
+
+def test_collect_keeps_counters_of_finished_processes(tmp_path):
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    (tmp_path / f'{finished.pid}-a1b2c3.prom').write_text(WORKER)
+    # файл прежнего процесса с тем же pid, что у текущего: pid достался новому процессу
+    reused = tmp_path / f'{os.getpid()}-d4e5f6.prom'
+    reused.write_text(WORKER)
+    os.utime(reused, (time.time() - 60, time.time() - 60))
+
+    merged = collect_metrics(str(tmp_path), write_interval=5)
+    own = [path for path in os.listdir(tmp_path) if path.startswith(f'{os.getpid()}-') and path != reused.name]
+    assert len(own) == 1 and reused.exists()
+    samples = _samples(merged)
+    assert samples['requests_total{route="/a b"}'] == '4'
+    assert 'pool_size' not in samples
+
+    # повторная запись идёт в тот же файл процесса, а не в новый
+    collect_metrics(str(tmp_path), write_interval=5)
+    assert len(os.listdir(tmp_path)) == 3
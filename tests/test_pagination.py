@@ -0,0 +1,40 @@
+import base64
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from src.api.pagination import (
+    decode_name_id_cursor, decode_score_id_cursor, encode_cursor, split_page,
+)
+
+
+def test_score_id_cursor_round_trip():
+    org_id = uuid.uuid4()
+    assert decode_score_id_cursor(encode_cursor([0.75, org_id])) == (0.75, org_id)
+    assert decode_score_id_cursor(None) is None
+
+
+@pytest.mark.parametrize('values', [['x', 'y'], [1, 'nope'], [True, str(uuid.uuid4())], ['0.5', str(uuid.uuid4())], [1]])
+def test_score_id_cursor_rejects_malformed(values):
+    with pytest.raises(HTTPException) as error:
+        decode_score_id_cursor(encode_cursor(values))
+    assert error.value.status_code == 400
+
+
+def test_score_id_cursor_rejects_non_finite_score():
+    # json допускает NaN/Infinity, encode_cursor их не выдаёт
+    cursor = base64.urlsafe_b64encode(f'[NaN,"{uuid.uuid4()}"]'.encode()).decode()
+    with pytest.raises(HTTPException):
+        decode_score_id_cursor(cursor)
+
+
+def test_name_id_cursor_rejects_garbage():
+    with pytest.raises(HTTPException):
+        decode_name_id_cursor('!!!')
+
+
+def test_split_page():
+    assert split_page([1, 2], 2, lambda r: [r]) == ([1, 2], None)
+    rows, cursor = split_page([1, 2, 3], 2, lambda r: [r])
+    assert rows == [1, 2] and cursor == encode_cursor([2])
@@ -0,0 +1,70 @@
+'''
+Планы запросов API (src/scripts/check_query_plans.py) как тест. Нужен
+Postgres с миграциями и данными реального размера:
+
+    alembic upgrade head
+    python src/scripts/bulk_load.py --organizations 100000 --truncate
+    QUERY_PLANS_REQUIRED=1 python -m pytest -q tests/test_query_plans.py
+
+Без Postgres в DATABASE_URL, на пустой или слишком маленькой БД тест
+пропускается, а с QUERY_PLANS_REQUIRED=1 (в CI) — падает.
+'''
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from config import env_bool
+
+REQUIRED = env_bool('QUERY_PLANS_REQUIRED', False)
+
+
+def _unavailable(reason: str) -> None:
+    if REQUIRED:
+        pytest.fail(reason)
+    pytest.skip(reason)
+
+
+@pytest.fixture(scope='module')
+def plans():
+    url = os.environ.get('DATABASE_URL')
+    if not url or make_url(url).get_backend_name() != 'postgresql':
+        _unavailable('DATABASE_URL не указывает на Postgres')
+    # модуль при импорте создаёт движки из DATABASE_URL
+    from src.scripts import check_query_plans
+
+    try:
+        checks, rows, trgm = asyncio.run(check_query_plans.run_checks())
+    except (OSError, OperationalError, check_query_plans.EmptyDatabase) as er:
+        _unavailable(f'нет БД с данными для проверки планов: {er}'.splitlines()[0])
+    return check_query_plans, checks, rows, trgm
+
+
+def _failures(module, checks, mode):
+    return [
+        f'{check.label}: {", ".join(check.problems)}\n' + '\n'.join(module.plan_summary(check.plan))
+        for check in checks if check.mode == mode and check.problems
+    ]
+
+
+def test_forced_plans_use_indexes(plans):
+    module, checks, _, _ = plans
+    assert any(check.mode == 'forced' for check in checks)
+    failures = _failures(module, checks, 'forced')
+    assert not failures, '\n\n'.join(failures)
+
+
+def test_planner_plans_use_indexes(plans):
+    module, checks, rows, _ = plans
+    if rows < module.MIN_ROWS:
+        _unavailable(f'в organizations {rows} строк, для планов по умолчанию нужно {module.MIN_ROWS}')
+    failures = _failures(module, checks, 'planner')
+    assert not failures, '\n\n'.join(failures)
+
+
+def test_search_plans_checked(plans):
+    _, _, _, trgm = plans
+    if not trgm:
+        _unavailable('нет расширения pg_trgm: планы поиска по названию не проверены')
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.api.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_identical_calls_are_coalesced():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {'value': value}
+
+    async def main():
+        return await asyncio.gather(*(flight.do(('k', 1), fetch, 1) for _ in range(10)), flight.do(('k', 2), fetch, 2))
+
+    results = asyncio.run(main())
+    assert calls == [1, 2]
+    assert results[:10] == [{'value': 1}] * 10 and results[10] == {'value': 2}
+    assert all(result is results[0] for result in results[:10])
+    assert flight.stats() == {'in_flight': 0, 'executions': 2, 'coalesced': 9}
+
+
+def test_exception_reaches_every_waiter():
+    flight = AsyncSingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        return await asyncio.gather(*(flight.do('k', fail) for _ in range(5)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert len(errors) == 5 and all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats()['executions'] == 1 and flight.stats()['in_flight'] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_execution():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        first = asyncio.ensure_future(flight.do('k', fetch))
+        second = asyncio.ensure_future(flight.do('k', fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 'done'
+
+
+def test_key_is_released_after_completion():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flight.do('k', fetch), await flight.do('k', fetch)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def _in_threads(flight: SingleFlight, fn, release: threading.Event, count: int):
+    '''
+    count потоков одновременно вызывают flight.do('k', fn); fn ждёт release,
+    который выставляется, когда остальные вызовы присоединились к первому.
+    Возвращает результаты или исключения вызовов.
+    '''
+    def call():
+        try:
+            return flight.do('k', fn)
+        except Exception as er:
+            return er
+
+    with ThreadPoolExecutor(count) as pool:
+        futures = [pool.submit(call) for _ in range(count)]
+        deadline = time.monotonic() + 5
+        while flight.coalesced < count - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        release.set()
+        return [future.result() for future in futures]
+
+
+def test_sync_concurrent_identical_calls_are_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(threading.get_ident())
+        release.wait(5)
+        return {'value': 1}
+
+    results = _in_threads(flight, fetch, release, 8)
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results) and results[0] == {'value': 1}
+    assert flight.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 7}
+    assert flight.do('k', lambda: 'again') == 'again'
+
+
+def test_sync_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('boom')
+
+    errors = _in_threads(flight, fail, release, 5)
+    assert len(errors) == 5 and all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 4}
@@ -0,0 +1,27 @@
+from slow_query_log import SlowQueryLog, analyzable
+
+
+def test_only_plain_select_is_analyzed():
+    assert analyzable('  select id from organizations')
+    assert not analyzable('WITH moved AS (DELETE FROM buildings RETURNING id) SELECT count(*) FROM moved')
+    assert not analyzable('WITH t AS (SELECT 1) SELECT * FROM t')
+    assert not analyzable('UPDATE buildings SET address = $1')
+
+
+def test_record_redacts_parameters_and_keeps_settings():
+    log = SlowQueryLog(threshold_ms=1, size=2, redact=True, explain_rate=0, explain_timeout_ms=1000)
+    entry = log.record('SELECT 1', ('secret', [1, 2, 3]), 5.0, settings={'pg_trgm.word_similarity_threshold': '0.3'})
+    assert entry['parameters'] == ['<str>', '<list[3]>']
+    assert entry['settings'] == {'pg_trgm.word_similarity_threshold': '0.3'}
+    log.record('SELECT 2', (), 5.0)
+    log.record('SELECT 3', (), 5.0)
+    assert [e['statement'] for e in log.snapshot(10)['entries']] == ['SELECT 3', 'SELECT 2']
+
+
+def test_remember_only_transaction_local_settings():
+    class Conn:
+        info = {}
+
+    SlowQueryLog._remember_setting(Conn, ('statement_timeout', '100', False))
+    SlowQueryLog._remember_setting(Conn, {'p1': 'pg_trgm.word_similarity_threshold', 'p2': '0.3', 'p3': True})
+    assert Conn.info == {'slow_query_log_settings': {'pg_trgm.word_similarity_threshold': '0.3'}}
@@ -0,0 +1,89 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from src.api import snapshot
+from src.api.activity_catalog import ActivityCatalog
+from src.api.spatial_index import BUILDINGS_VERSION, SpatialIndex
+from src.models.models import ActivitiesModels, BuildingsModel, CatalogVersionsModels
+
+KREMLIN = uuid.uuid4()
+ARBAT = uuid.uuid4()
+HERMITAGE = uuid.uuid4()
+
+
+def _building(id_, lat, lon):
+    return {'id': id_, 'address': str(id_), 'latitude_longitude': f'{lat},{lon}', 'latitude': lat, 'longitude': lon}
+
+
+def _bump(conn):
+    # в Postgres версию увеличивает триггер на buildings
+    conn.execute(
+        update(CatalogVersionsModels)
+        .where(CatalogVersionsModels.name == BUILDINGS_VERSION)
+        .values(version=CatalogVersionsModels.version + 1)
+    )
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / 'secunda.db'
+    engine = create_engine(f'sqlite:///{path}')
+    BuildingsModel.metadata.create_all(engine, tables=[
+        BuildingsModel.__table__, ActivitiesModels.__table__, CatalogVersionsModels.__table__,
+    ])
+    with engine.begin() as conn:
+        conn.execute(insert(CatalogVersionsModels), [
+            {'name': BUILDINGS_VERSION, 'version': 0}, {'name': 'activities', 'version': 0},
+        ])
+        conn.execute(insert(BuildingsModel), [_building(KREMLIN, 55.7520, 37.6175), _building(ARBAT, 55.7494, 37.5912)])
+    monkeypatch.setattr(database, 'session_maker', sessionmaker(engine), raising=False)
+    monkeypatch.setattr(snapshot, 'spatial_index', SpatialIndex())
+    monkeypatch.setattr(snapshot, 'activity_catalog', ActivityCatalog())
+    yield engine, f'sqlite+aiosqlite:///{path}'
+    engine.dispose()
+
+
+async def _ensure_fresh(index, url):
+    engine = create_async_engine(url)
+    async with async_sessionmaker(engine)() as session:
+        rebuilt = await index.ensure_fresh(session)
+    await engine.dispose()
+    return rebuilt
+
+
+def test_stale_snapshot_catches_up_with_db(db, tmp_path):
+    engine, async_url = db
+    directory = str(tmp_path / 'snapshot')
+    snapshot.build_snapshot(directory)
+    with engine.begin() as conn:
+        conn.execute(update(BuildingsModel).where(BuildingsModel.id == ARBAT).values(latitude=55.7600, longitude=37.6000))
+        conn.execute(insert(BuildingsModel), [_building(HERMITAGE, 59.9398, 30.3146)])
+        _bump(conn)
+    assert not snapshot.snapshot_is_current(snapshot.read_meta(directory))
+
+    assert snapshot.load_snapshot(directory)
+    index = snapshot.spatial_index
+    assert index.get(ARBAT) == (55.7494, 37.5912)
+    assert index.get(HERMITAGE) is None
+
+    assert asyncio.run(_ensure_fresh(index, async_url))
+    assert index.get(ARBAT) == (55.7600, 37.6000)
+    assert index.get(HERMITAGE) == (59.9398, 30.3146)
+    assert index.get(KREMLIN) == (55.7520, 37.6175)
+
+
+def test_current_snapshot_is_kept(db, tmp_path):
+    engine, async_url = db
+    directory = str(tmp_path / 'snapshot')
+    snapshot.build_snapshot(directory)
+    assert snapshot.snapshot_is_current(snapshot.read_meta(directory))
+
+    assert snapshot.load_snapshot(directory)
+    assert not asyncio.run(_ensure_fresh(snapshot.spatial_index, async_url))
+    assert snapshot.spatial_index.get(KREMLIN) == (55.7520, 37.6175)